@@ -3,6 +3,8 @@ import os
 from django.core.management.base import BaseCommand
 from django.conf import settings
 from exercises.models import Exercise, MuscleGroup
+from routines.tasks import refresh_vectors_for_exercises
+from workouts.tasks import rebuild_rollups_for_exercises
 
 
 class Command(BaseCommand):
@@ -62,6 +64,11 @@ class Command(BaseCommand):
             defaults=exercise_defaults
         )
 
+        # Rollups and routine vectors are bucketed by muscle (and equipment) and rebuilt afterwards
+        previous = self._classification.get(slug)
+        if previous is not None and previous != (exercise.muscle, exercise.equipment):
+            self._reclassified.append(exercise.id)
+
         # Add muscle group relationship
         exercise.muscle_groups.add(muscle_group)
 
@@ -93,6 +100,11 @@ class Command(BaseCommand):
             created_count = 0
             updated_count = 0
             skipped_count = 0
+            self._classification = {
+                slug: (muscle, equipment)
+                for slug, muscle, equipment in Exercise.objects.values_list('slug', 'muscle', 'equipment')
+            }
+            self._reclassified = []
 
             for exercise_data in exercises_data:
                 try:
@@ -116,6 +128,13 @@ class Command(BaseCommand):
                     skipped_count += 1
                     continue
 
+            if self._reclassified:
+                rebuild_rollups_for_exercises.enqueue(exercise_ids=self._reclassified)
+                refresh_vectors_for_exercises.enqueue(exercise_ids=self._reclassified)
+                self.stdout.write(
+                    f'Queued rollup and routine vector rebuilds for {len(self._reclassified)} reclassified exercises'
+                )
+
             self.stdout.write(self.style.SUCCESS(
                 f'\nCompleted! Created: {created_count}, Updated: {updated_count}, Skipped: {skipped_count}'
             ))
@@ -1,8 +1,18 @@
+import json
+import os
+import tempfile
+from io import StringIO
+
+from django.core.management import call_command
 from django.test import TestCase, Client
 from django.urls import reverse
 from django.contrib.auth.models import User
 from exercises.models import Exercise, MuscleGroup
-from routines.models import Routine
+from routines.models import Routine, RoutineExercise, RoutineVector
+from routines.similarity import refresh_routine_vectors
+from taskqueue.models import Task
+from taskqueue.worker import run_pending
+from workouts.models import WeeklyMuscleRollup, WorkoutSession, WorkoutSet
 
 
 class ExerciseModelTests(TestCase):
@@ -422,3 +432,44 @@ class ExerciseDetailFromRoutineTests(TestCase):
 
 # Note: exercise_search view tests removed because template doesn't exist
 # The view exists but is not currently used in the application
+
+
+class LoadExercisesCommandTests(TestCase):
+    """Test reloading the exercise catalog"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpass123!@#')
+        self.routine = Routine.objects.create(name='Test Routine', user=self.user, is_public=True)
+        self.squat = Exercise.objects.create(title='Squat', slug='squat', muscle='quads', equipment='barbell')
+        RoutineExercise.objects.create(routine=self.routine, exercise=self.squat, sets_count=3, order=0)
+
+    def _load(self, exercises):
+        with tempfile.NamedTemporaryFile('w', suffix='.json', delete=False) as f:
+            json.dump({'exercises': exercises}, f)
+        self.addCleanup(os.remove, f.name)
+        call_command('load_exercises', '--file', f.name, stdout=StringIO())
+
+    def test_reclassified_exercises_queue_rebuilds(self):
+        """Test a changed muscle queues rollup and routine vector rebuilds that the worker applies"""
+        session = WorkoutSession.objects.create(routine=self.routine, user=self.user)
+        WorkoutSet.objects.create(session=session, exercise=self.squat, set_number=1, weight=100, reps=5)
+        refresh_routine_vectors()
+        version = RoutineVector.objects.get().version
+
+        self._load([
+            {'title': 'Squat', 'slug': 'squat', 'muscle': 'glutes', 'equipment': 'barbell'},
+            {'title': 'Curl', 'slug': 'curl', 'muscle': 'biceps', 'equipment': 'dumbbells'},
+        ])
+        self.assertEqual(Task.objects.count(), 2)
+        run_pending()
+
+        self.assertEqual(list(WeeklyMuscleRollup.objects.values_list('muscle', flat=True)), ['glutes'])
+        self.assertGreater(RoutineVector.objects.get().version, version)
+        # The rollup rebuild fanned out into a task per chunk of users
+        self.assertTrue(Task.objects.filter(name='workouts.tasks.rebuild_user_chunk_rollups', status='done').exists())
+
+    def test_unchanged_catalog_queues_nothing(self):
+        """Test reloading without classification changes queues no rebuilds"""
+        self._load([{'title': 'Squat', 'slug': 'squat', 'muscle': 'quads', 'equipment': 'barbell'}])
+
+        self.assertFalse(Task.objects.exists())
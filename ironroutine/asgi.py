@@ -3,6 +3,11 @@ ASGI config for ironroutine project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+Serve the project through this module (e.g. ``uvicorn ironroutine.asgi:application``)
+to use the live workout session events at /workouts/session/<id>/events/: each
+open Server-Sent Events stream then waits on the event loop rather than holding
+a worker thread, as it would under WSGI.
+
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
 """
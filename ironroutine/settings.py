@@ -43,6 +43,7 @@ INSTALLED_APPS = [
     'exercises',
     'routines',
     'workouts',
+    'taskqueue',
 ]
 
 MIDDLEWARE = [
@@ -86,6 +87,53 @@ DATABASES = {
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+# Workout session state is written through to the cache, and routine summaries
+# and analytics are invalidated in it, so every process must share one cache.
+# Set REDIS_URL whenever more than one process serves requests; the
+# process-local fallback is only for runserver and tests (see `check --deploy`).
+
+REDIS_URL = os.environ.get('REDIS_URL')
+
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'ironroutine',
+        }
+    }
+
+
+# Live workout session events
+# The in-process broker only reaches devices connected to the same worker process;
+# point this at a shared (e.g. Redis pub/sub) broker when running several workers,
+# just as the cache above must be shared.
+
+WORKOUT_EVENTS_BROKER = 'workouts.events.InProcessBroker'
+
+
+# Workout archive
+# archive_workout_sessions packs the sets of sessions completed more than this
+# many days ago into one compact row per session.
+
+WORKOUT_ARCHIVE_AFTER_DAYS = 180
+
+
+# Background tasks
+# Deferred work is queued in the database and run by `manage.py run_tasks`.
+# Set TASKS_RUN_EAGERLY to run it in-process after each commit instead.
+
+TASKS_RUN_EAGERLY = False
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -1,5 +1,6 @@
 from django.contrib import admin
 from .models import Routine, RoutineExercise
+from .summaries import routine_exercises_changed
 
 
 class RoutineExerciseInline(admin.TabularInline):
@@ -10,18 +11,30 @@ class RoutineExerciseInline(admin.TabularInline):
 
 @admin.register(Routine)
 class RoutineAdmin(admin.ModelAdmin):
-    list_display = ['name', 'user', 'get_total_exercises', 'is_active', 'created_at']
+    list_display = ['name', 'user', 'get_total_exercises', 'is_active', 'popularity_score', 'created_at']
     list_filter = ['is_active', 'created_at', 'user']
     search_fields = ['name', 'description', 'user__username']
-    readonly_fields = ['created_at', 'updated_at']
+    readonly_fields = ['created_at', 'updated_at', 'copy_count', 'start_count', 'popularity_score',
+                       'source', 'shares_exercises']
     inlines = [RoutineExerciseInline]
     
     fieldsets = (
         ('Basic Information', {
             'fields': ('name', 'user', 'description', 'is_active')
         }),
+        ('Popularity', {
+            'fields': ('copy_count', 'start_count', 'popularity_score'),
+            'classes': ('collapse',)
+        }),
         ('Metadata', {
-            'fields': ('created_at', 'updated_at'),
+            'fields': ('source', 'shares_exercises', 'created_at', 'updated_at'),
             'classes': ('collapse',)
         }),
     )
+
+    def save_related(self, request, form, formsets, change):
+        # Copy-on-write: inline edits must not leak into (or read from) shared copies
+        if change:
+            form.instance.prepare_exercise_edit()
+        super().save_related(request, form, formsets, change)
+        routine_exercises_changed(form.instance)
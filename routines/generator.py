@@ -0,0 +1,260 @@
+"""
+Routine generation: split/category definitions, candidate pools and batch programs.
+
+Matching exercises are loaded once, in a single query, and bucketed by
+(muscle, equipment). Draws pick a random bucket weighted by its size and
+swap-remove a random member, so sampling without replacement is O(1) per
+exercise and never touches the database again.
+"""
+import random
+import time
+from collections import defaultdict
+
+from django.db import transaction
+
+from exercises.models import Exercise
+from .models import Routine, RoutineExercise, ORDER_GAP
+from .summaries import invalidate_user_routines
+
+MIXED_EQUIPMENT = ['dumbbells', 'barbell', 'bodyweight', 'machine', 'kettlebells']
+
+
+def expand_equipment(equipment):
+    """Normalize a single equipment value or list into a list, expanding 'mixed'"""
+    if isinstance(equipment, (list, tuple)):
+        return list(MIXED_EQUIPMENT) if 'mixed' in equipment else list(equipment)
+    if equipment == 'mixed':
+        return list(MIXED_EQUIPMENT)
+    return [equipment]
+
+
+def get_special_splits():
+    """Get special workout split configurations"""
+    return {
+        '3_day_split': {
+            'name': '3-Day Full Body Split',
+            'description': 'Creates 3 complementary routines for a complete weekly program (15 exercises total)',
+            'routines': [
+                {
+                    'name': 'Upper Body Push',
+                    'muscles': ['chest', 'shoulders', 'triceps', 'anterior-deltoid', 'upper-trapezius'],
+                    'description': 'Day 1: Chest, shoulders, and triceps'
+                },
+                {
+                    'name': 'Back & Biceps Pull',
+                    'muscles': ['lats', 'traps', 'biceps', 'rear-shoulders', 'forearms'],
+                    'description': 'Day 2: Back, biceps, and rear delts'
+                },
+                {
+                    'name': 'Legs & Core',
+                    'muscles': ['quads', 'hamstrings', 'glutes', 'calves', 'abdominals'],
+                    'description': 'Day 3: Full legs and core strengthening'
+                }
+            ]
+        }
+    }
+
+
+def get_muscle_group_categories():
+    """Get muscle group category definitions"""
+    return {
+        'arms': {
+            'name': 'Arms',
+            'muscles': ['biceps', 'triceps', 'forearms', 'shoulders'],
+            'description': 'Complete arm workout targeting biceps, triceps, forearms, and shoulders'
+        },
+        'legs': {
+            'name': 'Legs',
+            'muscles': ['quads', 'hamstrings', 'calves', 'glutes'],
+            'description': 'Full leg workout targeting quads, hamstrings, calves, and glutes'
+        },
+        'back': {
+            'name': 'Back',
+            'muscles': ['lats', 'traps', 'lowerback', 'rear-shoulders'],
+            'description': 'Complete back workout targeting lats, traps, lower back, and rear delts'
+        },
+        'chest': {
+            'name': 'Chest',
+            'muscles': ['chest', 'anterior-deltoid', 'triceps'],
+            'description': 'Chest-focused workout targeting pecs, front delts, and triceps'
+        },
+        'core': {
+            'name': 'Core',
+            'muscles': ['abdominals', 'obliques', 'lower-abdominals', 'lowerback'],
+            'description': 'Core strengthening targeting abs, obliques, and lower back'
+        },
+        'upper_body': {
+            'name': 'Upper Body',
+            'muscles': ['chest', 'lats', 'shoulders', 'biceps', 'triceps'],
+            'description': 'Complete upper body workout targeting chest, back, and arms'
+        },
+        'full_body': {
+            'name': 'Full Body',
+            'muscles': ['chest', 'lats', 'shoulders', 'biceps', 'triceps', 'quads', 'hamstrings', 'abdominals'],
+            'description': 'Complete full body workout hitting all major muscle groups'
+        },
+        'yoga_flow': {
+            'name': 'Yoga Flow',
+            'muscles': ['abdominals', 'lowerback', 'shoulders', 'hamstrings', 'calves', 'hips'],
+            'description': 'Flexibility and strength flow targeting core, back, and mobility',
+            'equipment_override': 'bodyweight'
+        },
+        'bodyweight_blast': {
+            'name': 'Bodyweight Blast',
+            'muscles': ['chest', 'shoulders', 'triceps', 'abdominals', 'quads', 'glutes'],
+            'description': 'High-intensity bodyweight workout requiring no equipment',
+            'equipment_override': 'bodyweight'
+        }
+    }
+
+
+class CandidatePool:
+    """Exercises bucketed by (muscle, equipment), sampled without replacement"""
+
+    def __init__(self, exercises=()):
+        self._buckets = defaultdict(list)
+        for exercise in exercises:
+            self._buckets[(exercise.muscle, exercise.equipment)].append(exercise)
+
+    @classmethod
+    def load(cls, muscles, equipment_list):
+        """Load every exercise matching any of the muscles and equipment in one query"""
+        exercises = Exercise.objects.filter(
+            muscle__in=list(muscles),
+            equipment__in=list(equipment_list)
+        ).order_by()
+        return cls(exercises)
+
+    def restore(self, exercises):
+        """Put drawn exercises back, so one pool can be reused for the next program week"""
+        for exercise in exercises:
+            self._buckets[(exercise.muscle, exercise.equipment)].append(exercise)
+
+    def __len__(self):
+        return sum(len(bucket) for bucket in self._buckets.values())
+
+    def draw(self, muscles, equipment_list):
+        """
+        Remove and return a random exercise for any of the muscles and equipment.
+
+        Every remaining candidate is equally likely. Returns None once the
+        matching buckets are exhausted.
+        """
+        buckets = [
+            self._buckets[(muscle, equipment)]
+            for muscle in muscles
+            for equipment in equipment_list
+            if self._buckets.get((muscle, equipment))
+        ]
+        total = sum(len(bucket) for bucket in buckets)
+        if not total:
+            return None
+
+        index = random.randrange(total)
+        for bucket in buckets:
+            if index < len(bucket):
+                # Swap-remove keeps the removal O(1)
+                bucket[index], bucket[-1] = bucket[-1], bucket[index]
+                return bucket.pop()
+            index -= len(bucket)
+        return None
+
+
+def select_exercises(pool, target_muscles, equipment_list, max_exercises=5):
+    """Pick one exercise per target muscle, then fill remaining slots from any target muscle"""
+    selected_exercises = []
+
+    for muscle in target_muscles:
+        if len(selected_exercises) >= max_exercises:
+            break
+        exercise = pool.draw([muscle], equipment_list)
+        if exercise is not None:
+            selected_exercises.append(exercise)
+
+    while len(selected_exercises) < max_exercises:
+        exercise = pool.draw(target_muscles, equipment_list)
+        if exercise is None:
+            break
+        selected_exercises.append(exercise)
+
+    return selected_exercises
+
+
+def resolve_program_days(split=None, categories=None):
+    """
+    Return the day definitions (name, muscles, description) for a program.
+
+    Either a special split key (e.g. '3_day_split') or a list of muscle group
+    category keys, one per training day. Raises ValueError for unknown keys.
+    """
+    if split:
+        special_splits = get_special_splits()
+        if split not in special_splits:
+            raise ValueError(f'Unknown split: {split}')
+        return special_splits[split]['routines']
+
+    muscle_group_categories = get_muscle_group_categories()
+    unknown = [category for category in categories or [] if category not in muscle_group_categories]
+    if unknown or not categories:
+        raise ValueError(f"Unknown categories: {', '.join(unknown)}" if unknown else 'No program days given')
+    return [muscle_group_categories[category] for category in categories]
+
+
+def generate_programs(users, days, equipment, weeks=1, program_name='Program',
+                      exercises_per_day=5, sets_per_exercise=3, rest_time=60):
+    """
+    Generate an N-week program for every user in one transaction.
+
+    A single candidate pool serves the whole batch: exercises drawn for one
+    week are not repeated across that week's days, then restored for the
+    next week. All Routine and RoutineExercise rows are written with
+    bulk_create. Returns a summary dict including throughput.
+    """
+    started = time.perf_counter()
+    equipment_list = expand_equipment(equipment)
+    pool = CandidatePool.load({muscle for day in days for muscle in day['muscles']}, equipment_list)
+
+    new_routines = []
+    selections = []
+    for user in users:
+        for week in range(1, weeks + 1):
+            drawn = []
+            for day in days:
+                selected_exercises = select_exercises(pool, day['muscles'], equipment_list, exercises_per_day)
+                if not selected_exercises:
+                    continue
+                drawn.extend(selected_exercises)
+                new_routines.append(Routine(
+                    name=f"{program_name} - Week {week} - {day['name']}",
+                    user=user,
+                    description=f"{day['description']} - Week {week} of {weeks}",
+                    is_public=False
+                ))
+                selections.append(selected_exercises)
+            pool.restore(drawn)
+
+    with transaction.atomic():
+        Routine.objects.bulk_create(new_routines, batch_size=500)
+        new_routine_exercises = [
+            RoutineExercise(
+                routine=routine,
+                exercise=exercise,
+                sets_count=sets_per_exercise,
+                rest_time_seconds=rest_time,
+                order=(i + 1) * ORDER_GAP
+            )
+            for routine, selected_exercises in zip(new_routines, selections)
+            for i, exercise in enumerate(selected_exercises)
+        ]
+        RoutineExercise.objects.bulk_create(new_routine_exercises, batch_size=1000)
+        invalidate_user_routines(*(user.id for user in users))
+
+    elapsed = time.perf_counter() - started
+    return {
+        'users': len(users),
+        'routines_created': len(new_routines),
+        'exercises_created': len(new_routine_exercises),
+        'routine_ids': [routine.id for routine in new_routines],
+        'elapsed_seconds': round(elapsed, 3),
+        'routines_per_second': round(len(new_routines) / elapsed, 1) if elapsed else None,
+    }
@@ -0,0 +1,45 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+from routines.models import Routine
+from routines.transfer import export_routines, FORMATS, DEFAULT_CHUNK_SIZE
+
+
+class Command(BaseCommand):
+    help = 'Stream routines and their exercises to NDJSON or CSV'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', '-o', type=str, default='-', help='Output file (default: stdout)')
+        parser.add_argument('--format', choices=FORMATS, default=None,
+                            help='Output format (default: from the file extension, else ndjson)')
+        parser.add_argument('--user', nargs='+', default=None, help='Only export routines of these usernames')
+        parser.add_argument('--public', action='store_true', help='Only export public routines')
+        parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE,
+                            help=f'Routines fetched per database round trip (default: {DEFAULT_CHUNK_SIZE})')
+
+    def handle(self, *args, **options):
+        output = options['output']
+        fmt = options['format'] or ('csv' if output.endswith('.csv') else 'ndjson')
+
+        routines = Routine.objects.filter(is_active=True)
+        if options['user']:
+            routines = routines.filter(user__username__in=options['user'])
+        if options['public']:
+            routines = routines.filter(is_public=True)
+
+        try:
+            stream = open(output, 'w', newline='', encoding='utf-8') if output != '-' else sys.stdout
+        except OSError as e:
+            raise CommandError(f'Cannot open {output}: {e}')
+
+        lines = 0
+        try:
+            for line in export_routines(routines, fmt, options['chunk_size']):
+                stream.write(line)
+                lines += 1
+        finally:
+            if stream is not sys.stdout:
+                stream.close()
+
+        if output != '-':
+            self.stdout.write(self.style.SUCCESS(f'Wrote {lines} {fmt} lines to {output}'))
@@ -0,0 +1,62 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from routines.generator import generate_programs, resolve_program_days
+
+
+class Command(BaseCommand):
+    help = 'Generate multi-week programs for many users in one batch'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'usernames',
+            nargs='*',
+            help='Usernames to generate programs for'
+        )
+        parser.add_argument('--all', action='store_true', help='Generate for every active user')
+        parser.add_argument('--weeks', type=int, default=4, help='Number of program weeks (default: 4)')
+        parser.add_argument('--split', type=str, default=None, help='Special split key, e.g. 3_day_split')
+        parser.add_argument(
+            '--categories',
+            nargs='+',
+            default=None,
+            help='Muscle group categories, one per training day (used when --split is not given)'
+        )
+        parser.add_argument('--equipment', nargs='+', default=['mixed'], help='Equipment types (default: mixed)')
+        parser.add_argument('--name', type=str, default='Program', help='Base name for the generated routines')
+        parser.add_argument('--exercises-per-day', type=int, default=5)
+        parser.add_argument('--sets', type=int, default=3)
+        parser.add_argument('--rest', type=int, default=60)
+
+    def handle(self, *args, **options):
+        if options['all']:
+            users = list(User.objects.filter(is_active=True))
+        else:
+            users = list(User.objects.filter(username__in=options['usernames']))
+            missing = sorted(set(options['usernames']) - {user.username for user in users})
+            if missing:
+                raise CommandError(f"Unknown users: {', '.join(missing)}")
+
+        if not users:
+            raise CommandError('No users given (pass usernames or --all)')
+
+        # Default to the 3-day split unless explicit categories are given
+        split = options['split'] or (None if options['categories'] else '3_day_split')
+        try:
+            days = resolve_program_days(split, options['categories'])
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        summary = generate_programs(
+            users, days, options['equipment'],
+            weeks=options['weeks'],
+            program_name=options['name'],
+            exercises_per_day=options['exercises_per_day'],
+            sets_per_exercise=options['sets'],
+            rest_time=options['rest'],
+        )
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Generated {summary['routines_created']} routines ({summary['exercises_created']} exercises) "
+            f"for {summary['users']} users in {summary['elapsed_seconds']}s "
+            f"({summary['routines_per_second']} routines/s)"
+        ))
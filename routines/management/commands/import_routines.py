@@ -0,0 +1,42 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from routines.transfer import import_routines, parse_routine_records, FORMATS, DEFAULT_CHUNK_SIZE
+
+
+class Command(BaseCommand):
+    help = 'Stream routines and their exercises in from NDJSON or CSV, resolving exercises by slug'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', type=str, help='NDJSON or CSV file to import')
+        parser.add_argument('--format', choices=FORMATS, default=None,
+                            help='Input format (default: from the file extension, else ndjson)')
+        parser.add_argument('--user', type=str, default=None,
+                            help='Assign every routine to this username instead of the one in the file')
+        parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE,
+                            help=f'Routines written per transaction (default: {DEFAULT_CHUNK_SIZE})')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = options['format'] or ('csv' if path.endswith('.csv') else 'ndjson')
+
+        user = None
+        if options['user']:
+            user = User.objects.filter(username=options['user']).first()
+            if user is None:
+                raise CommandError(f"Unknown user: {options['user']}")
+
+        try:
+            with open(path, newline='', encoding='utf-8') as stream:
+                summary = import_routines(parse_routine_records(stream, fmt), user, options['chunk_size'])
+        except OSError as e:
+            raise CommandError(f'Cannot open {path}: {e}')
+
+        for error in summary['errors']:
+            self.stderr.write(f"Routine {error['key']}: {error['error']}")
+        if 'read_error' in summary:
+            self.stderr.write(f"{summary['read_error']}; the rest of the file was not imported")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {summary['routines_created']} routines ({summary['exercises_created']} exercises), "
+            f"{summary['error_count']} problems"
+        ))
@@ -0,0 +1,65 @@
+from itertools import groupby
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from routines.models import Routine, RoutineExercise, ORDER_GAP
+from routines.summaries import routine_exercises_changed
+
+
+def _needs_rebalance(keys, min_gap):
+    return not all(b - a >= min_gap for a, b in zip([0] + keys, keys))
+
+
+class Command(BaseCommand):
+    help = 'Respace RoutineExercise order keys in routines whose gaps have become too small'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--min-gap',
+            type=int,
+            default=ORDER_GAP // 64,
+            help=f'Respace a routine when two neighbouring keys are closer than this (default: {ORDER_GAP // 64})'
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=2000,
+            help='Rows fetched per database round trip (default: 2000)'
+        )
+
+    def handle(self, *args, **options):
+        min_gap = options['min_gap']
+        rows = (
+            RoutineExercise.objects.order_by('routine_id', 'order')
+            .only('id', 'routine_id', 'order')
+            .iterator(chunk_size=options['chunk_size'])
+        )
+
+        # Find crowded routines with a streaming scan, then respace each one under its row lock
+        candidates = [
+            routine_id for routine_id, routine_rows in groupby(rows, key=lambda re: re.routine_id)
+            if _needs_rebalance([re.order for re in routine_rows], min_gap)
+        ]
+
+        routines_rebalanced = 0
+        rows_updated = 0
+        for routine_id in candidates:
+            with transaction.atomic():
+                # The same lock move_routine_exercise and bulk_edit_routine_exercises take
+                routine = Routine.objects.select_for_update().filter(pk=routine_id).first()
+                if routine is None:
+                    continue
+                routine_rows = list(routine.routine_exercises.order_by('order').only('id', 'order'))
+                if not _needs_rebalance([re.order for re in routine_rows], min_gap):
+                    continue  # Edited since the scan
+
+                for i, re in enumerate(routine_rows):
+                    re.order = ORDER_GAP * (i + 1)
+                RoutineExercise.objects.bulk_update(routine_rows, ['order'])
+                routine_exercises_changed(routine)
+            routines_rebalanced += 1
+            rows_updated += len(routine_rows)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Rebalanced {routines_rebalanced} routines ({rows_updated} rows)'
+        ))
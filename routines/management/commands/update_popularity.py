@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from routines.popularity import prune_activity, recompute_popularity, TRENDING_SIZE
+
+
+class Command(BaseCommand):
+    help = 'Recompute time-decayed routine popularity scores and refresh the cached trending list'
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+        scored_count = recompute_popularity(now)
+        pruned_count = prune_activity(now)
+        self.stdout.write(self.style.SUCCESS(
+            f'Updated popularity for {scored_count} routines (trending list: top {TRENDING_SIZE}), '
+            f'pruned {pruned_count} old activity rows'
+        ))
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from routines.similarity import refresh_routine_vectors, REFRESH_CHUNK_SIZE
+
+
+class Command(BaseCommand):
+    help = 'Rebuild similar-routine vectors for public routines that changed since their last build'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true', help='Rebuild every vector, not just stale ones')
+        parser.add_argument('--chunk-size', type=int, default=REFRESH_CHUNK_SIZE,
+                            help=f'Routines encoded per batch (default: {REFRESH_CHUNK_SIZE})')
+
+    def handle(self, *args, **options):
+        written, deleted = refresh_routine_vectors(full=options['full'], chunk_size=options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Wrote {written} routine vectors, removed {deleted}'
+        ))
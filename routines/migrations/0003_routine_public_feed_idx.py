@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-18 21:15
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('routines', '0002_routine_is_public'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='routine',
+            index=models.Index(fields=['is_public', 'is_active', '-created_at', '-id'], name='routine_public_feed_idx'),
+        ),
+    ]
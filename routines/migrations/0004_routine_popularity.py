@@ -0,0 +1,53 @@
+# Generated by Django 5.2.18 on 2026-10-18 21:17
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('routines', '0003_routine_public_feed_idx'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RoutineActivity',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('copy', 'Copy'), ('start', 'Start')], max_length=10)),
+                ('created_at', models.DateTimeField(db_index=True, default=django.utils.timezone.now)),
+            ],
+            options={
+                'verbose_name_plural': 'routine activity',
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.AddField(
+            model_name='routine',
+            name='copy_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='routine',
+            name='popularity_score',
+            field=models.FloatField(default=0),
+        ),
+        migrations.AddField(
+            model_name='routine',
+            name='start_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='routine',
+            index=models.Index(fields=['is_public', 'is_active', '-popularity_score'], name='routine_popularity_idx'),
+        ),
+        migrations.AddField(
+            model_name='routineactivity',
+            name='routine',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='activity', to='routines.routine'),
+        ),
+    ]
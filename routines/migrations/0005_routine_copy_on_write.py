@@ -0,0 +1,24 @@
+# Generated by Django 5.2.18 on 2026-10-18 21:23
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('routines', '0004_routine_popularity'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='routine',
+            name='shares_exercises',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='routine',
+            name='source',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='copies', to='routines.routine'),
+        ),
+    ]
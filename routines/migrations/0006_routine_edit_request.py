@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-18 21:28
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('routines', '0005_routine_copy_on_write'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RoutineEditRequest',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('idempotency_key', models.CharField(max_length=64)),
+                ('response', models.JSONField(default=dict)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('routine', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='edit_requests', to='routines.routine')),
+            ],
+            options={
+                'ordering': ['-created_at'],
+                'unique_together': {('routine', 'idempotency_key')},
+            },
+        ),
+    ]
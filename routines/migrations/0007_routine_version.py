@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 21:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('routines', '0006_routine_edit_request'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='routine',
+            name='version',
+            field=models.PositiveIntegerField(default=1, editable=False),
+        ),
+    ]
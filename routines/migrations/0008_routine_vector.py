@@ -0,0 +1,24 @@
+# Generated by Django 5.2.18 on 2026-10-18 21:45
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('routines', '0007_routine_version'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RoutineVector',
+            fields=[
+                ('routine', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='vector', serialize=False, to='routines.routine')),
+                ('indices', models.JSONField(default=list)),
+                ('weights', models.JSONField(default=list)),
+                ('version', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True, db_index=True)),
+            ],
+        ),
+    ]
@@ -1,5 +1,7 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import F
 from django.contrib.auth.models import User
+from django.utils import timezone
 from exercises.models import Exercise
 
 
@@ -11,21 +13,174 @@ class Routine(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
     is_active = models.BooleanField(default=True)
     is_public = models.BooleanField(default=True)  # Public routines can be viewed/copied by anyone
+    copy_count = models.PositiveIntegerField(default=0)
+    start_count = models.PositiveIntegerField(default=0)
+    popularity_score = models.FloatField(default=0)  # Time-decayed, recomputed by update_popularity
+
+    # Copy-on-write: a copy shares its source's exercise rows until it is first edited
+    source = models.ForeignKey('self', on_delete=models.SET_NULL, null=True, blank=True, related_name='copies')
+    shares_exercises = models.BooleanField(default=False)
+
+    # Bumped on every change to the routine or its exercises; part of cached fragment keys
+    version = models.PositiveIntegerField(default=1, editable=False)
     
     def __str__(self):
         return f"{self.name} - {self.user.username}"
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            self.version += 1
+            if kwargs.get('update_fields') is not None:
+                kwargs['update_fields'] = {*kwargs['update_fields'], 'version'}
+        super().save(*args, **kwargs)
+
+    def bump_version(self):
+        """Mark the routine as changed after writing its exercise rows directly"""
+        Routine.objects.filter(pk=self.pk).update(version=F('version') + 1)
+        self.version += 1
+
+    @property
+    def exercise_owner_id(self):
+        """Id of the routine whose RoutineExercise rows make up this routine's exercise list"""
+        if self.shares_exercises and self.source_id:
+            return self.source_id
+        return self.id
+
+    def get_routine_exercises(self):
+        """Return the effective exercise list, resolving shared copies to their source's rows"""
+        return RoutineExercise.objects.filter(routine_id=self.exercise_owner_id).order_by('order')
     
     def get_total_exercises(self):
-        return self.routine_exercises.count()
+        return self.get_routine_exercises().count()
     
     def get_estimated_duration(self):
         # Rough estimate: 2-3 minutes per set + rest time
-        total_sets = sum([re.sets_count for re in self.routine_exercises.all()])
+        total_sets = sum([re.sets_count for re in self.get_routine_exercises()])
         estimated_minutes = total_sets * 3  # 3 minutes per set average
         return estimated_minutes
+
+    def materialize_exercises(self):
+        """Give a shared copy its own RoutineExercise rows (in bulk) so it can be edited"""
+        if not self.shares_exercises:
+            return
+        with transaction.atomic():
+            source_exercises = list(self.get_routine_exercises())
+            RoutineExercise.objects.bulk_create([
+                re.copy_to(self) for re in source_exercises
+            ])
+            Routine.objects.filter(pk=self.pk).update(shares_exercises=False)
+            self.shares_exercises = False
+
+    def detach_copies(self, copies=None):
+        """
+        Materialize every copy still sharing this routine's exercises, before they change.
+
+        `copies` optionally narrows the copies to detach (a queryset of this routine's copies).
+        """
+        if copies is None:
+            copies = self.copies.all()
+        with transaction.atomic():
+            copy_ids = list(copies.filter(shares_exercises=True).values_list('id', flat=True))
+            if not copy_ids:
+                return
+            source_exercises = list(self.routine_exercises.all())
+            RoutineExercise.objects.bulk_create([
+                re.copy_to(Routine(id=copy_id))
+                for copy_id in copy_ids
+                for re in source_exercises
+            ], batch_size=1000)
+            Routine.objects.filter(id__in=copy_ids).update(shares_exercises=False)
+
+    def prepare_exercise_edit(self):
+        """Copy-on-write in both directions: call before changing this routine's exercise rows"""
+        self.materialize_exercises()
+        self.detach_copies()
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Keyset pagination of the public feed on (-created_at, -id)
+            models.Index(fields=['is_public', 'is_active', '-created_at', '-id'], name='routine_public_feed_idx'),
+            models.Index(fields=['is_public', 'is_active', '-popularity_score'], name='routine_popularity_idx'),
+        ]
+
+
+# Order keys are sparse: new rows are spaced ORDER_GAP apart so a reorder can
+# usually slot a row between its neighbours without touching any other row
+ORDER_GAP = 1024
+
+
+def _longest_increasing_run(keyed):
+    """Return the positions of a longest strictly increasing subsequence of (position, key) pairs"""
+    tails = []  # tails[k]: index into keyed of the smallest tail of an increasing run of length k+1
+    previous = [None] * len(keyed)
+    for i, (_, key) in enumerate(keyed):
+        low, high = 0, len(tails)
+        while low < high:
+            mid = (low + high) // 2
+            if keyed[tails[mid]][1] < key:
+                low = mid + 1
+            else:
+                high = mid
+        previous[i] = tails[low - 1] if low else None
+        if low == len(tails):
+            tails.append(i)
+        else:
+            tails[low] = i
+
+    positions = set()
+    i = tails[-1] if tails else None
+    while i is not None:
+        positions.add(keyed[i][0])
+        i = previous[i]
+    return positions
+
+
+def assign_order_keys(rows):
+    """
+    Give rows (already in their desired order) strictly increasing order keys.
+
+    Keeps the keys of the largest set of saved rows that are already in order
+    and slots everything else into the gaps between them, so moving one row
+    changes exactly one key. If a gap is exhausted, the whole list is
+    respaced ORDER_GAP apart. Returns the rows whose key changed.
+    """
+    kept = _longest_increasing_run([(i, row.order) for i, row in enumerate(rows) if row.pk is not None])
+    new_keys = [row.order for row in rows]
+
+    i = 0
+    lower = -1
+    while i < len(rows):
+        if i in kept:
+            lower = rows[i].order
+            i += 1
+            continue
+
+        # Re-key the run of rows up to the next kept row
+        j = i
+        while j < len(rows) and j not in kept:
+            j += 1
+        count = j - i
+        if j == len(rows):
+            start = max(lower, 0)
+            run_keys = [start + ORDER_GAP * (k + 1) for k in range(count)]
+        elif rows[j].order - lower - 1 >= count:
+            step = (rows[j].order - lower) / (count + 1)
+            run_keys = [int(lower + step * (k + 1)) for k in range(count)]
+        else:
+            # No room left between the neighbours: respace everything
+            new_keys = [ORDER_GAP * (k + 1) for k in range(len(rows))]
+            break
+        new_keys[i:j] = run_keys
+        lower = run_keys[-1]
+        i = j
+
+    changed = []
+    for row, key in zip(rows, new_keys):
+        if row.pk is None or row.order != key:
+            row.order = key
+            changed.append(row)
+    return [row for row in changed if row.pk is not None]
 
 
 class RoutineExercise(models.Model):
@@ -33,13 +188,76 @@ class RoutineExercise(models.Model):
     exercise = models.ForeignKey(Exercise, on_delete=models.CASCADE)
     sets_count = models.PositiveIntegerField(default=3)
     rest_time_seconds = models.PositiveIntegerField(default=60)  # Rest time between sets
-    order = models.PositiveIntegerField(default=0)  # Order of exercise in routine
+    order = models.PositiveIntegerField(default=0)  # Sparse sort key, see assign_order_keys
     target_reps = models.CharField(max_length=50, blank=True)  # e.g., "8-12", "to failure"
     target_weight = models.DecimalField(max_digits=5, decimal_places=2, null=True, blank=True)
     
     def __str__(self):
         return f"{self.routine.name} - {self.exercise.name} ({self.sets_count} sets)"
+
+    def copy_to(self, routine):
+        """Return an unsaved copy of this row belonging to another routine"""
+        return RoutineExercise(
+            routine=routine,
+            exercise_id=self.exercise_id,
+            sets_count=self.sets_count,
+            rest_time_seconds=self.rest_time_seconds,
+            order=self.order,
+            target_reps=self.target_reps,
+            target_weight=self.target_weight,
+        )
     
     class Meta:
         ordering = ['order']
         unique_together = ['routine', 'exercise']
+
+
+class RoutineActivity(models.Model):
+    """A copy or start of a routine, used to compute its time-decayed popularity"""
+    KIND_CHOICES = [
+        ('copy', 'Copy'),
+        ('start', 'Start'),
+    ]
+
+    routine = models.ForeignKey(Routine, on_delete=models.CASCADE, related_name='activity')
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    created_at = models.DateTimeField(default=timezone.now, db_index=True)
+
+    def __str__(self):
+        return f"{self.routine.name} - {self.kind} ({self.created_at.strftime('%Y-%m-%d')})"
+
+    class Meta:
+        ordering = ['-created_at']
+        verbose_name_plural = 'routine activity'
+
+
+class RoutineEditRequest(models.Model):
+    """Stored response of an idempotent bulk edit, so a retried request is replayed, not re-applied"""
+    routine = models.ForeignKey(Routine, on_delete=models.CASCADE, related_name='edit_requests')
+    idempotency_key = models.CharField(max_length=64)
+    response = models.JSONField(default=dict)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.routine.name} - {self.idempotency_key}"
+
+    class Meta:
+        ordering = ['-created_at']
+        unique_together = ['routine', 'idempotency_key']
+
+
+class RoutineVector(models.Model):
+    """
+    Sparse, L2-normalised feature vector of a public routine, used for similar-routine search.
+
+    Features (exercises, muscles, equipment, weighted by sets) are hashed into
+    a fixed number of dimensions; see routines.similarity.
+    """
+    routine = models.OneToOneField(Routine, on_delete=models.CASCADE, primary_key=True, related_name='vector')
+    indices = models.JSONField(default=list)  # Sorted hashed feature indices
+    weights = models.JSONField(default=list)  # Matching normalised weights
+    version = models.PositiveIntegerField(default=0)  # Routine.version the vector was built from
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    def __str__(self):
+        return f"Vector for {self.routine_id} (v{self.version})"
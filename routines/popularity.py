@@ -0,0 +1,129 @@
+"""
+Popularity ranking for public routines.
+
+Copies and starts are recorded as RoutineActivity rows (plus lifetime counters
+on the routine). The update_popularity management command periodically folds
+recent activity into a time-decayed score and rebuilds the cached trending list,
+so routine_list never runs ranking queries itself. It also prunes activity that
+has aged out of the window, since nothing reads it again.
+"""
+from datetime import timedelta
+
+from django.core.cache import cache
+from django.db.models import F, Count
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import Routine, RoutineActivity
+
+TRENDING_CACHE_KEY = 'routines:trending'
+TRENDING_CACHE_TIMEOUT = 60 * 60  # Refreshed by update_popularity well before expiry
+TRENDING_SIZE = 6
+
+# Scoring parameters
+HALF_LIFE_DAYS = 7
+ACTIVITY_WINDOW_DAYS = 60
+ACTIVITY_WEIGHTS = {
+    'copy': 3.0,  # Copying is a stronger signal than a single workout
+    'start': 1.0,
+}
+
+
+def record_activity(routine, kind):
+    """Record a copy or start of a routine and bump its lifetime counter"""
+    counter = f'{kind}_count'
+    Routine.objects.filter(pk=routine.pk).update(**{counter: F(counter) + 1})
+    RoutineActivity.objects.create(routine=routine, kind=kind)
+
+
+def activity_cutoff(now):
+    """Activity before this moment no longer counts towards popularity"""
+    return now - timedelta(days=ACTIVITY_WINDOW_DAYS)
+
+
+def _decayed_scores(now):
+    """Sum activity per routine in the window, weighted by kind and halved every HALF_LIFE_DAYS"""
+    since = activity_cutoff(now)
+    daily_activity = (
+        RoutineActivity.objects.filter(created_at__gte=since)
+        .annotate(day=TruncDate('created_at'))
+        .values('routine_id', 'kind', 'day')
+        .annotate(count=Count('id'))
+        .order_by()
+    )
+
+    today = now.date()
+    scores = {}
+    for row in daily_activity:
+        age_days = (today - row['day']).days
+        weight = ACTIVITY_WEIGHTS.get(row['kind'], 0) * row['count']
+        scores[row['routine_id']] = scores.get(row['routine_id'], 0) + weight * 0.5 ** (age_days / HALF_LIFE_DAYS)
+    return scores
+
+
+def recompute_popularity(now=None):
+    """
+    Recompute popularity scores for every routine with recent activity.
+
+    Routines whose activity has aged out of the window are reset to zero.
+    Returns the number of routines with a non-zero score.
+    """
+    now = now or timezone.now()
+    scores = _decayed_scores(now)
+
+    routines = list(Routine.objects.filter(id__in=scores.keys()).only('id', 'popularity_score'))
+    for routine in routines:
+        routine.popularity_score = round(scores[routine.id], 4)
+    Routine.objects.bulk_update(routines, ['popularity_score'], batch_size=500)
+    Routine.objects.filter(popularity_score__gt=0).exclude(id__in=scores.keys()).update(popularity_score=0)
+
+    refresh_trending_cache()
+    return len(routines)
+
+
+def prune_activity(now=None):
+    """Delete activity older than the scoring window; returns the number of rows deleted"""
+    deleted, _ = RoutineActivity.objects.filter(created_at__lt=activity_cutoff(now or timezone.now())).delete()
+    return deleted
+
+
+def _load_trending_routines():
+    """Read the top public routines by popularity score (one indexed query)"""
+    routines = (
+        Routine.objects.filter(is_public=True, is_active=True, popularity_score__gt=0)
+        .select_related('user')
+        .order_by('-popularity_score', '-id')[:TRENDING_SIZE]
+    )
+    return [
+        {
+            'id': routine.id,
+            'name': routine.name,
+            'description': routine.description,
+            'username': routine.user.username,
+            'user_id': routine.user_id,
+            'copy_count': routine.copy_count,
+            'start_count': routine.start_count,
+            'popularity_score': routine.popularity_score,
+        }
+        for routine in routines
+    ]
+
+
+def refresh_trending_cache():
+    """Rebuild the cached trending list from the current scores"""
+    trending = _load_trending_routines()
+    cache.set(TRENDING_CACHE_KEY, trending, TRENDING_CACHE_TIMEOUT)
+    return trending
+
+
+def get_trending_routines():
+    """Return the cached trending list, rebuilding it only on a cache miss"""
+    trending = cache.get(TRENDING_CACHE_KEY)
+    if trending is None:
+        trending = refresh_trending_cache()
+    return trending
+
+
+def invalidate_trending_cache():
+    """Drop the cached trending list, e.g. after a routine is deleted or made private"""
+    cache.delete(TRENDING_CACHE_KEY)
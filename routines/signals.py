@@ -0,0 +1,30 @@
+from django.contrib.auth.models import User
+from django.db.models import QuerySet
+from django.db.models.signals import pre_delete, post_save, post_delete
+from django.dispatch import receiver
+
+from .models import Routine
+from .summaries import invalidate_user_routines
+
+
+@receiver(pre_delete, sender=Routine)
+def detach_copies_before_delete(sender, instance, origin=None, **kwargs):
+    """Give copies that still share this routine's exercises their own rows before it goes away"""
+    copies = instance.copies.all()
+
+    # Copies removed by the same delete must not get new rows
+    if isinstance(origin, User):
+        copies = copies.exclude(user=origin)
+    elif isinstance(origin, QuerySet) and origin.model is User:
+        copies = copies.exclude(user__in=origin)
+    elif isinstance(origin, QuerySet) and origin.model is Routine:
+        copies = copies.exclude(id__in=origin.values('id'))
+
+    instance.detach_copies(copies)
+
+
+@receiver(post_save, sender=Routine)
+@receiver(post_delete, sender=Routine)
+def invalidate_routine_summaries(sender, instance, **kwargs):
+    """Drop the owner's cached routine summaries whenever one of their routines changes"""
+    invalidate_user_routines(instance.user_id)
@@ -0,0 +1,257 @@
+"""
+Similar-routine search over hashed sparse feature vectors.
+
+Each public routine is encoded as a sparse vector: every exercise, its muscle
+and its equipment contribute a feature weighted by the routine's sets_count,
+hashed into VECTOR_DIM dimensions and L2-normalised. Vectors are stored in
+RoutineVector and refreshed incrementally (only routines whose version moved)
+by the update_routine_vectors command.
+
+Each process keeps the vectors as one CSR-style NumPy matrix, pulling rows
+changed since its last sync, so a query is a single sparse mat-vec product.
+"""
+import threading
+import time
+import zlib
+from collections import defaultdict
+from datetime import timedelta
+
+import numpy as np
+from django.db.models import Q, F
+
+from .models import Routine, RoutineExercise, RoutineVector
+
+VECTOR_DIM = 2 ** 18
+
+# Relative weight of each feature kind (multiplied by the exercise's sets_count)
+FEATURE_WEIGHTS = {
+    'exercise': 1.0,
+    'muscle': 0.5,
+    'equipment': 0.25,
+}
+
+INDEX_SYNC_SECONDS = 60
+INDEX_FULL_RELOAD_SECONDS = 60 * 60  # Also drops vectors of deleted routines
+# updated_at is stamped before its transaction commits, so a row can appear with a
+# timestamp older than rows already synced. Each sync re-reads this far back; it must
+# cover the longest vector-writing transaction (the refresh task's 30 minute lease).
+INDEX_SYNC_OVERLAP = timedelta(minutes=30)
+REFRESH_CHUNK_SIZE = 1000
+
+
+def _feature_index(feature):
+    """Stable hash of a feature name (Python's hash() is salted per process)"""
+    return zlib.crc32(feature.encode()) % VECTOR_DIM
+
+
+def encode_routine(rows):
+    """
+    Encode (exercise_id, muscle, equipment, sets_count) rows as a sparse vector.
+
+    Returns (indices, weights) as sorted lists, L2-normalised; both empty for a
+    routine without exercises.
+    """
+    features = defaultdict(float)
+    for exercise_id, muscle, equipment, sets_count in rows:
+        sets_count = sets_count or 1
+        features[_feature_index(f'exercise:{exercise_id}')] += FEATURE_WEIGHTS['exercise'] * sets_count
+        if muscle:
+            features[_feature_index(f'muscle:{muscle}')] += FEATURE_WEIGHTS['muscle'] * sets_count
+        if equipment:
+            features[_feature_index(f'equipment:{equipment}')] += FEATURE_WEIGHTS['equipment'] * sets_count
+
+    norm = sum(weight * weight for weight in features.values()) ** 0.5
+    if not norm:
+        return [], []
+    indices = sorted(features)
+    return indices, [round(features[index] / norm, 6) for index in indices]
+
+
+def _feature_rows(owner_ids):
+    """Load (owner id, exercise_id, muscle, equipment, sets_count) for the given exercise owners"""
+    return RoutineExercise.objects.filter(routine_id__in=owner_ids).order_by().values_list(
+        'routine_id', 'exercise_id', 'exercise__muscle', 'exercise__equipment', 'sets_count'
+    )
+
+
+def encode_routines(routines):
+    """Return {routine id: (indices, weights)} for routines, resolving shared copies to their source"""
+    rows_by_owner = defaultdict(list)
+    for owner_id, *row in _feature_rows({routine.exercise_owner_id for routine in routines}):
+        rows_by_owner[owner_id].append(row)
+    return {routine.id: encode_routine(rows_by_owner[routine.exercise_owner_id]) for routine in routines}
+
+
+def refresh_routine_vectors(full=False, chunk_size=REFRESH_CHUNK_SIZE):
+    """
+    Rebuild stored vectors for public routines that are new or changed since their last build.
+
+    Vectors of routines that are no longer public are deleted. Pass full=True
+    to rebuild every vector. Returns (vectors written, vectors deleted).
+    """
+    routines = Routine.objects.filter(is_public=True, is_active=True)
+    if not full:
+        routines = routines.filter(Q(vector__isnull=True) | Q(vector__version__lt=F('version')))
+    routines = routines.only('id', 'version', 'source_id', 'shares_exercises').order_by('id')
+
+    written = 0
+    chunk = []
+    for routine in routines.iterator(chunk_size=chunk_size):
+        chunk.append(routine)
+        if len(chunk) >= chunk_size:
+            written += _write_vectors(chunk)
+            chunk = []
+    if chunk:
+        written += _write_vectors(chunk)
+
+    deleted, _ = RoutineVector.objects.filter(
+        Q(routine__is_public=False) | Q(routine__is_active=False)
+    ).delete()
+    return written, deleted
+
+
+def _write_vectors(routines):
+    encoded = encode_routines(routines)
+    vectors = [
+        RoutineVector(routine_id=routine.id, indices=encoded[routine.id][0],
+                      weights=encoded[routine.id][1], version=routine.version)
+        for routine in routines
+    ]
+    RoutineVector.objects.bulk_create(
+        vectors,
+        update_conflicts=True,
+        unique_fields=['routine'],
+        update_fields=['indices', 'weights', 'version', 'updated_at'],
+    )
+    return len(vectors)
+
+
+class SimilarityIndex:
+    """In-memory CSR matrix of routine vectors, kept in sync with RoutineVector by updated_at"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._vectors = {}  # routine id -> (indices array, weights array)
+        self._updated = {}  # routine id -> updated_at of the row loaded, to skip re-read unchanged rows
+        self._synced_until = None
+        self._checked_at = None
+        self._loaded_at = None
+        self._dirty = True
+        # (ids, indptr, indices, data), replaced as a whole so queries never see a half-built matrix
+        self._matrix = (
+            np.empty(0, dtype=np.int64), np.zeros(1, dtype=np.int64),
+            np.empty(0, dtype=np.int32), np.empty(0, dtype=np.float32),
+        )
+
+    def __len__(self):
+        return len(self._matrix[0])
+
+    def sync(self, force=False):
+        """Pull vectors written since the last sync (at most once per INDEX_SYNC_SECONDS)"""
+        now = time.monotonic()
+        with self._lock:
+            if not force and self._checked_at is not None and now - self._checked_at < INDEX_SYNC_SECONDS:
+                return
+            if self._loaded_at is None or now - self._loaded_at > INDEX_FULL_RELOAD_SECONDS:
+                self._vectors = {}
+                self._updated = {}
+                self._synced_until = None
+                self._loaded_at = now
+                self._dirty = True
+            self._checked_at = now
+
+            changed = RoutineVector.objects.order_by('updated_at')
+            if self._synced_until is not None:
+                # Re-read the overlap window so rows committed late (see INDEX_SYNC_OVERLAP) are picked up
+                changed = changed.filter(updated_at__gte=self._synced_until - INDEX_SYNC_OVERLAP)
+            for routine_id, indices, weights, updated_at in changed.values_list(
+                'routine_id', 'indices', 'weights', 'updated_at'
+            ).iterator(chunk_size=REFRESH_CHUNK_SIZE):
+                self._synced_until = max(self._synced_until or updated_at, updated_at)
+                if self._updated.get(routine_id) == updated_at:
+                    continue
+                self._updated[routine_id] = updated_at
+                if indices:
+                    self._vectors[routine_id] = (
+                        np.asarray(indices, dtype=np.int32), np.asarray(weights, dtype=np.float32)
+                    )
+                else:
+                    self._vectors.pop(routine_id, None)
+                self._dirty = True
+
+            if self._dirty:
+                self._build()
+
+    def _build(self):
+        ids = np.fromiter(self._vectors.keys(), dtype=np.int64, count=len(self._vectors))
+        lengths = np.fromiter((len(v[0]) for v in self._vectors.values()), dtype=np.int64, count=len(ids))
+        indptr = np.concatenate(([0], np.cumsum(lengths)))
+        indices = np.concatenate([v[0] for v in self._vectors.values()] or [np.empty(0, np.int32)])
+        data = np.concatenate([v[1] for v in self._vectors.values()] or [np.empty(0, np.float32)])
+        self._matrix = (ids, indptr, indices, data)
+        self._dirty = False
+
+    def query(self, indices, weights, limit=10, exclude_ids=()):
+        """Return [(routine id, cosine score)] for the best-matching vectors, highest first"""
+        ids, indptr, stored_indices, data = self._matrix
+        if not len(ids) or not len(indices):
+            return []
+
+        query_indices = np.asarray(indices, dtype=np.int32)
+        query_weights = np.asarray(weights, dtype=np.float32)
+        order = np.argsort(query_indices, kind='stable')
+        query_indices, query_weights = query_indices[order], query_weights[order]
+        # Look each stored feature up in the (short, sorted) query vector instead of densifying it
+        positions = np.searchsorted(query_indices, stored_indices).clip(max=len(query_indices) - 1)
+        products = np.where(query_indices[positions] == stored_indices, data * query_weights[positions], 0)
+        # Sparse mat-vec: every stored row is non-empty, so reduceat sums each row's products
+        scores = np.add.reduceat(products, indptr[:-1])
+        if exclude_ids:
+            scores[np.isin(ids, list(exclude_ids))] = 0
+
+        limit = min(limit, len(scores))
+        top = np.argpartition(-scores, limit - 1)[:limit]
+        top = top[np.argsort(-scores[top], kind='stable')]
+        return [(int(ids[i]), float(scores[i])) for i in top if scores[i] > 0]
+
+
+_index = SimilarityIndex()
+
+
+def get_similarity_index(force_sync=False):
+    """Return this process's index, syncing it with the stored vectors if due"""
+    _index.sync(force=force_sync)
+    return _index
+
+
+def reset_similarity_index():
+    """Drop this process's index so the next use reloads every vector"""
+    global _index
+    _index = SimilarityIndex()
+
+
+def find_similar_routines(routine, limit=10, exclude_user=None):
+    """
+    Return up to `limit` public routines similar to `routine`, as (Routine, score) pairs.
+
+    The query vector is encoded from the routine's current exercises, so it
+    need not be public or indexed itself. Candidates are re-checked against the
+    database, dropping routines that went private or were deleted since the
+    last vector refresh.
+    """
+    indices, weights = encode_routines([routine])[routine.id]
+    exclude_ids = {routine.id, routine.exercise_owner_id}
+    candidates = get_similarity_index().query(indices, weights, limit * 3, exclude_ids)
+    if not candidates:
+        return []
+
+    routines = Routine.objects.filter(
+        id__in=[routine_id for routine_id, _ in candidates], is_public=True, is_active=True
+    ).select_related('user')
+    if exclude_user is not None:
+        routines = routines.exclude(user=exclude_user)
+    routines_by_id = {candidate.id: candidate for candidate in routines}
+    return [
+        (routines_by_id[routine_id], score)
+        for routine_id, score in candidates if routine_id in routines_by_id
+    ][:limit]
@@ -0,0 +1,85 @@
+"""
+Routine summary stats and the caches built on them.
+
+Exercise count, total sets and estimated duration are annotated onto a
+routine queryset in SQL. The add-to-routine modal reads a user's summaries
+from the cache; any change to a routine or its exercises drops that user's
+entry, so the next read rebuilds it with a single query. Routine detail
+fragments are keyed on Routine.version instead, so they never need deleting.
+"""
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F, Case, When, Count, Sum, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.dispatch import Signal
+
+from .models import Routine, RoutineExercise
+
+MINUTES_PER_SET = 3  # Keep in sync with Routine.get_estimated_duration
+
+USER_ROUTINES_CACHE_KEY = 'routines:user:{user_id}:summaries'
+USER_ROUTINES_CACHE_TIMEOUT = 60 * 60 * 24  # Invalidated on change, the timeout is only a backstop
+
+# Sent with the routine (sender Routine) after its exercise rows were written directly
+exercises_changed = Signal()
+
+
+def with_routine_stats(routines):
+    """
+    Annotate exercise count, total sets and estimated duration onto a routine queryset.
+
+    Uses correlated subqueries rather than a GROUP BY so the stats are only
+    computed for the rows that survive LIMIT on a paginated query. Copies that
+    still share their source's exercises are counted against the source's rows.
+    """
+    routine_exercises = RoutineExercise.objects.filter(routine=OuterRef('exercise_owner')).order_by().values('routine')
+    exercise_count = routine_exercises.annotate(count=Count('id')).values('count')
+    total_sets = routine_exercises.annotate(total=Sum('sets_count')).values('total')
+
+    return routines.annotate(
+        exercise_owner=Case(When(shares_exercises=True, source__isnull=False, then=F('source_id')), default=F('id')),
+    ).annotate(
+        exercise_count=Coalesce(Subquery(exercise_count, output_field=IntegerField()), 0),
+        total_sets=Coalesce(Subquery(total_sets, output_field=IntegerField()), 0),
+    ).annotate(estimated_duration=F('total_sets') * MINUTES_PER_SET)
+
+
+def _load_user_routine_summaries(user_id):
+    """Read a user's active routines with their stats in one query"""
+    routines = with_routine_stats(Routine.objects.filter(user_id=user_id, is_active=True))
+    return list(
+        routines.order_by('-created_at', '-id')
+        .values('id', 'name', 'description', 'exercise_count', 'estimated_duration')
+    )
+
+
+def get_user_routine_summaries(user):
+    """Return the cached routine summaries for a user, rebuilding them only on a cache miss"""
+    key = USER_ROUTINES_CACHE_KEY.format(user_id=user.pk)
+    summaries = cache.get(key)
+    if summaries is None:
+        summaries = _load_user_routine_summaries(user.pk)
+        cache.set(key, summaries, USER_ROUTINES_CACHE_TIMEOUT)
+    return summaries
+
+
+def invalidate_user_routines(*user_ids):
+    """
+    Drop the cached routine summaries for the given users.
+
+    The entries are deleted immediately and again once the surrounding
+    transaction commits, so a read racing the transaction cannot leave
+    pre-commit stats in the cache.
+    """
+    keys = [USER_ROUTINES_CACHE_KEY.format(user_id=user_id) for user_id in set(user_ids)]
+    if not keys:
+        return
+    cache.delete_many(keys)
+    transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+def routine_exercises_changed(routine):
+    """Call after writing a routine's exercise rows directly (bulk or single-row)"""
+    routine.bump_version()
+    invalidate_user_routines(routine.user_id)
+    exercises_changed.send(sender=Routine, routine=routine)
@@ -0,0 +1,16 @@
+"""Background tasks for routines (see taskqueue)"""
+from django.db.models import F, Q
+from taskqueue.queue import task
+
+from .models import Routine, RoutineExercise
+from .similarity import refresh_routine_vectors
+
+
+@task(priority=-5, timeout=30 * 60)
+def refresh_vectors_for_exercises(exercise_ids):
+    """Rebuild the vectors (and cached fragments) of routines using exercises whose muscle or equipment changed"""
+    owners = RoutineExercise.objects.filter(exercise_id__in=exercise_ids).values('routine_id')
+    Routine.objects.filter(
+        Q(id__in=owners) | Q(source_id__in=owners, shares_exercises=True)
+    ).update(version=F('version') + 1)
+    refresh_routine_vectors()
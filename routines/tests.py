@@ -1,7 +1,12 @@
+from datetime import timedelta
 from django.test import TestCase, Client
 from django.contrib.auth.models import User
+from django.core.cache import cache
 from django.urls import reverse
-from routines.models import Routine, RoutineExercise
+from django.utils import timezone
+from routines.models import Routine, RoutineExercise, RoutineActivity, ORDER_GAP, assign_order_keys
+from routines.summaries import get_user_routine_summaries
+from routines.popularity import recompute_popularity, get_trending_routines
 from exercises.models import Exercise
 
 
@@ -116,6 +121,7 @@ class RoutineDetailViewTests(TestCase):
     """Test routine detail view"""
 
     def setUp(self):
+        cache.clear()
         self.client = Client()
         self.user = User.objects.create_user(
             username='testuser',
@@ -295,6 +301,137 @@ class RoutineEditViewTests(TestCase):
         self.assertTrue(self.routine.is_public)
 
 
+class RoutineDetailFragmentCacheTests(TestCase):
+    """Test the routine detail exercise list is cached per routine version"""
+
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.user = User.objects.create_user(
+            username='testuser',
+            password='testpass123!@#'
+        )
+        self.routine = Routine.objects.create(name='Public Routine', user=self.user, is_public=True)
+        for i in range(4):
+            exercise = Exercise.objects.create(title=f'Exercise {i}', slug=f'exercise-{i}', equipment='bodyweight')
+            RoutineExercise.objects.create(
+                routine=self.routine, exercise=exercise, sets_count=3, order=(i + 1) * ORDER_GAP
+            )
+        self.url = reverse('routines:routine_detail', kwargs={'routine_id': self.routine.id})
+
+    def tearDown(self):
+        cache.clear()
+
+    def test_cold_render_does_not_query_per_exercise(self):
+        """Test the cold path loads exercises with their routine rows"""
+        with self.assertNumQueries(2):
+            response = self.client.get(self.url)
+
+        self.assertContains(response, 'Exercise 3')
+        self.assertEqual(response.context['exercise_count'], 4)
+        self.assertEqual(response.context['total_sets'], 12)
+        self.assertEqual(response.context['estimated_duration'], 36)
+
+    def test_warm_render_skips_exercise_queries(self):
+        """Test a cached fragment leaves only the routine lookup"""
+        self.client.get(self.url)
+
+        with self.assertNumQueries(1):
+            response = self.client.get(self.url)
+
+        self.assertContains(response, 'Exercise 3')
+
+    def test_exercise_change_bumps_version(self):
+        """Test editing exercises through the API serves a fresh fragment"""
+        import json
+        self.client.get(self.url)
+        self.client.login(username='testuser', password='testpass123!@#')
+        extra = Exercise.objects.create(title='Fresh Exercise', slug='fresh-exercise', equipment='bodyweight')
+
+        self.client.post(
+            reverse('routines:add_exercise_to_routine', kwargs={'routine_id': self.routine.id}),
+            data=json.dumps({'exercise_id': extra.id}),
+            content_type='application/json'
+        )
+        response = self.client.get(self.url)
+
+        self.assertContains(response, 'Fresh Exercise')
+        self.assertEqual(response.context['exercise_count'], 5)
+
+    def test_routine_save_bumps_version(self):
+        """Test saving a routine increments its version"""
+        version = self.routine.version
+
+        self.routine.save()
+        self.routine.refresh_from_db()
+
+        self.assertEqual(self.routine.version, version + 1)
+
+
+class RoutineEditDiffTests(TestCase):
+    """Test diff-based saving of a routine's exercises"""
+
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(
+            username='testuser',
+            password='testpass123!@#'
+        )
+        self.routine = Routine.objects.create(name='Test Routine', user=self.user)
+        self.exercises = [
+            Exercise.objects.create(title=f'Exercise {i}', slug=f'exercise-{i}', equipment='bodyweight')
+            for i in range(3)
+        ]
+        self.kept = RoutineExercise.objects.create(
+            routine=self.routine, exercise=self.exercises[0], sets_count=3, rest_time_seconds=60,
+            order=0, target_reps='8-12', target_weight=50
+        )
+        self.removed = RoutineExercise.objects.create(
+            routine=self.routine, exercise=self.exercises[1], order=1
+        )
+        self.edit_url = reverse('routines:routine_edit', kwargs={'routine_id': self.routine.id})
+        self.client.login(username='testuser', password='testpass123!@#')
+
+    def test_edit_applies_insert_update_and_delete(self):
+        """Test edited rows are updated in place, new rows inserted and dropped rows deleted"""
+        self.client.post(self.edit_url, {
+            'name': 'Test Routine',
+            f'exercise_{self.exercises[2].id}': 'on',
+            f'sets_{self.exercises[2].id}': '5',
+            f'exercise_{self.exercises[0].id}': 'on',
+            f'sets_{self.exercises[0].id}': '4',
+            f'rest_{self.exercises[0].id}': '90',
+        })
+
+        rows = list(self.routine.routine_exercises.order_by('order'))
+        self.assertEqual([re.exercise_id for re in rows], [self.exercises[2].id, self.exercises[0].id])
+        self.assertEqual(rows[0].sets_count, 5)
+        self.assertFalse(RoutineExercise.objects.filter(id=self.removed.id).exists())
+
+        # The kept row is updated in place and keeps fields not on the form
+        self.assertEqual(rows[1].id, self.kept.id)
+        self.assertEqual((rows[1].sets_count, rows[1].rest_time_seconds), (4, 90))
+        self.assertEqual(rows[1].target_reps, '8-12')
+        self.assertEqual(rows[1].target_weight, 50)
+
+    def test_edit_query_count_is_independent_of_routine_length(self):
+        """Test saving uses bulk statements rather than one query per exercise"""
+        for i in range(20):
+            exercise = Exercise.objects.create(title=f'Extra {i}', slug=f'extra-{i}', equipment='bodyweight')
+            RoutineExercise.objects.create(routine=self.routine, exercise=exercise, order=i + 2)
+        data = {'name': 'Test Routine'}
+        for re in self.routine.routine_exercises.all():
+            data[f'exercise_{re.exercise_id}'] = 'on'
+            data[f'sets_{re.exercise_id}'] = '5'
+
+        # Auth/session/routine lookups, open workout sessions to refresh, one id__in check,
+        # copy-on-write check, one read, one bulk update
+        with self.assertNumQueries(17):
+            self.client.post(self.edit_url, data)
+
+        self.assertEqual(set(self.routine.routine_exercises.values_list('sets_count', flat=True)), {5})
+
+
 class RoutineDeleteViewTests(TestCase):
     """Test routine deletion view"""
 
@@ -444,11 +581,11 @@ class RoutineCopyViewTests(TestCase):
         response = self.client.get(self.copy_url)
         self.assertEqual(response.status_code, 302)
 
-        # Verify exercises were copied
+        # Verify exercises were copied (shared with the original until first edit)
         copied_routine = Routine.objects.filter(user=self.user).first()
-        self.assertEqual(copied_routine.routine_exercises.count(), 1)
+        self.assertEqual(copied_routine.get_routine_exercises().count(), 1)
 
-        copied_exercise = copied_routine.routine_exercises.first()
+        copied_exercise = copied_routine.get_routine_exercises().first()
         original_exercise = self.public_routine.routine_exercises.first()
 
         self.assertEqual(copied_exercise.exercise, original_exercise.exercise)
@@ -471,10 +608,109 @@ class RoutineCopyViewTests(TestCase):
         self.assertEqual(Routine.objects.filter(user=self.user).count(), 0)
 
 
+class RoutineCopyOnWriteTests(TestCase):
+    """Test copies share their source's exercises until first edited"""
+
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.user = User.objects.create_user(
+            username='testuser',
+            password='testpass123!@#'
+        )
+        self.owner = User.objects.create_user(
+            username='owner',
+            password='testpass123!@#'
+        )
+        self.source = Routine.objects.create(name='Source Routine', user=self.owner, is_public=True)
+        self.push_up = Exercise.objects.create(title='Push-up', slug='push-up', equipment='bodyweight')
+        self.squat = Exercise.objects.create(title='Squat', slug='squat', equipment='bodyweight')
+        RoutineExercise.objects.create(
+            routine=self.source, exercise=self.push_up, sets_count=4, order=0, target_reps='8-12'
+        )
+
+        self.client.login(username='testuser', password='testpass123!@#')
+        self.client.get(reverse('routines:routine_copy', kwargs={'routine_id': self.source.id}))
+        self.copy = Routine.objects.get(user=self.user)
+
+    def test_copy_creates_no_exercise_rows(self):
+        """Test copying is O(1): no RoutineExercise rows are duplicated"""
+        self.assertTrue(self.copy.shares_exercises)
+        self.assertEqual(self.copy.routine_exercises.count(), 0)
+        self.assertEqual(RoutineExercise.objects.count(), 1)
+
+    def test_copy_detail_shows_shared_exercises(self):
+        """Test the copy's detail page resolves the source's exercises"""
+        response = self.client.get(reverse('routines:routine_detail', kwargs={'routine_id': self.copy.id}))
+        self.assertContains(response, 'Push-up')
+
+    def test_editing_copy_materializes_rows(self):
+        """Test the first edit of a copy gives it its own rows, leaving the source untouched"""
+        self.client.post(reverse('routines:routine_edit', kwargs={'routine_id': self.copy.id}), {
+            'name': 'My Copy',
+            f'exercise_{self.push_up.id}': 'on',
+            f'exercise_{self.squat.id}': 'on',
+        })
+
+        self.copy.refresh_from_db()
+        self.assertFalse(self.copy.shares_exercises)
+        self.assertEqual(self.copy.routine_exercises.count(), 2)
+        self.assertEqual(self.source.routine_exercises.count(), 1)
+
+    def test_editing_source_detaches_copies(self):
+        """Test changing the source gives sharing copies a snapshot of the old list"""
+        self.source.prepare_exercise_edit()
+        RoutineExercise.objects.create(routine=self.source, exercise=self.squat, order=1)
+
+        self.copy.refresh_from_db()
+        self.assertFalse(self.copy.shares_exercises)
+        self.assertEqual(
+            list(self.copy.get_routine_exercises().values_list('exercise_id', 'target_reps')),
+            [(self.push_up.id, '8-12')]
+        )
+
+    def test_failed_add_leaves_copy_shared(self):
+        """Test an add that fails after materializing rolls back, leaving the copy sharing its source"""
+        import json
+        from unittest.mock import patch
+
+        with patch.object(RoutineExercise.objects, 'create', side_effect=RuntimeError('disk full')):
+            response = self.client.post(
+                reverse('routines:add_exercise_to_routine', kwargs={'routine_id': self.copy.id}),
+                data=json.dumps({'exercise_id': self.squat.id}),
+                content_type='application/json'
+            )
+
+        self.assertEqual(response.status_code, 500)
+        self.copy.refresh_from_db()
+        self.assertTrue(self.copy.shares_exercises)
+        self.assertEqual(self.copy.routine_exercises.count(), 0)
+
+    def test_deleting_source_keeps_copy_exercises(self):
+        """Test deleting the source materializes copies first"""
+        self.source.delete()
+
+        self.copy.refresh_from_db()
+        self.assertIsNone(self.copy.source)
+        self.assertEqual(self.copy.get_routine_exercises().count(), 1)
+
+    def test_deleting_user_with_own_copy(self):
+        """Test deleting a user who copied their own routine does not orphan rows"""
+        own_copy = Routine.objects.create(
+            name='Own Copy', user=self.owner, source=self.source, shares_exercises=True
+        )
+        self.owner.delete()
+
+        self.assertFalse(Routine.objects.filter(id=own_copy.id).exists())
+        self.copy.refresh_from_db()
+        self.assertEqual(self.copy.get_routine_exercises().count(), 1)
+
+
 class RoutineAPIViewTests(TestCase):
     """Test routine API endpoints"""
 
     def setUp(self):
+        cache.clear()
         self.client = Client()
         self.user = User.objects.create_user(
             username='testuser',
@@ -592,6 +828,504 @@ class RoutineAPIViewTests(TestCase):
         self.assertEqual(response.status_code, 400)
 
 
+class UserRoutineSummaryCacheTests(TestCase):
+    """Test the cached routine summaries behind the add-to-routine modal"""
+
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.user = User.objects.create_user(
+            username='testuser',
+            password='testpass123!@#'
+        )
+        self.routine = Routine.objects.create(name='Test Routine', user=self.user, is_public=False)
+        self.exercises = [
+            Exercise.objects.create(title=f'Exercise {i}', slug=f'exercise-{i}', equipment='bodyweight')
+            for i in range(3)
+        ]
+        for i, exercise in enumerate(self.exercises[:2]):
+            RoutineExercise.objects.create(
+                routine=self.routine, exercise=exercise, sets_count=4, order=(i + 1) * ORDER_GAP
+            )
+
+    def tearDown(self):
+        cache.clear()
+
+    def _summaries(self):
+        self.client.login(username='testuser', password='testpass123!@#')
+        return self.client.get(reverse('routines:user_routines_api')).json()['routines']
+
+    def test_summaries_loaded_in_one_query_then_cached(self):
+        """Test a cold read is one query and a warm read touches no database"""
+        with self.assertNumQueries(1):
+            summaries = get_user_routine_summaries(self.user)
+        with self.assertNumQueries(0):
+            self.assertEqual(get_user_routine_summaries(self.user), summaries)
+
+        self.assertEqual(summaries[0]['exercise_count'], 2)
+        self.assertEqual(summaries[0]['estimated_duration'], 8 * 3)
+
+    def test_adding_exercise_invalidates_summaries(self):
+        """Test adding an exercise through the API refreshes the cached count"""
+        import json
+        self.assertEqual(self._summaries()[0]['exercise_count'], 2)
+
+        self.client.post(
+            reverse('routines:add_exercise_to_routine', kwargs={'routine_id': self.routine.id}),
+            data=json.dumps({'exercise_id': self.exercises[2].id}),
+            content_type='application/json'
+        )
+
+        self.assertEqual(self._summaries()[0]['exercise_count'], 3)
+
+    def test_routine_changes_invalidate_summaries(self):
+        """Test renaming and deleting a routine refresh the cached list"""
+        self._summaries()
+
+        self.routine.name = 'Renamed Routine'
+        self.routine.save()
+        self.assertEqual(self._summaries()[0]['name'], 'Renamed Routine')
+
+        self.routine.delete()
+        self.assertEqual(self._summaries(), [])
+
+    def test_shared_copy_reports_source_stats(self):
+        """Test a copy that still shares exercises reports its source's stats"""
+        other_user = User.objects.create_user(username='otheruser', password='testpass123!@#')
+        Routine.objects.create(
+            name='Copy', user=other_user, source=self.routine, shares_exercises=True
+        )
+
+        summaries = get_user_routine_summaries(other_user)
+
+        self.assertEqual(summaries[0]['exercise_count'], 2)
+
+
+class BulkEditRoutineExercisesTests(TestCase):
+    """Test the bulk add/remove/reorder endpoint"""
+
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(
+            username='testuser',
+            password='testpass123!@#'
+        )
+        self.routine = Routine.objects.create(name='Test Routine', user=self.user, is_public=False)
+        self.exercises = [
+            Exercise.objects.create(title=f'Exercise {i}', slug=f'exercise-{i}', equipment='bodyweight')
+            for i in range(4)
+        ]
+        RoutineExercise.objects.create(routine=self.routine, exercise=self.exercises[0], order=0)
+        RoutineExercise.objects.create(routine=self.routine, exercise=self.exercises[1], order=1)
+        self.url = reverse('routines:bulk_edit_routine_exercises', kwargs={'routine_id': self.routine.id})
+
+    def _post(self, payload):
+        import json
+        return self.client.post(self.url, data=json.dumps(payload), content_type='application/json')
+
+    def test_bulk_edit_requires_authentication(self):
+        """Test the bulk endpoint requires authentication"""
+        response = self._post({'add': [{'exercise_id': self.exercises[2].id}]})
+        self.assertEqual(response.status_code, 401)
+
+    def test_bulk_edit_adds_removes_and_reorders(self):
+        """Test one request can add, remove and reorder exercises"""
+        self.client.login(username='testuser', password='testpass123!@#')
+
+        response = self._post({
+            'add': [
+                {'exercise_id': self.exercises[2].id, 'sets_count': 5},
+                {'exercise_id': self.exercises[3].id},
+                {'exercise_id': self.exercises[1].id},
+                {'exercise_id': 99999},
+            ],
+            'remove': [self.exercises[0].id],
+            'order': [self.exercises[3].id, self.exercises[1].id],
+        })
+
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(data['added'], [self.exercises[2].id, self.exercises[3].id])
+        self.assertEqual(data['removed'], [self.exercises[0].id])
+        self.assertEqual(len(data['skipped']), 2)
+
+        ordered = list(self.routine.get_routine_exercises().values_list('exercise_id', flat=True))
+        self.assertEqual(ordered, [self.exercises[3].id, self.exercises[1].id, self.exercises[2].id])
+        self.assertEqual(data['exercise_ids'], ordered)
+        self.assertEqual(self.routine.routine_exercises.get(exercise=self.exercises[2]).sets_count, 5)
+
+    def test_bulk_edit_replays_idempotent_retry(self):
+        """Test a retried request with the same key is not applied twice"""
+        self.client.login(username='testuser', password='testpass123!@#')
+        payload = {'idempotency_key': 'abc-123', 'remove': [self.exercises[0].id],
+                   'add': [{'exercise_id': self.exercises[0].id}]}
+
+        first = self._post(payload).json()
+        second = self._post(payload).json()
+
+        self.assertTrue(second['replayed'])
+        self.assertEqual(first['added'], second['added'])
+        self.assertEqual(self.routine.routine_exercises.count(), 2)
+
+    def test_bulk_edit_rejects_other_users_routine(self):
+        """Test users cannot bulk edit routines they do not own"""
+        User.objects.create_user(username='otheruser', password='testpass123!@#')
+        self.client.login(username='otheruser', password='testpass123!@#')
+
+        response = self._post({'remove': [self.exercises[0].id]})
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(self.routine.routine_exercises.count(), 2)
+
+    def test_bulk_edit_invalid_payload(self):
+        """Test malformed items are rejected without changes"""
+        self.client.login(username='testuser', password='testpass123!@#')
+
+        response = self._post({'add': [{'sets_count': 3}]})
+        self.assertEqual(response.status_code, 400)
+
+
+class RoutineExerciseOrderKeyTests(TestCase):
+    """Test sparse order keys for routine exercises"""
+
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(
+            username='testuser',
+            password='testpass123!@#'
+        )
+        self.routine = Routine.objects.create(name='Test Routine', user=self.user, is_public=False)
+        self.rows = []
+        for i in range(5):
+            exercise = Exercise.objects.create(title=f'Exercise {i}', slug=f'exercise-{i}', equipment='bodyweight')
+            self.rows.append(RoutineExercise.objects.create(
+                routine=self.routine, exercise=exercise, order=(i + 1) * ORDER_GAP
+            ))
+
+    def _move(self, exercise_id, after_exercise_id):
+        import json
+        return self.client.post(
+            reverse('routines:move_routine_exercise', kwargs={
+                'routine_id': self.routine.id, 'exercise_id': exercise_id
+            }),
+            data=json.dumps({'after_exercise_id': after_exercise_id}),
+            content_type='application/json'
+        )
+
+    def test_assign_order_keys_moves_one_row(self):
+        """Test moving one row rewrites only that row's key"""
+        rows = self.rows[:]
+        rows.insert(1, rows.pop(4))
+
+        changed = assign_order_keys(rows)
+
+        self.assertEqual(changed, [self.rows[4]])
+        self.assertTrue(ORDER_GAP < self.rows[4].order < 2 * ORDER_GAP)
+
+    def test_assign_order_keys_respaces_when_gap_exhausted(self):
+        """Test rows are respaced when there is no room between neighbours"""
+        for i, row in enumerate(self.rows):
+            row.order = i
+        rows = self.rows[:]
+        rows.insert(1, rows.pop(4))
+
+        assign_order_keys(rows)
+
+        self.assertEqual([row.order for row in rows], [ORDER_GAP * (i + 1) for i in range(5)])
+
+    def test_move_endpoint_updates_single_row(self):
+        """Test a drag-and-drop move issues one row update"""
+        self.client.login(username='testuser', password='testpass123!@#')
+
+        response = self._move(self.rows[0].exercise_id, self.rows[2].exercise_id)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['rows_updated'], 1)
+        ordered = list(self.routine.get_routine_exercises().values_list('id', flat=True))
+        self.assertEqual(ordered, [self.rows[i].id for i in (1, 2, 0, 3, 4)])
+
+    def test_move_endpoint_to_top(self):
+        """Test moving an exercise to the top of the routine"""
+        self.client.login(username='testuser', password='testpass123!@#')
+
+        self._move(self.rows[3].exercise_id, None)
+
+        self.assertEqual(self.routine.get_routine_exercises().first().id, self.rows[3].id)
+
+    def test_rebalance_command_respaces_crowded_routines(self):
+        """Test the rebalance command respaces routines with tiny gaps"""
+        from io import StringIO
+        from django.core.management import call_command
+
+        RoutineExercise.objects.filter(id=self.rows[1].id).update(order=ORDER_GAP + 1)
+        version = Routine.objects.get(pk=self.routine.pk).version
+        call_command('rebalance_routine_orders', stdout=StringIO())
+
+        keys = list(self.routine.routine_exercises.order_by('order').values_list('order', flat=True))
+        self.assertEqual(keys, [ORDER_GAP * (i + 1) for i in range(5)])
+        # Cached fragments and session state keyed on the old version are dropped
+        self.assertEqual(Routine.objects.get(pk=self.routine.pk).version, version + 1)
+
+
+class RoutineTransferTests(TestCase):
+    """Test streaming routine import and export"""
+
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.user = User.objects.create_user(
+            username='testuser',
+            password='testpass123!@#'
+        )
+        self.coach = User.objects.create_user(username='coach', password='testpass123!@#')
+        self.push_up = Exercise.objects.create(title='Push-up', slug='push-up', equipment='bodyweight')
+        self.squat = Exercise.objects.create(title='Squat', slug='squat', equipment='bodyweight')
+        self.routine = Routine.objects.create(name='Coach Routine', user=self.coach, description='Full body')
+        RoutineExercise.objects.create(
+            routine=self.routine, exercise=self.push_up, sets_count=4, order=ORDER_GAP, target_reps='8-12'
+        )
+        RoutineExercise.objects.create(
+            routine=self.routine, exercise=self.squat, sets_count=5, order=2 * ORDER_GAP, target_weight='60.00'
+        )
+
+    def tearDown(self):
+        cache.clear()
+
+    def _export(self, fmt):
+        from routines.transfer import export_routines
+        return list(export_routines(Routine.objects.filter(user=self.coach), fmt))
+
+    def test_ndjson_round_trip(self):
+        """Test exported NDJSON imports back with exercises resolved by slug"""
+        from routines.transfer import import_routines, parse_routine_records
+
+        summary = import_routines(parse_routine_records(self._export('ndjson'), 'ndjson'), user=self.user)
+
+        self.assertEqual((summary['routines_created'], summary['exercises_created']), (1, 2))
+        imported = Routine.objects.get(user=self.user)
+        rows = list(imported.routine_exercises.order_by('order'))
+        self.assertEqual([row.exercise_id for row in rows], [self.push_up.id, self.squat.id])
+        self.assertEqual((rows[0].sets_count, rows[0].target_reps), (4, '8-12'))
+        self.assertEqual(str(rows[1].target_weight), '60.00')
+
+    def test_csv_round_trip(self):
+        """Test exported CSV imports back as one routine per routine key"""
+        from routines.transfer import import_routines, parse_routine_records
+        Routine.objects.create(name='Empty Routine', user=self.coach)
+
+        summary = import_routines(parse_routine_records(self._export('csv'), 'csv'))
+
+        self.assertEqual((summary['routines_created'], summary['exercises_created']), (2, 2))
+        self.assertEqual(Routine.objects.filter(user=self.coach, name='Coach Routine').count(), 2)
+
+    def test_unknown_exercise_and_user_reported(self):
+        """Test unknown slugs are skipped and unknown users skip the routine"""
+        import json
+        from routines.transfer import import_routines, parse_routine_records
+        lines = [
+            json.dumps({'key': 'a', 'name': 'A', 'username': 'coach',
+                        'exercises': [{'slug': 'push-up'}, {'slug': 'missing'}]}),
+            json.dumps({'key': 'b', 'name': 'B', 'username': 'nobody', 'exercises': []}),
+            'not json',
+        ]
+
+        summary = import_routines(parse_routine_records(lines, 'ndjson'), chunk_size=2)
+
+        self.assertEqual((summary['routines_created'], summary['exercises_created']), (1, 1))
+        self.assertEqual(summary['error_count'], 3)
+
+    def test_invalid_values_reported(self):
+        """Test out-of-range counts, non-list exercises and string booleans are handled per record"""
+        import json
+        from routines.transfer import import_routines, parse_routine_records
+        lines = [
+            json.dumps({'key': 'a', 'name': 'A', 'username': 'coach', 'is_public': 'false', 'exercises': [
+                {'slug': 'push-up', 'sets_count': -2}, {'slug': 'squat', 'rest_time_seconds': -30},
+            ]}),
+            json.dumps({'key': 'b', 'name': 'B', 'username': 'coach', 'exercises': 5}),
+        ]
+
+        summary = import_routines(parse_routine_records(lines, 'ndjson'))
+
+        self.assertEqual((summary['routines_created'], summary['exercises_created']), (1, 0))
+        self.assertEqual([error['key'] for error in summary['errors']], ['a', 'a', 'b'])
+        self.assertFalse(Routine.objects.get(name='A').is_public)
+
+    def test_unreadable_file_reports_progress(self):
+        """Test a decode error partway through still reports the routines imported before it"""
+        import json
+        from django.core.files.uploadedfile import SimpleUploadedFile
+        self.client.login(username='testuser', password='testpass123!@#')
+        content = (json.dumps({'key': 'a', 'name': 'A', 'exercises': [{'slug': 'push-up'}]}) + '\n').encode()
+        upload = SimpleUploadedFile('routines.ndjson', content + b'\xff\xfe\n')
+
+        response = self.client.post(reverse('routines:import_routines_api'), {'file': upload})
+
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('Could not read file', response.json()['error'])
+        self.assertEqual(response.json()['routines_created'], 1)
+        self.assertTrue(Routine.objects.filter(user=self.user, name='A').exists())
+
+    def test_commands_round_trip(self):
+        """Test the export and import commands through a file"""
+        import os
+        import tempfile
+        from io import StringIO
+        from django.core.management import call_command
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'routines.csv')
+            call_command('export_routines', output=path, user=['coach'], stdout=StringIO())
+            call_command('import_routines', path, user='testuser', stdout=StringIO(), stderr=StringIO())
+
+        self.assertEqual(Routine.objects.get(user=self.user).routine_exercises.count(), 2)
+
+    def test_export_endpoint_streams_own_routines(self):
+        """Test the export endpoint streams only the user's routines"""
+        self.client.login(username='coach', password='testpass123!@#')
+
+        response = self.client.get(reverse('routines:export_routines_api'))
+
+        self.assertEqual(response.status_code, 200)
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(len(lines), 1)
+        self.assertIn('push-up', lines[0])
+
+    def test_import_endpoint(self):
+        """Test uploading an export imports it into the user's account"""
+        from django.core.files.uploadedfile import SimpleUploadedFile
+        self.client.login(username='testuser', password='testpass123!@#')
+        upload = SimpleUploadedFile('routines.ndjson', ''.join(self._export('ndjson')).encode())
+
+        response = self.client.post(reverse('routines:import_routines_api'), {'file': upload})
+
+        self.assertEqual(response.json()['routines_created'], 1)
+        self.assertTrue(Routine.objects.filter(user=self.user, name='Coach Routine').exists())
+
+    def test_transfer_endpoints_require_authentication(self):
+        """Test import and export require authentication"""
+        self.assertEqual(self.client.get(reverse('routines:export_routines_api')).status_code, 401)
+        self.assertEqual(self.client.post(reverse('routines:import_routines_api')).status_code, 401)
+
+
+class SimilarRoutinesTests(TestCase):
+    """Test vectorised similar-routine search"""
+
+    def setUp(self):
+        from routines.similarity import reset_similarity_index
+        reset_similarity_index()
+        self.client = Client()
+        self.user = User.objects.create_user(
+            username='testuser',
+            password='testpass123!@#'
+        )
+        self.coach = User.objects.create_user(username='coach', password='testpass123!@#')
+        self.bench = Exercise.objects.create(title='Bench', slug='bench', equipment='barbell', muscle='chest')
+        self.fly = Exercise.objects.create(title='Fly', slug='fly', equipment='dumbbells', muscle='chest')
+        self.dip = Exercise.objects.create(title='Dip', slug='dip', equipment='bodyweight', muscle='triceps')
+        self.squat = Exercise.objects.create(title='Squat', slug='squat', equipment='barbell', muscle='quads')
+        self.lunge = Exercise.objects.create(title='Lunge', slug='lunge', equipment='dumbbells', muscle='quads')
+
+        self.mine = self._routine('My Push', self.user, [self.bench, self.fly], is_public=False)
+        self.push = self._routine('Coach Push', self.coach, [self.bench, self.fly, self.dip])
+        self.legs = self._routine('Coach Legs', self.coach, [self.squat, self.lunge])
+        self.chest_only = self._routine('Chest Day', self.coach, [self.bench])
+
+    def _routine(self, name, user, exercises, is_public=True):
+        routine = Routine.objects.create(name=name, user=user, is_public=is_public)
+        for i, exercise in enumerate(exercises):
+            RoutineExercise.objects.create(routine=routine, exercise=exercise, sets_count=3, order=(i + 1) * ORDER_GAP)
+        return routine
+
+    def _similar(self, routine):
+        self.client.login(username='testuser', password='testpass123!@#')
+        response = self.client.get(reverse('routines:similar_routines_api', kwargs={'routine_id': routine.id}))
+        return response
+
+    def test_encode_routine_is_normalised(self):
+        """Test encoded vectors are sorted and have unit length"""
+        from routines.similarity import encode_routine
+        indices, weights = encode_routine([(1, 'chest', 'barbell', 3), (2, 'chest', 'dumbbells', 4)])
+
+        self.assertEqual(indices, sorted(indices))
+        self.assertAlmostEqual(sum(weight * weight for weight in weights), 1.0, places=4)
+
+    def test_refresh_only_rebuilds_stale_vectors(self):
+        """Test the refresh writes new and changed public routines only"""
+        from routines.similarity import refresh_routine_vectors
+        self.assertEqual(refresh_routine_vectors(), (3, 0))
+        self.assertEqual(refresh_routine_vectors(), (0, 0))
+
+        self.legs.save()
+        self.chest_only.is_public = False
+        self.chest_only.save()
+
+        self.assertEqual(refresh_routine_vectors(), (1, 1))
+
+    def test_similar_routines_ranked_by_cosine(self):
+        """Test the closest public routines come first"""
+        from routines.similarity import refresh_routine_vectors
+        refresh_routine_vectors()
+
+        response = self._similar(self.mine)
+
+        self.assertEqual(response.status_code, 200)
+        names = [routine['name'] for routine in response.json()['routines']]
+        # Legs only shares equipment, so it ranks last
+        self.assertEqual(names, ['Coach Push', 'Chest Day', 'Coach Legs'])
+
+    def test_similar_routines_skip_routines_gone_private(self):
+        """Test candidates are re-checked against the database"""
+        from routines.similarity import refresh_routine_vectors
+        refresh_routine_vectors()
+        Routine.objects.filter(id=self.push.id).update(is_public=False)
+
+        names = [routine['name'] for routine in self._similar(self.mine).json()['routines']]
+
+        self.assertNotIn('Coach Push', names)
+
+    def test_index_picks_up_late_committed_vectors(self):
+        """Test a vector stamped before the last synced row but committed after it still reaches the index"""
+        from datetime import timedelta
+        from django.utils import timezone
+        from routines.models import RoutineVector
+        from routines.similarity import SimilarityIndex, refresh_routine_vectors
+        refresh_routine_vectors()
+        index = SimilarityIndex()
+        index.sync(force=True)
+        self.assertEqual(len(index), 3)
+
+        late = self._routine('Late Legs', self.coach, [self.squat])
+        refresh_routine_vectors()
+        RoutineVector.objects.filter(routine=late).update(updated_at=timezone.now() - timedelta(minutes=1))
+        index.sync(force=True)
+
+        self.assertEqual(len(index), 4)
+
+    def test_query_scores_match_dot_products(self):
+        """Test index scores equal the dot product of the query with each stored vector"""
+        from routines.similarity import SimilarityIndex, encode_routines, refresh_routine_vectors
+        refresh_routine_vectors()
+        index = SimilarityIndex()
+        index.sync(force=True)
+        routines = [self.mine, self.push, self.legs, self.chest_only]
+        vectors = {
+            routine_id: dict(zip(*vector)) for routine_id, vector in encode_routines(routines).items()
+        }
+        query = vectors[self.mine.id]
+
+        scores = dict(index.query(list(query), list(query.values())))
+
+        for routine in routines[1:]:
+            expected = sum(weight * vectors[routine.id].get(feature, 0) for feature, weight in query.items())
+            self.assertAlmostEqual(scores[routine.id], expected, places=5)
+
+    def test_private_routine_of_other_user_not_found(self):
+        """Test similar routines of another user's private routine are not exposed"""
+        self.client.login(username='coach', password='testpass123!@#')
+        response = self.client.get(reverse('routines:similar_routines_api', kwargs={'routine_id': self.mine.id}))
+        self.assertEqual(response.status_code, 404)
+
+
 class RoutineCreateWithFiltersTests(TestCase):
     """Test routine create view with exercise filters"""
 
@@ -753,3 +1487,333 @@ class RoutineCreateWithInvalidDataTests(TestCase):
         self.assertIsNotNone(routine)
         # Should have 2 valid exercises
         self.assertEqual(routine.routine_exercises.count(), 2)
+
+
+class PublicRoutineFeedTests(TestCase):
+    """Test keyset pagination of the public routine feed"""
+
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(
+            username='testuser',
+            password='testpass123!@#'
+        )
+        self.exercise = Exercise.objects.create(
+            title='Push-up',
+            slug='push-up',
+            equipment='bodyweight'
+        )
+        self.routines = [
+            Routine.objects.create(name=f'Public Routine {i}', user=self.user, is_public=True)
+            for i in range(15)
+        ]
+        RoutineExercise.objects.create(
+            routine=self.routines[-1],
+            exercise=self.exercise,
+            sets_count=4,
+            order=0
+        )
+
+    def test_public_routines_api_first_page(self):
+        """Test the first page is capped and returns a cursor"""
+        response = self.client.get(reverse('routines:public_routines_api'))
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+
+        self.assertEqual(len(data['routines']), 12)
+        self.assertIsNotNone(data['next_cursor'])
+        # Newest first, with annotated stats
+        self.assertEqual(data['routines'][0]['id'], self.routines[-1].id)
+        self.assertEqual(data['routines'][0]['exercise_count'], 1)
+        self.assertEqual(data['routines'][0]['estimated_duration'], 12)
+
+    def test_public_routines_api_follows_cursor(self):
+        """Test following the cursor returns the remaining routines without overlap"""
+        first = self.client.get(reverse('routines:public_routines_api')).json()
+        second = self.client.get(
+            reverse('routines:public_routines_api'), {'cursor': first['next_cursor']}
+        ).json()
+
+        self.assertEqual(len(second['routines']), 3)
+        self.assertIsNone(second['next_cursor'])
+        seen = {r['id'] for r in first['routines']} | {r['id'] for r in second['routines']}
+        self.assertEqual(seen, {r.id for r in self.routines})
+
+    def test_public_routines_api_invalid_cursor_returns_first_page(self):
+        """Test an invalid cursor falls back to the first page"""
+        response = self.client.get(reverse('routines:public_routines_api'), {'cursor': 'not-a-cursor'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['routines']), 12)
+
+    def test_routine_list_shows_load_more_link(self):
+        """Test the routine list renders a single page with a load more link"""
+        response = self.client.get(reverse('routines:routine_list'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context['public_routines']), 12)
+        self.assertContains(response, 'Load More Routines')
+        # The link is wired to the JSON feed for in-place loading
+        next_cursor = response.context['next_cursor']
+        self.assertContains(
+            response, f'data-feed-url="{reverse("routines:public_routines_api")}?cursor={next_cursor}"'
+        )
+        self.assertContains(response, 'data-public-feed')
+
+
+class RoutinePopularityTests(TestCase):
+    """Test copy/start counters and the cached trending list"""
+
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.user = User.objects.create_user(
+            username='testuser',
+            password='testpass123!@#'
+        )
+        self.owner = User.objects.create_user(
+            username='owner',
+            password='testpass123!@#'
+        )
+        self.popular = Routine.objects.create(name='Popular Routine', user=self.owner, is_public=True)
+        self.stale = Routine.objects.create(name='Stale Routine', user=self.owner, is_public=True)
+
+    def tearDown(self):
+        cache.clear()
+
+    def test_copy_and_start_record_activity(self):
+        """Test copying and starting a routine bump its counters"""
+        self.client.login(username='testuser', password='testpass123!@#')
+        self.client.get(reverse('routines:routine_copy', kwargs={'routine_id': self.popular.id}))
+        self.client.get(reverse('routines:routine_start', kwargs={'routine_id': self.popular.id}))
+
+        self.popular.refresh_from_db()
+        self.assertEqual(self.popular.copy_count, 1)
+        self.assertEqual(self.popular.start_count, 1)
+        self.assertEqual(RoutineActivity.objects.filter(routine=self.popular).count(), 2)
+
+    def test_recompute_popularity_decays_old_activity(self):
+        """Test recent activity outranks older activity of the same kind"""
+        RoutineActivity.objects.create(routine=self.popular, kind='copy')
+        RoutineActivity.objects.create(
+            routine=self.stale, kind='copy', created_at=timezone.now() - timedelta(days=14)
+        )
+
+        self.assertEqual(recompute_popularity(), 2)
+
+        self.popular.refresh_from_db()
+        self.stale.refresh_from_db()
+        self.assertAlmostEqual(self.popular.popularity_score, 3.0)
+        self.assertAlmostEqual(self.stale.popularity_score, 0.75)
+        self.assertEqual([r['id'] for r in get_trending_routines()], [self.popular.id, self.stale.id])
+
+    def test_update_command_prunes_activity_outside_window(self):
+        """Test the update command deletes activity that no longer counts towards popularity"""
+        from io import StringIO
+        from django.core.management import call_command
+        RoutineActivity.objects.create(routine=self.popular, kind='copy')
+        RoutineActivity.objects.create(
+            routine=self.stale, kind='copy', created_at=timezone.now() - timedelta(days=90)
+        )
+
+        out = StringIO()
+        call_command('update_popularity', stdout=out)
+
+        self.assertEqual(list(RoutineActivity.objects.values_list('routine_id', flat=True)), [self.popular.id])
+        self.assertIn('pruned 1 old activity rows', out.getvalue())
+
+    def test_routine_list_reads_trending_from_cache(self):
+        """Test routine list serves the trending list without ranking queries"""
+        RoutineActivity.objects.create(routine=self.popular, kind='start')
+        recompute_popularity()
+
+        with self.assertNumQueries(1):
+            # Only the public feed page hits the database
+            response = self.client.get(reverse('routines:routine_list'))
+        self.assertContains(response, 'Trending Routines')
+
+    def test_making_routine_private_drops_it_from_trending(self):
+        """Test a routine made private disappears from the cached trending list"""
+        RoutineActivity.objects.create(routine=self.popular, kind='copy')
+        recompute_popularity()
+
+        self.client.login(username='owner', password='testpass123!@#')
+        self.client.post(reverse('routines:routine_edit', kwargs={'routine_id': self.popular.id}), {
+            'name': 'Popular Routine',
+        })
+
+        self.assertEqual(get_trending_routines(), [])
+
+
+class RoutineGeneratorTests(TestCase):
+    """Test pool-based routine generation"""
+
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(
+            username='testuser',
+            password='testpass123!@#'
+        )
+        muscles = ['chest', 'shoulders', 'triceps', 'lats', 'biceps', 'quads', 'hamstrings', 'abdominals']
+        for muscle in muscles:
+            for i in range(3):
+                Exercise.objects.create(
+                    title=f'{muscle} exercise {i}',
+                    slug=f'{muscle}-exercise-{i}',
+                    equipment='dumbbells',
+                    muscle=muscle
+                )
+
+    def test_generate_routine_exercises_uses_one_query(self):
+        """Test candidates are loaded once and sampled without replacement"""
+        from routines.views import generate_routine_exercises
+
+        with self.assertNumQueries(1):
+            exercises = generate_routine_exercises(['chest', 'biceps'], 'dumbbells', 5)
+
+        self.assertEqual(len(exercises), 5)
+        self.assertEqual(len({e.id for e in exercises}), 5)
+        self.assertEqual({e.muscle for e in exercises[:2]}, {'chest', 'biceps'})
+        self.assertTrue(all(e.muscle in ('chest', 'biceps') for e in exercises))
+
+    def test_generate_routine_exercises_stops_when_pool_exhausted(self):
+        """Test generation returns fewer exercises when candidates run out"""
+        from routines.views import generate_routine_exercises
+
+        exercises = generate_routine_exercises(['chest'], ['mixed'], 5)
+        self.assertEqual(len(exercises), 3)
+
+    def test_three_day_split_has_no_repeated_exercises(self):
+        """Test the 3-day split creates three routines without repeating exercises"""
+        self.client.login(username='testuser', password='testpass123!@#')
+
+        response = self.client.post(reverse('routines:routine_generator'), {
+            'routine_name': 'My Split',
+            'category': '3_day_split',
+            'equipment': 'dumbbells',
+        })
+
+        self.assertEqual(response.status_code, 302)
+        routines = Routine.objects.filter(user=self.user)
+        self.assertEqual(routines.count(), 3)
+        exercise_ids = list(RoutineExercise.objects.filter(routine__in=routines).values_list('exercise_id', flat=True))
+        self.assertEqual(len(exercise_ids), len(set(exercise_ids)))
+
+
+class ProgramBatchTests(TestCase):
+    """Test batch multi-week program generation"""
+
+    def setUp(self):
+        self.client = Client()
+        self.coach = User.objects.create_user(
+            username='coach',
+            password='testpass123!@#',
+            is_staff=True
+        )
+        self.clients = [User.objects.create(username=f'client{i}') for i in range(3)]
+        for muscle in ['chest', 'lats', 'quads']:
+            for i in range(4):
+                Exercise.objects.create(
+                    title=f'{muscle} exercise {i}',
+                    slug=f'{muscle}-exercise-{i}',
+                    equipment='barbell',
+                    muscle=muscle
+                )
+        self.url = reverse('routines:program_batch_api')
+
+    def _post(self, payload):
+        import json
+        return self.client.post(self.url, data=json.dumps(payload), content_type='application/json')
+
+    def test_program_batch_requires_staff(self):
+        """Test non-staff users cannot generate programs for others"""
+        User.objects.create_user(username='member', password='testpass123!@#')
+        self.client.login(username='member', password='testpass123!@#')
+
+        response = self._post({'usernames': ['client0'], 'split': '3_day_split'})
+        self.assertEqual(response.status_code, 403)
+
+    def test_program_batch_generates_weeks_for_all_users(self):
+        """Test every user gets weeks x days private routines without repeats within a week"""
+        self.client.login(username='coach', password='testpass123!@#')
+
+        response = self._post({
+            'usernames': [user.username for user in self.clients],
+            'weeks': 2,
+            'categories': ['chest', 'back', 'legs'],
+            'equipment': ['barbell'],
+            'exercises_per_day': 2,
+        })
+
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(data['routines_created'], 18)
+        self.assertEqual(data['exercises_created'], 36)
+        self.assertIn('routines_per_second', data)
+
+        week_one = Routine.objects.filter(user=self.clients[0], name__contains='Week 1')
+        self.assertEqual(week_one.count(), 3)
+        self.assertFalse(week_one.filter(is_public=True).exists())
+        exercise_ids = list(
+            RoutineExercise.objects.filter(routine__in=week_one).values_list('exercise_id', flat=True)
+        )
+        self.assertEqual(len(exercise_ids), len(set(exercise_ids)))
+
+    def test_program_batch_rejects_unknown_split(self):
+        """Test an unknown split returns a 400"""
+        self.client.login(username='coach', password='testpass123!@#')
+
+        response = self._post({'usernames': ['client0'], 'split': 'nope'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_program_batch_rejects_bad_usernames(self):
+        """Test usernames that are not a list of strings return a 400"""
+        self.client.login(username='coach', password='testpass123!@#')
+
+        for usernames in ['client0', ['client0', {'name': 'client1'}]]:
+            response = self._post({'usernames': usernames, 'split': '3_day_split'})
+            self.assertEqual(response.status_code, 400)
+        self.assertFalse(Routine.objects.exists())
+
+    def test_json_endpoints_reject_non_object_bodies(self):
+        """Test valid JSON that is not an object gets the invalid JSON 400, not a 500"""
+        self.client.login(username='coach', password='testpass123!@#')
+        routine = Routine.objects.create(name='Coach Routine', user=User.objects.get(username='coach'))
+        exercise = Exercise.objects.first()
+        RoutineExercise.objects.create(routine=routine, exercise=exercise, order=ORDER_GAP)
+        urls = [
+            self.url,
+            reverse('routines:add_exercise_to_routine', kwargs={'routine_id': routine.id}),
+            reverse('routines:bulk_edit_routine_exercises', kwargs={'routine_id': routine.id}),
+            reverse('routines:move_routine_exercise', kwargs={'routine_id': routine.id, 'exercise_id': exercise.id}),
+        ]
+
+        for url in urls:
+            for body in ('[]', '"x"', '3'):
+                response = self.client.post(url, data=body, content_type='application/json')
+                self.assertEqual(response.status_code, 400, (url, body))
+                self.assertEqual(response.json(), {'error': 'Invalid JSON'})
+
+    def test_program_batch_caps_total_routines(self):
+        """Test a batch whose users × weeks × days is too large is refused before anything is created"""
+        self.client.login(username='coach', password='testpass123!@#')
+
+        response = self._post({
+            'usernames': [user.username for user in self.clients],
+            'weeks': 52,
+            'categories': ['chest', 'back', 'legs'] * 4 + ['chest'],  # 3 × 52 × 13 = 2028 routines
+        })
+
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('generate_programs', response.json()['error'])
+        self.assertFalse(Routine.objects.exists())
+
+    def test_generate_programs_command(self):
+        """Test the management command generates programs and reports throughput"""
+        from io import StringIO
+        from django.core.management import call_command
+
+        out = StringIO()
+        call_command('generate_programs', 'client0', 'client1', '--weeks', '1',
+                     '--categories', 'chest', '--equipment', 'barbell', stdout=out)
+
+        self.assertEqual(Routine.objects.filter(user__in=self.clients[:2]).count(), 2)
+        self.assertIn('routines/s', out.getvalue())
@@ -0,0 +1,297 @@
+"""
+Streaming routine import/export as NDJSON or CSV.
+
+Exports read routines with a chunked iterator and fetch each chunk's exercise
+rows in one query. Imports parse records lazily and write them in batches
+with bulk_create. Either way memory stays bounded by the chunk size, not the
+library size. Exercises are referenced by slug so libraries can move between
+databases.
+
+NDJSON holds one routine per line:
+    {"key": "12", "name": "...", "description": "...", "username": "...", "is_public": false,
+     "exercises": [{"slug": "push-up", "sets_count": 3, "rest_time_seconds": 60,
+                    "target_reps": "8-12", "target_weight": "20.00"}]}
+
+CSV holds one exercise per row, with the routine columns repeated; rows for
+the same routine are consecutive and share `routine_key`. A routine without
+exercises is written as a single row with an empty `exercise_slug`.
+"""
+import csv
+import json
+from decimal import Decimal, InvalidOperation
+from itertools import groupby, islice
+
+from django.contrib.auth.models import User
+from django.db import transaction
+
+from exercises.models import Exercise
+from .models import Routine, RoutineExercise, ORDER_GAP
+from .summaries import invalidate_user_routines
+
+FORMATS = ('ndjson', 'csv')
+DEFAULT_CHUNK_SIZE = 500
+
+CSV_FIELDS = [
+    'routine_key', 'routine_name', 'description', 'username', 'is_public',
+    'exercise_slug', 'sets_count', 'rest_time_seconds', 'target_reps', 'target_weight',
+]
+
+MAX_REPORTED_ERRORS = 50
+
+
+def _parse_bool(value):
+    return str(value).lower() in ('true', '1', 'yes')
+
+
+class _Echo:
+    """File-like object whose write() returns the value, so csv.writer can feed a generator"""
+
+    def write(self, value):
+        return value
+
+
+def _chunked(iterable, size):
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+def iter_routine_records(routines, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Yield export records (dicts) for a routine queryset, one chunk of routines at a time.
+
+    Copies that still share their source's exercises export the source's rows.
+    """
+    routines = routines.select_related('user').order_by('id')
+    for chunk in _chunked(routines.iterator(chunk_size=chunk_size), chunk_size):
+        rows_by_owner = {}
+        exercise_rows = (
+            RoutineExercise.objects.filter(routine_id__in={routine.exercise_owner_id for routine in chunk})
+            .exclude(exercise__slug__isnull=True).exclude(exercise__slug='')
+            .order_by('routine_id', 'order')
+            .values_list('routine_id', 'exercise__slug', 'sets_count', 'rest_time_seconds',
+                         'target_reps', 'target_weight')
+        )
+        for routine_id, slug, sets_count, rest_time_seconds, target_reps, target_weight in exercise_rows:
+            rows_by_owner.setdefault(routine_id, []).append({
+                'slug': slug,
+                'sets_count': sets_count,
+                'rest_time_seconds': rest_time_seconds,
+                'target_reps': target_reps,
+                'target_weight': str(target_weight) if target_weight is not None else None,
+            })
+
+        for routine in chunk:
+            yield {
+                'key': str(routine.id),
+                'name': routine.name,
+                'description': routine.description,
+                'username': routine.user.username,
+                'is_public': routine.is_public,
+                'exercises': rows_by_owner.get(routine.exercise_owner_id, []),
+            }
+
+
+def export_ndjson(routines, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Yield NDJSON lines for a routine queryset"""
+    for record in iter_routine_records(routines, chunk_size):
+        yield json.dumps(record) + '\n'
+
+
+def export_csv(routines, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Yield CSV lines (header first) for a routine queryset"""
+    writer = csv.writer(_Echo())
+    yield writer.writerow(CSV_FIELDS)
+    for record in iter_routine_records(routines, chunk_size):
+        routine_columns = [
+            record['key'], record['name'], record['description'], record['username'], record['is_public'],
+        ]
+        if not record['exercises']:
+            yield writer.writerow(routine_columns + ['', '', '', '', ''])
+        for exercise in record['exercises']:
+            yield writer.writerow(routine_columns + [
+                exercise['slug'], exercise['sets_count'], exercise['rest_time_seconds'],
+                exercise['target_reps'], exercise['target_weight'] or '',
+            ])
+
+
+def export_routines(routines, fmt, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Yield the export of a routine queryset in the given format"""
+    if fmt not in FORMATS:
+        raise ValueError(f'Unknown format: {fmt}')
+    return export_csv(routines, chunk_size) if fmt == 'csv' else export_ndjson(routines, chunk_size)
+
+
+def _parse_ndjson(lines):
+    for line_number, line in enumerate(lines, start=1):
+        if isinstance(line, bytes):
+            line = line.decode('utf-8')
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except json.JSONDecodeError:
+            record = None
+        yield record if isinstance(record, dict) else {'error': f'Line {line_number}: invalid JSON'}
+
+
+def _parse_csv(lines):
+    lines = (line.decode('utf-8') if isinstance(line, bytes) else line for line in lines)
+    rows = csv.DictReader(lines)
+    for key, routine_rows in groupby(rows, key=lambda row: row.get('routine_key')):
+        routine_rows = list(routine_rows)
+        first = routine_rows[0]
+        yield {
+            'key': key,
+            'name': first.get('routine_name'),
+            'description': first.get('description', ''),
+            'username': first.get('username'),
+            'is_public': _parse_bool(first.get('is_public', '')),
+            'exercises': [
+                {
+                    'slug': row['exercise_slug'],
+                    'sets_count': row.get('sets_count') or 3,
+                    'rest_time_seconds': row.get('rest_time_seconds') or 60,
+                    'target_reps': row.get('target_reps', ''),
+                    'target_weight': row.get('target_weight') or None,
+                }
+                for row in routine_rows if row.get('exercise_slug')
+            ],
+        }
+
+
+def parse_routine_records(lines, fmt):
+    """Lazily parse NDJSON or CSV lines (str or bytes) into routine records"""
+    if fmt not in FORMATS:
+        raise ValueError(f'Unknown format: {fmt}')
+    return _parse_csv(lines) if fmt == 'csv' else _parse_ndjson(lines)
+
+
+class _Importer:
+    """Writes parsed records in batches, resolving slugs and usernames once per distinct value"""
+
+    def __init__(self, user=None):
+        self.user = user
+        self.exercise_ids = {}
+        self.user_ids = {}
+        self.summary = {'routines_created': 0, 'exercises_created': 0, 'errors': [], 'error_count': 0}
+
+    def _error(self, record, message):
+        self.summary['error_count'] += 1
+        if len(self.summary['errors']) < MAX_REPORTED_ERRORS:
+            self.summary['errors'].append({'key': record.get('key'), 'error': message})
+
+    def read(self, records):
+        """Yield records until the input can no longer be decoded, noting why in the summary"""
+        try:
+            yield from records
+        except (UnicodeDecodeError, csv.Error) as e:
+            # Batches before this point are already committed; the summary says how many
+            self.summary['read_error'] = f'Could not read file: {e}'
+
+    def _resolve(self, batch):
+        slugs = {
+            exercise.get('slug')
+            for record in batch if isinstance(record.get('exercises'), list)
+            for exercise in record['exercises'] if isinstance(exercise, dict)
+        }
+        unknown_slugs = slugs - self.exercise_ids.keys()
+        if unknown_slugs:
+            self.exercise_ids.update(
+                Exercise.objects.filter(slug__in=unknown_slugs).order_by().values_list('slug', 'id')
+            )
+        if self.user is None:
+            usernames = {record.get('username') for record in batch} - self.user_ids.keys()
+            if usernames:
+                self.user_ids.update(User.objects.filter(username__in=usernames).values_list('username', 'id'))
+
+    def _build(self, record):
+        """Return an unsaved routine and its unsaved rows, or None if the record is unusable"""
+        if 'error' in record:
+            self._error(record, record['error'])
+            return None
+        if not record.get('name'):
+            self._error(record, 'Routine name is required')
+            return None
+
+        exercises = record.get('exercises')
+        if exercises is None:
+            exercises = []
+        if not isinstance(exercises, list):
+            self._error(record, 'exercises must be a list')
+            return None
+
+        user_id = self.user.id if self.user is not None else self.user_ids.get(record.get('username'))
+        if user_id is None:
+            self._error(record, f"Unknown user: {record.get('username')}")
+            return None
+
+        routine = Routine(
+            name=str(record['name'])[:200],
+            description=record.get('description') or '',
+            user_id=user_id,
+            is_public=_parse_bool(record.get('is_public')),
+        )
+        rows = []
+        seen = set()
+        for exercise in exercises:
+            if not isinstance(exercise, dict):
+                self._error(record, 'Each exercise must be an object')
+                continue
+            exercise_id = self.exercise_ids.get(exercise.get('slug'))
+            if exercise_id is None:
+                self._error(record, f"Unknown exercise: {exercise.get('slug')}")
+                continue
+            if exercise_id in seen:
+                continue
+            try:
+                target_weight = exercise.get('target_weight')
+                sets_count = int(exercise.get('sets_count') or 3)
+                rest_time_seconds = int(exercise.get('rest_time_seconds') or 60)
+                if sets_count < 1 or rest_time_seconds < 0:
+                    raise ValueError('Out of range')
+                rows.append(RoutineExercise(
+                    routine=routine,
+                    exercise_id=exercise_id,
+                    sets_count=sets_count,
+                    rest_time_seconds=rest_time_seconds,
+                    order=(len(rows) + 1) * ORDER_GAP,
+                    target_reps=str(exercise.get('target_reps') or '')[:50],
+                    target_weight=Decimal(str(target_weight)) if target_weight not in (None, '') else None,
+                ))
+            except (TypeError, ValueError, InvalidOperation):
+                self._error(record, f"Invalid values for exercise: {exercise.get('slug')}")
+                continue
+            seen.add(exercise_id)
+        return routine, rows
+
+    def write_batch(self, batch):
+        self._resolve(batch)
+        built = [result for result in map(self._build, batch) if result is not None]
+        if not built:
+            return
+
+        with transaction.atomic():
+            routines = Routine.objects.bulk_create([routine for routine, _ in built])
+            rows = [row for _, routine_rows in built for row in routine_rows]
+            RoutineExercise.objects.bulk_create(rows, batch_size=1000)
+            invalidate_user_routines(*(routine.user_id for routine in routines))
+
+        self.summary['routines_created'] += len(routines)
+        self.summary['exercises_created'] += len(rows)
+
+
+def import_routines(records, user=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Create routines from an iterable of records, chunk_size routines per transaction.
+
+    Routines are assigned to `user` if given, otherwise to the user named in
+    each record. Unknown exercises are skipped and reported; records that
+    cannot be imported at all are reported and skipped. Returns a summary dict;
+    if the input stops decoding partway, the records before that point are
+    still imported and `read_error` says why the rest was not.
+    """
+    importer = _Importer(user)
+    for batch in _chunked(importer.read(records), chunk_size):
+        importer.write_batch(batch)
+    return importer.summary
@@ -15,5 +15,12 @@ urlpatterns = [
     
     # API endpoints
     path('api/user-routines/', views.user_routines_api, name='user_routines_api'),
+    path('api/public-routines/', views.public_routines_api, name='public_routines_api'),
+    path('api/programs/generate/', views.program_batch_api, name='program_batch_api'),
+    path('api/export/', views.export_routines_api, name='export_routines_api'),
+    path('api/import/', views.import_routines_api, name='import_routines_api'),
+    path('<int:routine_id>/similar/', views.similar_routines_api, name='similar_routines_api'),
     path('<int:routine_id>/add-exercise/', views.add_exercise_to_routine, name='add_exercise_to_routine'),
+    path('<int:routine_id>/exercises/bulk/', views.bulk_edit_routine_exercises, name='bulk_edit_routine_exercises'),
+    path('<int:routine_id>/exercises/<int:exercise_id>/move/', views.move_routine_exercise, name='move_routine_exercise'),
 ]
\ No newline at end of file
@@ -1,13 +1,30 @@
 from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib import messages
 from django.contrib.auth.models import User
-from django.http import JsonResponse
+from django.core.cache import cache
+from django.http import JsonResponse, StreamingHttpResponse
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
 from django.views.decorators.http import require_POST
 from django.views.decorators.csrf import csrf_exempt
+from django.db import transaction
 from django.db.models import Q
+from django.utils.encoding import force_str
+from django.utils.http import urlsafe_base64_encode, urlsafe_base64_decode
+from datetime import datetime
 import json
-import random
-from .models import Routine, RoutineExercise
+from .models import Routine, RoutineExercise, RoutineEditRequest, ORDER_GAP, assign_order_keys
+from .popularity import record_activity, get_trending_routines, invalidate_trending_cache
+from .summaries import (
+    MINUTES_PER_SET, with_routine_stats, get_user_routine_summaries, invalidate_user_routines,
+    routine_exercises_changed,
+)
+from .similarity import find_similar_routines
+from .transfer import export_routines, import_routines, parse_routine_records, FORMATS as TRANSFER_FORMATS
+from .generator import (
+    CandidatePool, expand_equipment, select_exercises, generate_programs,
+    get_special_splits, get_muscle_group_categories, resolve_program_days,
+)
 from exercises.models import Exercise, MuscleGroup
 from workouts.models import WorkoutSession
 
@@ -17,83 +34,219 @@ ROUTINE_GENERATOR_TEMPLATE = 'routines/routine_generator.html'
 ROUTINE_LIST_URL = 'routines:routine_list'
 LOGIN_URL = 'accounts:login'
 
+# Public feed settings
+PUBLIC_FEED_PAGE_SIZE = 12
+
+# Routine detail exercise list fragment cache
+ROUTINE_EXERCISES_CACHE_KEY = 'routines:{routine_id}:exercises:{owner_id}:v{version}'
+ROUTINE_EXERCISES_CACHE_TIMEOUT = 60 * 60 * 24  # Exercise edits in the admin are picked up within a day
+
+# Similar routine search
+SIMILAR_ROUTINES_DEFAULT = 10
+SIMILAR_ROUTINES_MAX = 50
+
+# Bulk routine edit limit
+MAX_BULK_EDIT_ITEMS = 200
+
+# Batch program generation limits
+MAX_PROGRAM_BATCH_USERS = 500
+MAX_PROGRAM_WEEKS = 52
+MAX_PROGRAM_BATCH_ROUTINES = 2000  # users × weeks × days per request; use the generate_programs command beyond
+
+
+def _encode_feed_cursor(routine):
+    """Encode the (created_at, id) keyset position of a routine as an opaque cursor"""
+    position = f"{routine.created_at.isoformat()}|{routine.id}"
+    return urlsafe_base64_encode(position.encode())
+
+
+def _decode_feed_cursor(cursor):
+    """Decode a feed cursor, returning (created_at, id) or None if it is missing or invalid"""
+    if not cursor:
+        return None
+    try:
+        created_at, routine_id = force_str(urlsafe_base64_decode(cursor)).split('|')
+        return datetime.fromisoformat(created_at), int(routine_id)
+    except (ValueError, TypeError, UnicodeDecodeError):
+        return None
+
+
+def _public_routine_feed(cursor, exclude_user=None):
+    """
+    Return one page of public routines, newest first, and the cursor for the next page.
+
+    Keyset pagination on (-created_at, -id) keeps every page a bounded index range
+    scan, however many public routines exist.
+    """
+    routines = Routine.objects.filter(is_public=True, is_active=True).select_related('user')
+    if exclude_user is not None:
+        routines = routines.exclude(user=exclude_user)
+
+    position = _decode_feed_cursor(cursor)
+    if position:
+        created_at, routine_id = position
+        routines = routines.filter(
+            Q(created_at__lt=created_at) |
+            Q(created_at=created_at, id__lt=routine_id)
+        )
+
+    page = list(with_routine_stats(routines).order_by('-created_at', '-id')[:PUBLIC_FEED_PAGE_SIZE + 1])
+    next_cursor = None
+    if len(page) > PUBLIC_FEED_PAGE_SIZE:
+        page = page[:PUBLIC_FEED_PAGE_SIZE]
+        next_cursor = _encode_feed_cursor(page[-1])
+    return page, next_cursor
+
 
 def routine_list(request):
+    cursor = request.GET.get('cursor', '')
+
     if request.user.is_authenticated:
         # Show user's own routines + public routines from others
-        user_routines = Routine.objects.filter(user=request.user, is_active=True)
-        public_routines = Routine.objects.filter(is_public=True, is_active=True).exclude(user=request.user)
+        user_routines = with_routine_stats(Routine.objects.filter(user=request.user, is_active=True))
+        public_routines, next_cursor = _public_routine_feed(cursor, exclude_user=request.user)
         
         context = {
             'user_routines': user_routines,
             'public_routines': public_routines,
+            'next_cursor': next_cursor,
+            'trending_routines': get_trending_routines(),
             'user': request.user,
         }
     else:
         # Anonymous users see only public routines
-        public_routines = Routine.objects.filter(is_public=True, is_active=True)
+        public_routines, next_cursor = _public_routine_feed(cursor)
         
         context = {
             'public_routines': public_routines,
+            'next_cursor': next_cursor,
+            'trending_routines': get_trending_routines(),
             'user': None,
         }
     
     return render(request, 'routines/routine_list.html', context)
 
 
+def public_routines_api(request):
+    """API endpoint returning one page of the public routine feed for infinite scroll"""
+    exclude_user = request.user if request.user.is_authenticated else None
+    public_routines, next_cursor = _public_routine_feed(request.GET.get('cursor', ''), exclude_user=exclude_user)
+
+    routine_data = []
+    for routine in public_routines:
+        routine_data.append({
+            'id': routine.id,
+            'name': routine.name,
+            'description': routine.description,
+            'username': routine.user.username,
+            'created_at': routine.created_at.isoformat(),
+            'exercise_count': routine.exercise_count,
+            'estimated_duration': routine.estimated_duration,
+        })
+
+    return JsonResponse({'routines': routine_data, 'next_cursor': next_cursor})
+
+
+def _routine_exercise_fragment(routine):
+    """
+    Return the rendered exercise list and stats for a routine, cached per routine version.
+
+    The key includes the version of the routine that owns the exercise rows
+    (the source, for a copy that still shares them), so any edit switches to a
+    fresh key and stale fragments simply expire.
+    """
+    owner = routine.source if routine.exercise_owner_id != routine.id else routine
+    key = ROUTINE_EXERCISES_CACHE_KEY.format(routine_id=routine.id, owner_id=owner.id, version=owner.version)
+    fragment = cache.get(key)
+    if fragment is None:
+        routine_exercises = list(routine.get_routine_exercises().select_related('exercise'))
+        total_sets = sum(re.sets_count for re in routine_exercises)
+        fragment = {
+            'html': render_to_string('routines/routine_exercise_list.html', {
+                'routine': routine,
+                'routine_exercises': routine_exercises,
+            }),
+            'exercise_count': len(routine_exercises),
+            'total_sets': total_sets,
+            'estimated_duration': total_sets * MINUTES_PER_SET,
+        }
+        cache.set(key, fragment, ROUTINE_EXERCISES_CACHE_TIMEOUT)
+    return fragment
+
+
 def routine_detail(request, routine_id):
-    routine = get_object_or_404(Routine, id=routine_id)
+    routine = get_object_or_404(Routine.objects.select_related('source'), id=routine_id)
     
     # Check if user can view this routine
     can_view = (
         routine.is_public or 
-        (request.user.is_authenticated and routine.user == request.user)
+        (request.user.is_authenticated and routine.user_id == request.user.id)
     )
     
     if not can_view:
         messages.error(request, 'You do not have permission to view this routine.')
         return redirect(ROUTINE_LIST_URL)
     
-    routine_exercises = routine.routine_exercises.all().order_by('order')
-    
-    # Calculate total sets and estimated duration
-    total_sets = sum([re.sets_count for re in routine_exercises])
-    estimated_duration = routine.get_estimated_duration()
+    fragment = _routine_exercise_fragment(routine)
     
     # Check if user can edit this routine
-    can_edit = request.user.is_authenticated and routine.user == request.user
+    can_edit = request.user.is_authenticated and routine.user_id == request.user.id
     
     context = {
         'routine': routine,
-        'routine_exercises': routine_exercises,
-        'total_sets': total_sets,
-        'estimated_duration': estimated_duration,
+        'exercise_list_html': mark_safe(fragment['html']),
+        'exercise_count': fragment['exercise_count'],
+        'total_sets': fragment['total_sets'],
+        'estimated_duration': fragment['estimated_duration'],
         'can_edit': can_edit,
     }
     return render(request, 'routines/routine_detail.html', context)
 
 
+def _parse_exercise_form(post):
+    """
+    Read the selected exercises from routine form data.
+
+    Returns a list of (exercise_id, sets_count, rest_time) tuples, ordered by
+    the optional comma-separated `exercise_order` field and otherwise in form
+    order. Malformed entries and ids that do not exist are skipped; existence
+    is checked with a single id__in query.
+    """
+    entries = []
+    for key in post:
+        if not key.startswith('exercise_'):
+            continue
+        try:
+            exercise_id = int(key.split('_')[1])
+            sets_count = int(post.get(f'sets_{exercise_id}', 3))
+            rest_time = int(post.get(f'rest_{exercise_id}', 60))
+        except ValueError:
+            continue
+        entries.append((exercise_id, sets_count, rest_time))
+
+    explicit_order = [value for value in post.get('exercise_order', '').split(',') if value.strip().isdigit()]
+    if explicit_order:
+        position = {int(exercise_id): i for i, exercise_id in enumerate(explicit_order)}
+        entries.sort(key=lambda entry: position.get(entry[0], len(position)))
+
+    valid_ids = set(
+        Exercise.objects.filter(id__in=[entry[0] for entry in entries]).order_by().values_list('id', flat=True)
+    ) if entries else set()
+    return [entry for entry in entries if entry[0] in valid_ids]
+
+
 def _add_exercises_to_routine(request, routine):
     """Add exercises from POST data to the routine"""
-    exercise_order = 0
-    for key, value in request.POST.items():
-        if key.startswith('exercise_'):
-            exercise_id = key.split('_')[1]
-            try:
-                exercise = Exercise.objects.get(id=exercise_id)
-                sets_count = int(request.POST.get(f'sets_{exercise_id}', 3))
-                rest_time = int(request.POST.get(f'rest_{exercise_id}', 60))
-
-                RoutineExercise.objects.create(
-                    routine=routine,
-                    exercise=exercise,
-                    sets_count=sets_count,
-                    rest_time_seconds=rest_time,
-                    order=exercise_order
-                )
-                exercise_order += 1
-            except (Exercise.DoesNotExist, ValueError):
-                continue
+    RoutineExercise.objects.bulk_create([
+        RoutineExercise(
+            routine=routine,
+            exercise_id=exercise_id,
+            sets_count=sets_count,
+            rest_time_seconds=rest_time,
+            order=(i + 1) * ORDER_GAP
+        )
+        for i, (exercise_id, sets_count, rest_time) in enumerate(_parse_exercise_form(request.POST))
+    ])
 
 
 def _get_filtered_exercises(search, muscle_group, equipment, difficulty):
@@ -153,16 +306,17 @@ def routine_create(request):
             messages.error(request, 'Routine name is required')
             return redirect('routines:routine_create')
         
-        # Create routine
-        routine = Routine.objects.create(
-            name=name,
-            description=description,
-            user=request.user,
-            is_public=is_public
-        )
-        
-        # Add exercises to routine
-        _add_exercises_to_routine(request, routine)
+        with transaction.atomic():
+            # Create routine
+            routine = Routine.objects.create(
+                name=name,
+                description=description,
+                user=request.user,
+                is_public=is_public
+            )
+            
+            # Add exercises to routine
+            _add_exercises_to_routine(request, routine)
         
         messages.success(request, f'Routine "{name}" created successfully!')
         return redirect(ROUTINE_DETAIL_URL, routine_id=routine.id)
@@ -200,32 +354,51 @@ def routine_create(request):
 
 
 def _process_routine_exercises(request, routine):
-    """Process and save exercises from the edit form"""
-    # Clear existing exercises
-    routine.routine_exercises.all().delete()
-
-    # Add new exercises
-    exercise_order = 0
-    for key, value in request.POST.items():
-        if not key.startswith('exercise_'):
-            continue
-
-        exercise_id = key.split('_')[1]
-        try:
-            exercise = Exercise.objects.get(id=exercise_id)
-            sets_count = int(request.POST.get(f'sets_{exercise_id}', 3))
-            rest_time = int(request.POST.get(f'rest_{exercise_id}', 60))
-
-            RoutineExercise.objects.create(
+    """
+    Process and save exercises from the edit form.
+
+    Computes a diff against the routine's existing rows and applies it with
+    bulk operations, so unchanged rows are left alone and fields not on the
+    form (target_reps, target_weight) survive the edit. Callers run this
+    inside a transaction.
+    """
+    entries = _parse_exercise_form(request.POST)
+
+    # Copy-on-write: a shared copy gets its own rows, and copies of this routine keep the old list
+    routine.prepare_exercise_edit()
+
+    existing = {re.exercise_id: re for re in routine.routine_exercises.all()}
+    rows = []
+    to_update = []
+    for exercise_id, sets_count, rest_time in entries:
+        current = existing.pop(exercise_id, None)
+        if current is None:
+            rows.append(RoutineExercise(
                 routine=routine,
-                exercise=exercise,
+                exercise_id=exercise_id,
                 sets_count=sets_count,
-                rest_time_seconds=rest_time,
-                order=exercise_order
-            )
-            exercise_order += 1
-        except (Exercise.DoesNotExist, ValueError):
+                rest_time_seconds=rest_time
+            ))
             continue
+        if (current.sets_count, current.rest_time_seconds) != (sets_count, rest_time):
+            current.sets_count = sets_count
+            current.rest_time_seconds = rest_time
+            to_update.append(current)
+        rows.append(current)
+
+    # Only rows that actually moved get a new order key
+    for re in assign_order_keys(rows):
+        if re not in to_update:
+            to_update.append(re)
+    to_create = [re for re in rows if re.pk is None]
+
+    # Whatever is left in existing was removed on the form
+    if existing:
+        RoutineExercise.objects.filter(id__in=[re.id for re in existing.values()]).delete()
+    if to_update:
+        RoutineExercise.objects.bulk_update(to_update, ['sets_count', 'rest_time_seconds', 'order'])
+    if to_create:
+        RoutineExercise.objects.bulk_create(to_create)
 
 
 def _apply_exercise_filters(request):
@@ -266,13 +439,19 @@ def routine_edit(request, routine_id):
         return redirect(ROUTINE_DETAIL_URL, routine_id=routine.id)
 
     if request.method == 'POST':
+        was_public = routine.is_public
         routine.name = request.POST.get('name', routine.name)
         routine.description = request.POST.get('description', routine.description)
         routine.is_public = request.POST.get('is_public') == 'on'
-        routine.save()
 
-        # Process exercises
-        _process_routine_exercises(request, routine)
+        with transaction.atomic():
+            routine.save()
+
+            # Process exercises
+            _process_routine_exercises(request, routine)
+
+        if was_public and not routine.is_public:
+            invalidate_trending_cache()
 
         messages.success(request, f'Routine "{routine.name}" updated successfully!')
         return redirect(ROUTINE_DETAIL_URL, routine_id=routine.id)
@@ -289,7 +468,7 @@ def routine_edit(request, routine_id):
 
     # Apply filters to exercises
     exercises = _apply_exercise_filters(request)
-    current_exercises = routine.routine_exercises.all().order_by('order')
+    current_exercises = routine.get_routine_exercises()
 
     context = {
         'routine': routine,
@@ -309,7 +488,10 @@ def routine_delete(request, routine_id):
     
     if request.method == 'POST':
         routine_name = routine.name
+        was_public = routine.is_public
         routine.delete()
+        if was_public:
+            invalidate_trending_cache()
         messages.success(request, f'Routine "{routine_name}" deleted successfully!')
         return redirect(ROUTINE_LIST_URL)
     
@@ -341,6 +523,7 @@ def routine_start(request, routine_id):
         user=request.user,
         status='in_progress'
     )
+    record_activity(routine, 'start')
     
     messages.success(request, f'Started workout: {routine.name}')
     return redirect('workouts:workout_session', session_id=session.id)
@@ -360,48 +543,63 @@ def routine_copy(request, routine_id):
         messages.info(request, 'Please log in to copy this routine.')
         return redirect(LOGIN_URL)
     
-    # Create a copy of the routine
+    # Create a copy of the routine that shares the original's exercise rows
+    # until it is first edited (copy-on-write)
     new_routine = Routine.objects.create(
         name=f"{original_routine.name} (Copy)",
         description=original_routine.description,
         user=request.user,
-        is_public=False  # User's copy is private by default
+        is_public=False,  # User's copy is private by default
+        source_id=original_routine.exercise_owner_id,
+        shares_exercises=True
     )
-    
-    # Copy all exercises
-    for original_exercise in original_routine.routine_exercises.all():
-        RoutineExercise.objects.create(
-            routine=new_routine,
-            exercise=original_exercise.exercise,
-            sets_count=original_exercise.sets_count,
-            rest_time_seconds=original_exercise.rest_time_seconds,
-            order=original_exercise.order,
-            target_reps=original_exercise.target_reps,
-            target_weight=original_exercise.target_weight,
-        )
+    record_activity(original_routine, 'copy')
     
     messages.success(request, f'Routine "{original_routine.name}" copied to your account!')
     return redirect(ROUTINE_DETAIL_URL, routine_id=new_routine.id)
 
 
+def similar_routines_api(request, routine_id):
+    """
+    API endpoint listing public routines similar to a routine, by exercises, muscles and equipment.
+
+    Optional ?limit= (default 10, at most 50). The user's own routines are
+    left out when they are logged in.
+    """
+    routine = get_object_or_404(Routine, id=routine_id)
+    is_owner = request.user.is_authenticated and routine.user_id == request.user.id
+    if not (routine.is_public or is_owner):
+        return JsonResponse({'error': 'Routine not found'}, status=404)
+
+    try:
+        limit = min(max(int(request.GET.get('limit', SIMILAR_ROUTINES_DEFAULT)), 1), SIMILAR_ROUTINES_MAX)
+    except ValueError:
+        limit = SIMILAR_ROUTINES_DEFAULT
+
+    similar = find_similar_routines(
+        routine, limit=limit, exclude_user=request.user if request.user.is_authenticated else None
+    )
+    return JsonResponse({
+        'routine_id': routine.id,
+        'routines': [
+            {
+                'id': match.id,
+                'name': match.name,
+                'description': match.description,
+                'username': match.user.username,
+                'score': round(score, 4),
+            }
+            for match, score in similar
+        ],
+    })
+
+
 def user_routines_api(request):
     """API endpoint to get user's routines for add-to-routine modal"""
     if not request.user.is_authenticated:
         return JsonResponse({'error': 'Authentication required'}, status=401)
     
-    routines = Routine.objects.filter(user=request.user, is_active=True)
-    routine_data = []
-    
-    for routine in routines:
-        routine_data.append({
-            'id': routine.id,
-            'name': routine.name,
-            'description': routine.description,
-            'exercise_count': routine.get_total_exercises(),
-            'estimated_duration': routine.get_estimated_duration(),
-        })
-    
-    return JsonResponse({'routines': routine_data})
+    return JsonResponse({'routines': get_user_routine_summaries(request.user)})
 
 
 @require_POST
@@ -414,30 +612,39 @@ def add_exercise_to_routine(request, routine_id):
     
     try:
         data = json.loads(request.body)
+        if not isinstance(data, dict):
+            return JsonResponse({'error': 'Invalid JSON'}, status=400)
         exercise_id = data.get('exercise_id')
         
         if not exercise_id:
             return JsonResponse({'error': 'Exercise ID required'}, status=400)
         
         exercise = get_object_or_404(Exercise, id=exercise_id)
-        
-        # Check if exercise already exists in routine
-        existing = RoutineExercise.objects.filter(routine=routine, exercise=exercise).first()
-        if existing:
-            return JsonResponse({'success': False, 'message': 'Exercise already in routine'})
-        
-        # Get the next order number
-        last_exercise = routine.routine_exercises.order_by('order').last()
-        next_order = (last_exercise.order + 1) if last_exercise else 0
-        
-        # Add exercise to routine
-        RoutineExercise.objects.create(
-            routine=routine,
-            exercise=exercise,
-            sets_count=3,  # Default
-            rest_time_seconds=60,  # Default
-            order=next_order
-        )
+
+        with transaction.atomic():
+            # Lock the routine so a failed add leaves no half-detached copy
+            # and concurrent adds cannot take the same order key
+            routine = Routine.objects.select_for_update().get(pk=routine.pk)
+            routine.prepare_exercise_edit()
+
+            # Check if exercise already exists in routine
+            existing = RoutineExercise.objects.filter(routine=routine, exercise=exercise).first()
+            if existing:
+                return JsonResponse({'success': False, 'message': 'Exercise already in routine'})
+
+            # Get the next order key
+            last_exercise = routine.routine_exercises.order_by('order').last()
+            next_order = (last_exercise.order + ORDER_GAP) if last_exercise else ORDER_GAP
+
+            # Add exercise to routine
+            RoutineExercise.objects.create(
+                routine=routine,
+                exercise=exercise,
+                sets_count=3,  # Default
+                rest_time_seconds=60,  # Default
+                order=next_order
+            )
+            routine_exercises_changed(routine)
         
         return JsonResponse({
             'success': True, 
@@ -451,12 +658,290 @@ def add_exercise_to_routine(request, routine_id):
         return JsonResponse({'error': str(e)}, status=500)
 
 
+def _parse_bulk_edit(data):
+    """Validate the shape of a bulk edit payload, raising ValueError on bad input"""
+    if not isinstance(data, dict):
+        raise ValueError('Expected a JSON object')
+
+    add = []
+    for item in data.get('add') or []:
+        if not isinstance(item, dict):
+            raise ValueError('Each added exercise must be an object')
+        add.append({
+            'exercise_id': int(item['exercise_id']),
+            'sets_count': int(item.get('sets_count', 3)),
+            'rest_time_seconds': int(item.get('rest_time_seconds', 60)),
+        })
+    remove = [int(exercise_id) for exercise_id in data.get('remove') or []]
+    order = [int(exercise_id) for exercise_id in data.get('order') or []]
+
+    if len(add) + len(remove) > MAX_BULK_EDIT_ITEMS or len(order) > MAX_BULK_EDIT_ITEMS:
+        raise ValueError(f'At most {MAX_BULK_EDIT_ITEMS} items per request')
+    return add, remove, order
+
+
+def _apply_bulk_edit(routine, add, remove, order):
+    """Apply removals, additions and a reorder to a routine's rows with bulk statements"""
+    results = {'added': [], 'skipped': [], 'removed': []}
+
+    routine.prepare_exercise_edit()
+    existing = {re.exercise_id: re for re in routine.routine_exercises.all()}
+
+    removed = [existing.pop(exercise_id) for exercise_id in remove if exercise_id in existing]
+    if removed:
+        RoutineExercise.objects.filter(id__in=[re.id for re in removed]).delete()
+        results['removed'] = [re.exercise_id for re in removed]
+
+    valid_ids = set(
+        Exercise.objects.filter(id__in=[item['exercise_id'] for item in add]).order_by().values_list('id', flat=True)
+    ) if add else set()
+    next_order = max((re.order for re in existing.values()), default=0) + ORDER_GAP
+    to_create = []
+    for item in add:
+        exercise_id = item['exercise_id']
+        if exercise_id not in valid_ids:
+            results['skipped'].append({'exercise_id': exercise_id, 'reason': 'Exercise not found'})
+        elif exercise_id in existing:
+            results['skipped'].append({'exercise_id': exercise_id, 'reason': 'Exercise already in routine'})
+        else:
+            existing[exercise_id] = RoutineExercise(
+                routine=routine,
+                exercise_id=exercise_id,
+                sets_count=item['sets_count'],
+                rest_time_seconds=item['rest_time_seconds'],
+                order=next_order
+            )
+            to_create.append(existing[exercise_id])
+            results['added'].append(exercise_id)
+            next_order += ORDER_GAP
+
+    if order:
+        # Listed exercises come first in the given order, the rest keep their relative order
+        listed = [existing[exercise_id] for exercise_id in dict.fromkeys(order) if exercise_id in existing]
+        listed_ids = {re.exercise_id for re in listed}
+        unlisted = sorted((re for re in existing.values() if re.exercise_id not in listed_ids), key=lambda re: re.order)
+        to_update = assign_order_keys(listed + unlisted)
+        if to_update:
+            RoutineExercise.objects.bulk_update(to_update, ['order'])
+
+    if to_create:
+        RoutineExercise.objects.bulk_create(to_create)
+
+    results['exercise_ids'] = [re.exercise_id for re in sorted(existing.values(), key=lambda re: re.order)]
+    return results
+
+
+@require_POST
+def bulk_edit_routine_exercises(request, routine_id):
+    """
+    API endpoint to add, remove and reorder many routine exercises in one request.
+
+    Expects JSON: {"idempotency_key": "...", "add": [{"exercise_id": 1, "sets_count": 3,
+    "rest_time_seconds": 60}], "remove": [exercise_id, ...], "order": [exercise_id, ...]}
+
+    The routine row is locked for the duration of a single transaction, and a
+    retried request with the same idempotency key returns the original result.
+    """
+    if not request.user.is_authenticated:
+        return JsonResponse({'error': 'Authentication required'}, status=401)
+
+    try:
+        data = json.loads(request.body)
+        if not isinstance(data, dict):
+            return JsonResponse({'error': 'Invalid JSON'}, status=400)
+        add, remove, order = _parse_bulk_edit(data)
+    except json.JSONDecodeError:
+        return JsonResponse({'error': 'Invalid JSON'}, status=400)
+    except (KeyError, TypeError, ValueError) as e:
+        return JsonResponse({'error': f'Invalid payload: {e}'}, status=400)
+
+    idempotency_key = str(data.get('idempotency_key') or '')[:64]
+
+    with transaction.atomic():
+        routine = get_object_or_404(Routine.objects.select_for_update(), id=routine_id, user=request.user)
+
+        if idempotency_key:
+            previous = RoutineEditRequest.objects.filter(routine=routine, idempotency_key=idempotency_key).first()
+            if previous:
+                return JsonResponse({**previous.response, 'replayed': True})
+
+        results = _apply_bulk_edit(routine, add, remove, order)
+        routine_exercises_changed(routine)
+        response = {'success': True, 'routine_id': routine.id, **results}
+
+        if idempotency_key:
+            RoutineEditRequest.objects.create(routine=routine, idempotency_key=idempotency_key, response=response)
+
+    return JsonResponse(response)
+
+
+@require_POST
+def move_routine_exercise(request, routine_id, exercise_id):
+    """
+    API endpoint for drag-and-drop reordering of a single routine exercise.
+
+    Expects JSON: {"after_exercise_id": id} to place the exercise after another,
+    or {"after_exercise_id": null} to move it to the top. Only the moved row's
+    sparse order key is rewritten unless its neighbours have run out of room.
+    """
+    if not request.user.is_authenticated:
+        return JsonResponse({'error': 'Authentication required'}, status=401)
+
+    try:
+        data = json.loads(request.body)
+        if not isinstance(data, dict):
+            return JsonResponse({'error': 'Invalid JSON'}, status=400)
+        after_exercise_id = data.get('after_exercise_id')
+        after_exercise_id = int(after_exercise_id) if after_exercise_id is not None else None
+    except json.JSONDecodeError:
+        return JsonResponse({'error': 'Invalid JSON'}, status=400)
+    except (AttributeError, TypeError, ValueError):
+        return JsonResponse({'error': 'Invalid after_exercise_id'}, status=400)
+
+    with transaction.atomic():
+        routine = get_object_or_404(Routine.objects.select_for_update(), id=routine_id, user=request.user)
+        routine.prepare_exercise_edit()
+
+        rows = list(routine.routine_exercises.order_by('order'))
+        moving = next((re for re in rows if re.exercise_id == exercise_id), None)
+        if moving is None:
+            return JsonResponse({'error': 'Exercise not in routine'}, status=404)
+        rows.remove(moving)
+
+        if after_exercise_id is None:
+            position = 0
+        else:
+            position = next((i + 1 for i, re in enumerate(rows) if re.exercise_id == after_exercise_id), None)
+            if position is None:
+                return JsonResponse({'error': 'Exercise not in routine'}, status=404)
+        rows.insert(position, moving)
+
+        changed = assign_order_keys(rows)
+        if changed:
+            RoutineExercise.objects.bulk_update(changed, ['order'])
+            routine_exercises_changed(routine)
+
+    return JsonResponse({
+        'success': True,
+        'rows_updated': len(changed),
+        'exercise_ids': [re.exercise_id for re in rows],
+    })
+
+
+@require_POST
+def program_batch_api(request):
+    """
+    API endpoint for coaches to generate multi-week programs for many users at once.
+
+    Expects JSON: {"usernames": [...], "weeks": 4, "split": "3_day_split" or
+    "categories": ["upper_body", "legs"], "equipment": ["dumbbells"], "name": "...",
+    "exercises_per_day": 5, "sets_per_exercise": 3, "rest_time": 60}
+    """
+    if not request.user.is_authenticated:
+        return JsonResponse({'error': 'Authentication required'}, status=401)
+    if not request.user.is_staff:
+        return JsonResponse({'error': 'Permission denied'}, status=403)
+
+    try:
+        data = json.loads(request.body)
+        if not isinstance(data, dict):
+            return JsonResponse({'error': 'Invalid JSON'}, status=400)
+        usernames = data.get('usernames') or []
+        weeks = int(data.get('weeks', 1))
+        days = resolve_program_days(data.get('split'), data.get('categories'))
+        exercises_per_day = int(data.get('exercises_per_day', 5))
+        sets_per_exercise = int(data.get('sets_per_exercise', 3))
+        rest_time = int(data.get('rest_time', 60))
+    except json.JSONDecodeError:
+        return JsonResponse({'error': 'Invalid JSON'}, status=400)
+    except (TypeError, ValueError) as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    if not isinstance(usernames, list) or not all(isinstance(username, str) for username in usernames):
+        return JsonResponse({'error': 'usernames must be a list of strings'}, status=400)
+    if not usernames or len(usernames) > MAX_PROGRAM_BATCH_USERS:
+        return JsonResponse({'error': f'Provide between 1 and {MAX_PROGRAM_BATCH_USERS} usernames'}, status=400)
+    if not 1 <= weeks <= MAX_PROGRAM_WEEKS:
+        return JsonResponse({'error': f'Weeks must be between 1 and {MAX_PROGRAM_WEEKS}'}, status=400)
+    routine_count = len(set(usernames)) * weeks * len(days)
+    if routine_count > MAX_PROGRAM_BATCH_ROUTINES:
+        return JsonResponse({
+            'error': f'This batch would create {routine_count} routines; at most {MAX_PROGRAM_BATCH_ROUTINES} '
+                     f'can be generated per request (use the generate_programs command for larger batches)'
+        }, status=400)
+
+    users = list(User.objects.filter(username__in=usernames))
+    missing = sorted(set(usernames) - {user.username for user in users})
+    if missing:
+        return JsonResponse({'error': f"Unknown users: {', '.join(missing)}"}, status=400)
+
+    summary = generate_programs(
+        users, days, data.get('equipment') or 'mixed',
+        weeks=weeks,
+        program_name=data.get('name') or 'Program',
+        exercises_per_day=exercises_per_day,
+        sets_per_exercise=sets_per_exercise,
+        rest_time=rest_time,
+    )
+    return JsonResponse({'success': True, **summary})
+
+
+def export_routines_api(request):
+    """
+    API endpoint that streams the user's routines as NDJSON (default) or CSV.
+
+    Use ?format=csv for CSV. Rows are fetched in chunks, so the response starts
+    immediately and memory use does not grow with the size of the library.
+    """
+    if not request.user.is_authenticated:
+        return JsonResponse({'error': 'Authentication required'}, status=401)
+
+    fmt = request.GET.get('format', 'ndjson')
+    if fmt not in TRANSFER_FORMATS:
+        return JsonResponse({'error': f"Format must be one of: {', '.join(TRANSFER_FORMATS)}"}, status=400)
+
+    routines = Routine.objects.filter(user=request.user, is_active=True)
+    response = StreamingHttpResponse(
+        export_routines(routines, fmt),
+        content_type='text/csv' if fmt == 'csv' else 'application/x-ndjson'
+    )
+    response['Content-Disposition'] = f'attachment; filename="routines.{fmt}"'
+    return response
+
+
+@require_POST
+def import_routines_api(request):
+    """
+    API endpoint to import routines from an uploaded NDJSON or CSV file into the user's account.
+
+    Expects a multipart upload in "file"; the format comes from the "format"
+    field or the file extension. Exercises are matched by slug, and unknown
+    ones are skipped and reported.
+    """
+    if not request.user.is_authenticated:
+        return JsonResponse({'error': 'Authentication required'}, status=401)
+
+    upload = request.FILES.get('file')
+    if upload is None:
+        return JsonResponse({'error': 'No file uploaded'}, status=400)
+
+    fmt = request.POST.get('format') or ('csv' if upload.name.endswith('.csv') else 'ndjson')
+    if fmt not in TRANSFER_FORMATS:
+        return JsonResponse({'error': f"Format must be one of: {', '.join(TRANSFER_FORMATS)}"}, status=400)
+
+    summary = import_routines(parse_routine_records(upload, fmt), user=request.user)
+    if 'read_error' in summary:
+        # Routines before the unreadable part were imported; routines_created says how many
+        return JsonResponse({'success': False, 'error': summary.pop('read_error'), **summary}, status=400)
+    return JsonResponse({'success': True, **summary})
+
+
 def _validate_routine_generator_form(request, routine_name, equipment_list, category, custom_muscles, muscle_group_categories):
     """Validate routine generator form inputs"""
     context = {
         'muscle_group_categories': muscle_group_categories,
         'equipment_options': _get_equipment_options(),
-        'special_splits': _get_special_splits(),
+        'special_splits': get_special_splits(),
         'all_muscles': get_available_muscles(),
     }
 
@@ -506,16 +991,26 @@ def _create_routine_with_exercises(user, routine_name, target_muscles, final_equ
     )
 
     # Add exercises to routine
-    for i, exercise in enumerate(selected_exercises):
-        RoutineExercise.objects.create(
+    RoutineExercise.objects.bulk_create(
+        _build_routine_exercises(routine, selected_exercises, sets_per_exercise, rest_time)
+    )
+    invalidate_user_routines(user.id)
+
+    return routine
+
+
+def _build_routine_exercises(routine, selected_exercises, sets_per_exercise, rest_time):
+    """Build (unsaved) RoutineExercise rows for generated exercises, ready for bulk_create"""
+    return [
+        RoutineExercise(
             routine=routine,
             exercise=exercise,
             sets_count=sets_per_exercise,
             rest_time_seconds=rest_time,
-            order=i + 1
+            order=(i + 1) * ORDER_GAP
         )
-
-    return routine
+        for i, exercise in enumerate(selected_exercises)
+    ]
 
 
 def _get_equipment_options():
@@ -531,90 +1026,10 @@ def _get_equipment_options():
     ]
 
 
-def _get_special_splits():
-    """Get special workout split configurations"""
-    return {
-        '3_day_split': {
-            'name': '3-Day Full Body Split',
-            'description': 'Creates 3 complementary routines for a complete weekly program (15 exercises total)',
-            'routines': [
-                {
-                    'name': 'Upper Body Push',
-                    'muscles': ['chest', 'shoulders', 'triceps', 'anterior-deltoid', 'upper-trapezius'],
-                    'description': 'Day 1: Chest, shoulders, and triceps'
-                },
-                {
-                    'name': 'Back & Biceps Pull',
-                    'muscles': ['lats', 'traps', 'biceps', 'rear-shoulders', 'forearms'],
-                    'description': 'Day 2: Back, biceps, and rear delts'
-                },
-                {
-                    'name': 'Legs & Core',
-                    'muscles': ['quads', 'hamstrings', 'glutes', 'calves', 'abdominals'],
-                    'description': 'Day 3: Full legs and core strengthening'
-                }
-            ]
-        }
-    }
-
-
-def _get_muscle_group_categories():
-    """Get muscle group category definitions"""
-    return {
-        'arms': {
-            'name': 'Arms',
-            'muscles': ['biceps', 'triceps', 'forearms', 'shoulders'],
-            'description': 'Complete arm workout targeting biceps, triceps, forearms, and shoulders'
-        },
-        'legs': {
-            'name': 'Legs',
-            'muscles': ['quads', 'hamstrings', 'calves', 'glutes'],
-            'description': 'Full leg workout targeting quads, hamstrings, calves, and glutes'
-        },
-        'back': {
-            'name': 'Back',
-            'muscles': ['lats', 'traps', 'lowerback', 'rear-shoulders'],
-            'description': 'Complete back workout targeting lats, traps, lower back, and rear delts'
-        },
-        'chest': {
-            'name': 'Chest',
-            'muscles': ['chest', 'anterior-deltoid', 'triceps'],
-            'description': 'Chest-focused workout targeting pecs, front delts, and triceps'
-        },
-        'core': {
-            'name': 'Core',
-            'muscles': ['abdominals', 'obliques', 'lower-abdominals', 'lowerback'],
-            'description': 'Core strengthening targeting abs, obliques, and lower back'
-        },
-        'upper_body': {
-            'name': 'Upper Body',
-            'muscles': ['chest', 'lats', 'shoulders', 'biceps', 'triceps'],
-            'description': 'Complete upper body workout targeting chest, back, and arms'
-        },
-        'full_body': {
-            'name': 'Full Body',
-            'muscles': ['chest', 'lats', 'shoulders', 'biceps', 'triceps', 'quads', 'hamstrings', 'abdominals'],
-            'description': 'Complete full body workout hitting all major muscle groups'
-        },
-        'yoga_flow': {
-            'name': 'Yoga Flow',
-            'muscles': ['abdominals', 'lowerback', 'shoulders', 'hamstrings', 'calves', 'hips'],
-            'description': 'Flexibility and strength flow targeting core, back, and mobility',
-            'equipment_override': 'bodyweight'
-        },
-        'bodyweight_blast': {
-            'name': 'Bodyweight Blast',
-            'muscles': ['chest', 'shoulders', 'triceps', 'abdominals', 'quads', 'glutes'],
-            'description': 'High-intensity bodyweight workout requiring no equipment',
-            'equipment_override': 'bodyweight'
-        }
-    }
-
-
 def routine_generator(request):
     """Generate a routine based on muscle groups and equipment selection"""
-    muscle_group_categories = _get_muscle_group_categories()
-    special_splits = _get_special_splits()
+    muscle_group_categories = get_muscle_group_categories()
+    special_splits = get_special_splits()
 
     if request.method == 'POST':
         # Get form data
@@ -767,14 +1182,19 @@ def handle_3_day_split(request, routine_name, equipment, sets_per_exercise, rest
         })
     
     created_routines = []
+    new_routine_exercises = []
     split_data = special_splits['3_day_split']
+
+    # One query loads candidates for all three days; drawing without
+    # replacement also keeps exercises from repeating across days
+    equipment_list = expand_equipment(equipment)
+    split_muscles = {muscle for routine_data in split_data['routines'] for muscle in routine_data['muscles']}
+    pool = CandidatePool.load(split_muscles, equipment_list)
     
     # Create each routine in the split
     for i, routine_data in enumerate(split_data['routines']):
         # Generate 5 exercises for each routine (15 total)
-        selected_exercises = generate_routine_exercises(
-            routine_data['muscles'], equipment, 5
-        )
+        selected_exercises = select_exercises(pool, routine_data['muscles'], equipment_list, 5)
         
         if not selected_exercises:
             continue
@@ -787,20 +1207,17 @@ def handle_3_day_split(request, routine_name, equipment, sets_per_exercise, rest
             description=f"{routine_data['description']} - Part of 3-day split program"
         )
         
-        # Add exercises to routine
-        for j, exercise in enumerate(selected_exercises):
-            RoutineExercise.objects.create(
-                routine=routine,
-                exercise=exercise,
-                sets_count=sets_per_exercise,
-                rest_time_seconds=rest_time,
-                order=j + 1
-            )
-        
+        new_routine_exercises.extend(
+            _build_routine_exercises(routine, selected_exercises, sets_per_exercise, rest_time)
+        )
         created_routines.append(routine)
+
+    # Add exercises to all routines at once
+    RoutineExercise.objects.bulk_create(new_routine_exercises)
+    invalidate_user_routines(user.id)
     
     if created_routines:
-        messages.success(request, f'Generated 3-day split program "{routine_name}" with {len(created_routines)} routines and {sum(r.routine_exercises.count() for r in created_routines)} total exercises!')
+        messages.success(request, f'Generated 3-day split program "{routine_name}" with {len(created_routines)} routines and {len(new_routine_exercises)} total exercises!')
         # Redirect to the first routine
         return redirect(ROUTINE_DETAIL_URL, routine_id=created_routines[0].id)
     else:
@@ -816,58 +1233,13 @@ def handle_3_day_split(request, routine_name, equipment, sets_per_exercise, rest
 
 def generate_routine_exercises(target_muscles, equipment, max_exercises=5):
     """Generate a list of exercises based on target muscles and equipment"""
-    selected_exercises = []
-    used_exercises = set()
-    
-    # Handle mixed equipment or equipment list
-    if isinstance(equipment, list):
-        equipment_list = equipment
-        # If mixed is in the list, expand it
-        if 'mixed' in equipment_list:
-            equipment_list = ['dumbbells', 'barbell', 'bodyweight', 'machine', 'kettlebells']
-    elif equipment == 'mixed':
-        equipment_list = ['dumbbells', 'barbell', 'bodyweight', 'machine', 'kettlebells']
-    else:
-        equipment_list = [equipment]
-    
-    # Try to get one exercise per muscle group
-    for muscle in target_muscles:
-        if len(selected_exercises) >= max_exercises:
-            break
-        
-        # Find exercises for this muscle group with any of the specified equipment
-        exercises = Exercise.objects.filter(
-            muscle=muscle,
-            equipment__in=equipment_list
-        ).exclude(
-            id__in=used_exercises
-        )
-        
-        if exercises.exists():
-            exercise = random.choice(exercises)
-            selected_exercises.append(exercise)
-            used_exercises.add(exercise.id)
-    
-    # If we don't have enough exercises, fill with random ones from target muscles
-    while len(selected_exercises) < max_exercises:
-        remaining_exercises = Exercise.objects.filter(
-            muscle__in=target_muscles,
-            equipment__in=equipment_list
-        ).exclude(
-            id__in=used_exercises
-        )
-        
-        if not remaining_exercises.exists():
-            break
-        
-        exercise = random.choice(remaining_exercises)
-        selected_exercises.append(exercise)
-        used_exercises.add(exercise.id)
-    
-    return selected_exercises
+    equipment_list = expand_equipment(equipment)
+    pool = CandidatePool.load(target_muscles, equipment_list)
+    return select_exercises(pool, target_muscles, equipment_list, max_exercises)
 
 
 def get_available_muscles():
     """Get all available muscle groups for custom selection"""
     muscles = Exercise.objects.exclude(muscle='').values_list('muscle', flat=True).distinct()
     return sorted(set(muscles))
+
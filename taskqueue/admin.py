@@ -0,0 +1,19 @@
+from django.contrib import admin
+from django.utils import timezone
+from .models import Task
+
+
+@admin.register(Task)
+class TaskAdmin(admin.ModelAdmin):
+    list_display = ['name', 'status', 'priority', 'attempts', 'run_after', 'created_at', 'finished_at']
+    list_filter = ['status', 'name']
+    search_fields = ['name', 'key', 'last_error']
+    readonly_fields = ['locked_by', 'last_error', 'created_at', 'finished_at']
+    actions = ['retry_tasks']
+
+    @admin.action(description='Queue selected tasks to run again')
+    def retry_tasks(self, request, queryset):
+        updated = queryset.exclude(status='running').update(
+            status='queued', run_after=timezone.now(), attempts=0, last_error='', finished_at=None
+        )
+        self.message_user(request, f'Queued {updated} tasks')
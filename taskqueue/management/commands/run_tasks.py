@@ -0,0 +1,51 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from taskqueue.worker import claim_tasks, purge_finished, run_task, worker_name, CLAIM_BATCH_SIZE
+
+PURGE_INTERVAL_SECONDS = 60 * 60
+
+
+class Command(BaseCommand):
+    help = 'Run queued background tasks, polling the task table until stopped'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Exit once no task is due instead of polling')
+        parser.add_argument('--poll-interval', type=float, default=1.0,
+                            help='Seconds to wait when no task is due (default: 1)')
+        parser.add_argument('--batch-size', type=int, default=CLAIM_BATCH_SIZE,
+                            help=f'Tasks claimed per poll (default: {CLAIM_BATCH_SIZE})')
+        parser.add_argument('--keep-days', type=int, default=7,
+                            help='Delete done tasks after this many days (default: 7)')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be positive')
+
+        worker = worker_name()
+        succeeded = failed = 0
+        next_purge = time.monotonic()
+        self.stdout.write(f'Worker {worker} started')
+        try:
+            while True:
+                if time.monotonic() >= next_purge:
+                    purge_finished(timezone.now() - timedelta(days=options['keep_days']))
+                    next_purge = time.monotonic() + PURGE_INTERVAL_SECONDS
+
+                batch = claim_tasks(worker, options['batch_size'])
+                for task in batch:
+                    if run_task(task):
+                        succeeded += 1
+                    else:
+                        failed += 1
+                        self.stderr.write(f'Task {task.pk} {task.name} failed (attempt {task.attempts})')
+                if not batch:
+                    if options['once']:
+                        break
+                    time.sleep(options['poll_interval'])
+        except KeyboardInterrupt:
+            pass
+
+        self.stdout.write(self.style.SUCCESS(f'Ran {succeeded} tasks, {failed} failed'))
@@ -0,0 +1,38 @@
+from django.db import models
+from django.utils import timezone
+
+
+class Task(models.Model):
+    """A deferred function call, claimed and run by the run_tasks worker (see taskqueue.queue)"""
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ]
+
+    name = models.CharField(max_length=200)  # Registered task name, e.g. "workouts.tasks.process_completed_session"
+    kwargs = models.JSONField(default=dict, blank=True)
+    key = models.CharField(max_length=64, blank=True)  # Hash of name and kwargs for unique tasks
+    priority = models.SmallIntegerField(default=0)  # Higher runs first
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='queued')
+    # Not claimed before this; a claim pushes it past the visibility timeout, so
+    # a task whose worker died becomes claimable again
+    run_after = models.DateTimeField(default=timezone.now)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField(default=3)
+    locked_by = models.CharField(max_length=100, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.name} ({self.status})"
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            # Claiming: due queued tasks and running tasks whose visibility timeout expired
+            models.Index(fields=['status', 'run_after'], name='task_claim_idx'),
+            models.Index(fields=['key', 'status'], name='task_key_idx'),
+        ]
@@ -0,0 +1,94 @@
+"""
+A small background task queue backed by the Task table.
+
+Apps declare tasks in a tasks.py module with the @task decorator and enqueue
+them with keyword arguments that serialise to JSON:
+
+    @task(priority=5)
+    def process_completed_session(session_id):
+        ...
+
+    process_completed_session.enqueue(session_id=session.id)
+
+The Task row is inserted in the caller's transaction, so a task exists only
+if the work that asked for it committed. The run_tasks worker claims due
+tasks, highest priority first, and runs each one inside a transaction that
+also marks it done: a task's database writes commit exactly once, and a
+failed attempt leaves nothing behind before it is retried with backoff.
+A claim hides the task for its visibility timeout; if the worker dies, the
+task becomes claimable again once that passes.
+
+Set TASKS_RUN_EAGERLY to run tasks in-process once the caller's transaction
+commits instead, e.g. in development without a worker.
+"""
+import hashlib
+import json
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Task
+
+DEFAULT_PRIORITY = 0
+DEFAULT_MAX_ATTEMPTS = 3
+DEFAULT_TIMEOUT = 5 * 60  # Visibility timeout, in seconds
+
+_registry = {}
+
+
+def task(name=None, priority=DEFAULT_PRIORITY, max_attempts=DEFAULT_MAX_ATTEMPTS, timeout=DEFAULT_TIMEOUT):
+    """Register a function as a task; it gains an enqueue(**kwargs) method"""
+    def decorator(func):
+        func.task_name = name or f'{func.__module__}.{func.__name__}'
+        func.task_options = {'priority': priority, 'max_attempts': max_attempts, 'timeout': timeout}
+        func.enqueue = lambda unique=False, delay=None, **kwargs: enqueue(
+            func.task_name, unique=unique, delay=delay, **kwargs
+        )
+        _registry[func.task_name] = func
+        return func
+    return decorator
+
+
+def get_task(name):
+    """The registered function for a task name, or None"""
+    return _registry.get(name)
+
+
+def enqueue(name, unique=False, delay=None, **kwargs):
+    """
+    Queue a registered task to run with kwargs.
+
+    With unique=True nothing is added while an identical task (same name and
+    kwargs) is still waiting, so bursts of the same request coalesce. delay
+    (seconds) holds the task back. Returns the Task, or None if nothing was
+    queued.
+    """
+    func = _registry.get(name)
+    if func is None:
+        raise ValueError(f'Unknown task: {name}')
+
+    if getattr(settings, 'TASKS_RUN_EAGERLY', False):
+        transaction.on_commit(lambda: func(**kwargs))
+        return None
+
+    key = ''
+    if unique:
+        payload = json.dumps([name, kwargs], sort_keys=True, separators=(',', ':'))
+        key = hashlib.sha256(payload.encode()).hexdigest()
+        if Task.objects.filter(key=key, status='queued').exists():
+            return None
+
+    options = func.task_options
+    run_after = timezone.now()
+    if delay:
+        run_after += timedelta(seconds=delay)
+    return Task.objects.create(
+        name=name,
+        kwargs=kwargs,
+        key=key,
+        priority=options['priority'],
+        max_attempts=options['max_attempts'],
+        run_after=run_after,
+    )
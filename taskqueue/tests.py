@@ -0,0 +1,149 @@
+from datetime import timedelta
+from io import StringIO
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from .models import Task
+from .queue import task
+from .worker import claim_tasks, run_pending, run_task
+
+calls = []
+
+
+@task(name='tests.record')
+def record(label):
+    calls.append(label)
+
+
+@task(name='tests.urgent', priority=5)
+def urgent(label):
+    calls.append(label)
+
+
+@task(name='tests.create_then_fail', max_attempts=2)
+def create_then_fail(username):
+    User.objects.create_user(username=username, password='testpass123!@#')
+    raise RuntimeError('boom')
+
+
+class TaskQueueTests(TestCase):
+    """Test tasks are queued, claimed by priority, retried and run exactly once"""
+
+    def setUp(self):
+        calls.clear()
+
+    def test_enqueue_and_run(self):
+        """Test a queued task runs once with its kwargs and is marked done"""
+        queued = record.enqueue(label='a')
+
+        self.assertEqual(run_pending(), (1, 0))
+        self.assertEqual(run_pending(), (0, 0))
+
+        self.assertEqual(calls, ['a'])
+        queued.refresh_from_db()
+        self.assertEqual((queued.status, queued.attempts), ('done', 1))
+        self.assertIsNotNone(queued.finished_at)
+
+    def test_priority_order(self):
+        """Test higher priority tasks are claimed first"""
+        record.enqueue(label='normal')
+        urgent.enqueue(label='urgent')
+
+        run_pending()
+
+        self.assertEqual(calls, ['urgent', 'normal'])
+
+    def test_delay(self):
+        """Test a delayed task is not claimed before it is due"""
+        record.enqueue(delay=60, label='later')
+
+        self.assertEqual(run_pending(), (0, 0))
+        self.assertEqual(calls, [])
+
+    def test_unique_tasks_coalesce(self):
+        """Test identical unique tasks are queued once while one is waiting"""
+        record.enqueue(unique=True, label='a')
+        record.enqueue(unique=True, label='a')
+        record.enqueue(unique=True, label='b')
+
+        self.assertEqual(Task.objects.count(), 2)
+        run_pending()
+        record.enqueue(unique=True, label='a')
+        self.assertEqual(Task.objects.filter(status='queued').count(), 1)
+
+    def test_failure_rolls_back_and_retries_with_backoff(self):
+        """Test a failed attempt leaves no writes behind and is retried later, then marked failed"""
+        queued = create_then_fail.enqueue(username='ghost')
+
+        self.assertEqual(run_pending(), (0, 1))
+        queued.refresh_from_db()
+        self.assertEqual((queued.status, queued.attempts), ('queued', 1))
+        self.assertGreater(queued.run_after, timezone.now())
+        self.assertIn('RuntimeError: boom', queued.last_error)
+        self.assertFalse(User.objects.filter(username='ghost').exists())
+
+        Task.objects.filter(pk=queued.pk).update(run_after=timezone.now())
+        run_pending()
+        queued.refresh_from_db()
+        self.assertEqual((queued.status, queued.attempts), ('failed', 2))
+        self.assertFalse(User.objects.filter(username='ghost').exists())
+
+    def test_visibility_timeout_reclaims_task(self):
+        """Test a task whose worker stopped reporting is claimed again, and the old worker loses its lease"""
+        record.enqueue(label='a')
+        [stalled] = claim_tasks('worker-1')
+        self.assertEqual(claim_tasks('worker-2'), [])
+
+        Task.objects.filter(pk=stalled.pk).update(run_after=timezone.now() - timedelta(seconds=1))
+        [reclaimed] = claim_tasks('worker-2')
+
+        self.assertEqual((reclaimed.locked_by, reclaimed.attempts), ('worker-2', 2))
+        self.assertFalse(run_task(stalled))
+        self.assertTrue(run_task(reclaimed))
+        self.assertEqual(calls, ['a', 'a'])  # The stalled run's writes were rolled back
+        self.assertEqual(Task.objects.get().status, 'done')
+
+    def test_expired_last_attempt_is_failed(self):
+        """Test a task out of attempts is marked failed when its visibility timeout expires"""
+        queued = record.enqueue(label='a')
+        Task.objects.filter(pk=queued.pk).update(
+            status='running', attempts=queued.max_attempts, run_after=timezone.now() - timedelta(seconds=1)
+        )
+
+        self.assertEqual(claim_tasks('worker'), [])
+        self.assertEqual(Task.objects.get().status, 'failed')
+
+    def test_unknown_task_fails(self):
+        """Test a row naming an unregistered task is failed without retrying"""
+        Task.objects.create(name='tests.missing')
+
+        self.assertEqual(run_pending(), (0, 1))
+        self.assertEqual(Task.objects.get().status, 'failed')
+
+    @override_settings(TASKS_RUN_EAGERLY=True)
+    def test_eager_mode_runs_on_commit(self):
+        """Test eager mode runs the task in-process once the transaction commits, without a row"""
+        with self.captureOnCommitCallbacks(execute=True):
+            record.enqueue(label='now')
+            self.assertEqual(calls, [])
+
+        self.assertEqual(calls, ['now'])
+        self.assertFalse(Task.objects.exists())
+
+    def test_run_tasks_command(self):
+        """Test the worker command runs due tasks and purges old finished ones"""
+        old = record.enqueue(label='old')
+        run_pending()
+        Task.objects.filter(pk=old.pk).update(finished_at=timezone.now() - timedelta(days=30))
+        record.enqueue(label='new')
+        out = StringIO()
+
+        call_command('run_tasks', '--once', stdout=out)
+
+        self.assertIn('Ran 1 tasks, 0 failed', out.getvalue())
+        self.assertEqual(calls, ['old', 'new'])
+        self.assertEqual(list(Task.objects.values_list('status', flat=True)), ['done'])
+
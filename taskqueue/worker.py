@@ -0,0 +1,114 @@
+"""
+Claiming and running queued tasks (see taskqueue.queue).
+
+Claims are conditional updates on the row's (status, run_after, attempts), so
+several workers can poll the same table without locking each other out and
+without two of them winning the same task.
+"""
+import os
+import socket
+import traceback
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import Task
+from .queue import DEFAULT_TIMEOUT, get_task
+
+RETRY_BASE_SECONDS = 10
+RETRY_MAX_SECONDS = 60 * 60
+CLAIM_BATCH_SIZE = 10
+
+
+class LeaseLost(Exception):
+    """The task was reclaimed by another worker after its visibility timeout passed"""
+
+
+def worker_name():
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+
+def retry_delay(attempts):
+    """Exponential backoff before the next attempt"""
+    return timedelta(seconds=min(RETRY_BASE_SECONDS * 2 ** (attempts - 1), RETRY_MAX_SECONDS))
+
+
+def claim_tasks(worker, limit=CLAIM_BATCH_SIZE):
+    """Claim up to limit due tasks, highest priority first, and return them"""
+    now = timezone.now()
+    candidates = Task.objects.filter(
+        Q(status='queued') | Q(status='running'), run_after__lte=now,
+    ).order_by('-priority', 'run_after', 'id')[:limit]
+
+    claimed = []
+    for task in candidates:
+        if task.status == 'running' and task.attempts >= task.max_attempts:
+            # The last attempt's worker never reported back
+            Task.objects.filter(pk=task.pk, status='running', run_after=task.run_after).update(
+                status='failed', last_error='Visibility timeout expired', finished_at=now
+            )
+            continue
+        func = get_task(task.name)
+        timeout = func.task_options['timeout'] if func else DEFAULT_TIMEOUT
+        lease = {'status': 'running', 'run_after': now + timedelta(seconds=timeout), 'locked_by': worker}
+        won = Task.objects.filter(
+            pk=task.pk, status=task.status, run_after=task.run_after, attempts=task.attempts,
+        ).update(attempts=F('attempts') + 1, **lease)
+        if won:
+            for field, value in lease.items():
+                setattr(task, field, value)
+            task.attempts += 1
+            claimed.append(task)
+    return claimed
+
+
+def run_task(task):
+    """
+    Run a claimed task, returning True if it succeeded.
+
+    The task's work and its completion commit together. On failure the task
+    is queued again after a backoff, or marked failed once out of attempts.
+    """
+    lease = Task.objects.filter(pk=task.pk, status='running', locked_by=task.locked_by, attempts=task.attempts)
+    func = get_task(task.name)
+    try:
+        if func is None:
+            raise LookupError(f'Unknown task: {task.name}')
+        with transaction.atomic():
+            func(**task.kwargs)
+            if not lease.update(status='done', finished_at=timezone.now(), last_error=''):
+                raise LeaseLost(f'Task {task.pk} was reclaimed while running')
+        return True
+    except LeaseLost:
+        return False  # Its new owner runs it; the work above was rolled back
+    except Exception:
+        error = traceback.format_exc()
+        if task.attempts < task.max_attempts and func is not None:
+            lease.update(status='queued', run_after=timezone.now() + retry_delay(task.attempts), last_error=error)
+        else:
+            lease.update(status='failed', finished_at=timezone.now(), last_error=error)
+        return False
+
+
+def run_pending(worker='inline', limit=None):
+    """Run due tasks until none are left (or limit have run); returns (succeeded, failed)"""
+    succeeded = failed = 0
+    while limit is None or succeeded + failed < limit:
+        remaining = CLAIM_BATCH_SIZE if limit is None else limit - succeeded - failed
+        batch = claim_tasks(worker, min(CLAIM_BATCH_SIZE, remaining))
+        if not batch:
+            break
+        for task in batch:
+            if run_task(task):
+                succeeded += 1
+            else:
+                failed += 1
+    return succeeded, failed
+
+
+def purge_finished(older_than):
+    """Delete done tasks finished before older_than; failed ones are kept for inspection"""
+    deleted, _ = Task.objects.filter(status='done', finished_at__lt=older_than).delete()
+    return deleted
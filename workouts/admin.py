@@ -1,5 +1,9 @@
 from django.contrib import admin
-from .models import WorkoutSession, WorkoutSet
+from django.utils.html import format_html, format_html_join
+from exercises.models import Exercise
+from .archive import unpack_sets
+from .models import (WorkoutSession, WorkoutSet, ArchivedSession, DailyTrainingRollup, WeeklyMuscleRollup,
+                     PersonalRecord)
 
 
 class WorkoutSetInline(admin.TabularInline):
@@ -14,7 +18,7 @@ class WorkoutSessionAdmin(admin.ModelAdmin):
     list_display = ['routine', 'user', 'status', 'total_volume', 'started_at', 'completed_at']
     list_filter = ['status', 'started_at', 'routine__name', 'user']
     search_fields = ['routine__name', 'user__username', 'notes']
-    readonly_fields = ['started_at', 'total_volume', 'get_exercises_completed']
+    readonly_fields = ['started_at', 'total_volume', 'get_exercises_completed', 'archived_sets']
     inlines = [WorkoutSetInline]
     
     fieldsets = (
@@ -28,8 +32,37 @@ class WorkoutSessionAdmin(admin.ModelAdmin):
             'fields': ('total_volume', 'get_exercises_completed'),
             'classes': ('collapse',)
         }),
+        ('Archived Sets', {
+            'fields': ('archived_sets',),
+            'classes': ('collapse',)
+        }),
     )
 
+    @admin.display(description='Archived sets')
+    def archived_sets(self, obj):
+        """Read-only table of the sets packed into the session's archive"""
+        archive = ArchivedSession.objects.filter(session=obj).first()
+        if archive is None:
+            return '-'
+        workout_sets = unpack_sets(archive)
+        names = dict(
+            Exercise.objects.filter(id__in={workout_set.exercise_id for workout_set in workout_sets})
+            .values_list('id', 'title')
+        )
+        rows = format_html_join(
+            '', '<tr><td>{}</td><td>{}</td><td>{}</td><td>{}</td><td>{}</td><td>{}</td></tr>',
+            (
+                (names.get(workout_set.exercise_id, workout_set.exercise_id), workout_set.set_number,
+                 workout_set.weight, workout_set.reps, workout_set.volume, workout_set.completed_at)
+                for workout_set in workout_sets
+            ),
+        )
+        return format_html(
+            '<table><tr><th>Exercise</th><th>Set</th><th>Weight</th><th>Reps</th><th>Volume</th>'
+            '<th>Completed</th></tr>{}</table>',
+            rows,
+        )
+
 
 @admin.register(WorkoutSet)
 class WorkoutSetAdmin(admin.ModelAdmin):
@@ -37,3 +70,33 @@ class WorkoutSetAdmin(admin.ModelAdmin):
     list_filter = ['exercise', 'session__routine', 'completed_at']
     search_fields = ['exercise__name', 'session__routine__name', 'notes']
     readonly_fields = ['volume', 'completed_at']
+
+
+@admin.register(ArchivedSession)
+class ArchivedSessionAdmin(admin.ModelAdmin):
+    list_display = ['session', 'set_count', 'exercise_count', 'volume', 'archived_at']
+    search_fields = ['session__routine__name', 'session__user__username']
+    exclude = ['data']
+    readonly_fields = ['session', 'set_count', 'exercise_count', 'volume', 'first_set_at', 'last_set_at', 'notes',
+                       'archived_at']
+
+
+@admin.register(DailyTrainingRollup)
+class DailyTrainingRollupAdmin(admin.ModelAdmin):
+    list_display = ['user', 'day', 'sessions', 'sets', 'reps', 'volume', 'top_weight']
+    list_filter = ['day']
+    search_fields = ['user__username']
+
+
+@admin.register(WeeklyMuscleRollup)
+class WeeklyMuscleRollupAdmin(admin.ModelAdmin):
+    list_display = ['user', 'week_start', 'muscle', 'sets', 'reps', 'volume', 'top_weight']
+    list_filter = ['week_start', 'muscle']
+    search_fields = ['user__username']
+
+
+@admin.register(PersonalRecord)
+class PersonalRecordAdmin(admin.ModelAdmin):
+    list_display = ['user', 'exercise', 'best_one_rep_max', 'best_session_volume', 'updated_at']
+    search_fields = ['user__username', 'exercise__title']
+    readonly_fields = ['best_weights', 'best_one_rep_max', 'best_session_volume', 'best_session', 'updated_at']
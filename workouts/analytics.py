@@ -0,0 +1,247 @@
+"""
+Per-user training analytics computed with NumPy.
+
+A user's whole set history is read in one query and turned into columnar
+arrays; every statistic is then a handful of vectorised operations (grouped
+maxima with ufunc.at, grouped least squares with bincount, histograms), with
+no Python loop over sets. Results are cached per user and dropped whenever
+one of their sets changes.
+"""
+from datetime import datetime, time, timedelta, timezone as dt_timezone
+
+import numpy as np
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+
+from exercises.models import Exercise
+from .archive import load_archived_columns
+from .models import WorkoutSession, WorkoutSet
+
+# Keyed by week too, so cached weekly series roll over on Monday without invalidation
+ANALYTICS_CACHE_KEY = 'workouts:analytics:{user_id}:{week}'
+ANALYTICS_CACHE_TIMEOUT = 60 * 60 * 24  # Invalidated on set changes, the timeout is only a backstop
+
+ANALYTICS_WEEKS = 52
+SECONDS_PER_WEEK = 7 * 24 * 60 * 60
+BRZYCKI_MAX_REPS = 36  # The Brzycki formula diverges at 37 reps
+
+INTENSITY_BINS = [0, 0.5, 0.6, 0.7, 0.8, 0.9, np.inf]
+INTENSITY_LABELS = ['<50%', '50-60%', '60-70%', '70-80%', '80-90%', '90%+']
+REP_RANGE_BINS = [1, 4, 7, 13, 21, np.inf]
+REP_RANGE_LABELS = ['1-3', '4-6', '7-12', '13-20', '21+']
+
+SECTIONS = ('one_rep_max', 'muscle_volume', 'intensity', 'trends')
+
+
+def load_user_sets(user_id):
+    """
+    Read a user's sets as columnar arrays in one query (plus one for archived sets, if any).
+
+    Returns a dict of equal-length arrays (exercise_id, weight, reps, volume,
+    timestamp in epoch seconds, muscle) plus an exercise id -> name mapping.
+    Archived sets are decoded straight into arrays, without building WorkoutSets.
+    """
+    rows = list(
+        WorkoutSet.objects.filter(session__user_id=user_id, reps__gt=0)
+        .order_by()
+        .values_list('exercise_id', 'exercise__title', 'exercise__name', 'exercise__muscle',
+                     'weight', 'reps', 'volume', 'completed_at')
+    )
+    names = {row[0]: row[1] or row[2] for row in rows}
+    parts = []
+    if rows:
+        exercise_ids, _, _, muscles, weights, reps, volumes, completed = zip(*rows)
+        parts.append({
+            'exercise_id': np.asarray(exercise_ids, dtype=np.int64),
+            'muscle': np.asarray([muscle or 'other' for muscle in muscles]),
+            'weight': np.asarray(weights, dtype=np.float64),
+            'reps': np.asarray(reps, dtype=np.float64),
+            'volume': np.asarray(volumes, dtype=np.float64),
+            'timestamp': np.asarray([moment.timestamp() for moment in completed], dtype=np.float64),
+        })
+
+    archived = load_archived_columns(WorkoutSession.objects.filter(user_id=user_id))
+    done = archived['reps'] > 0
+    if done.any():
+        exercise_codes, exercise_index = np.unique(archived['exercise_id'][done], return_inverse=True)
+        exercises = {
+            exercise_id: (title or name, muscle or 'other')
+            for exercise_id, title, name, muscle in Exercise.objects.filter(
+                id__in=exercise_codes.tolist()
+            ).values_list('id', 'title', 'name', 'muscle')
+        }
+        # Sets of exercises deleted since they were archived are left out
+        known = np.asarray([int(code) in exercises for code in exercise_codes])[exercise_index]
+        kept = np.flatnonzero(done)[known]
+        if len(kept):
+            muscles = np.asarray([exercises.get(int(code), (None, 'other'))[1] for code in exercise_codes])
+            weight = archived['weight'][kept].astype(np.float64)  # Hundredths
+            reps = archived['reps'][kept].astype(np.float64)
+            parts.append({
+                'exercise_id': archived['exercise_id'][kept].astype(np.int64),
+                'muscle': muscles[exercise_index[known]],
+                'weight': weight / 100,
+                'reps': reps,
+                'volume': weight * reps / 100,
+                'timestamp': archived['completed_at'][kept] / 1e6,
+            })
+            names.update((exercise_id, name) for exercise_id, (name, _) in exercises.items())
+    if not parts:
+        return None, names
+
+    return {name: np.concatenate([part[name] for part in parts]) for name in parts[0]}, names
+
+
+def estimate_one_rep_max(weight, reps):
+    """Epley and Brzycki 1RM estimates for arrays of weight and reps (a single rep is the weight itself)"""
+    epley = np.where(reps == 1, weight, weight * (1 + reps / 30))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        brzycki = np.where(reps <= BRZYCKI_MAX_REPS, weight * 36 / (37 - reps), np.nan)
+    return epley, brzycki
+
+
+def _grouped_slopes(groups, x, y, group_count):
+    """Least-squares slope of y over x within each group, vectorised with bincount (nan if undefined)"""
+    n = np.bincount(groups, minlength=group_count)
+    sum_x = np.bincount(groups, x, group_count)
+    sum_y = np.bincount(groups, y, group_count)
+    sum_xy = np.bincount(groups, x * y, group_count)
+    sum_xx = np.bincount(groups, x * x, group_count)
+    denominator = n * sum_xx - sum_x ** 2
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(denominator > 0, (n * sum_xy - sum_x * sum_y) / denominator, np.nan)
+
+
+def _round(values, digits=1):
+    return [None if np.isnan(value) else round(float(value), digits) for value in values]
+
+
+def _week_starts(now):
+    """
+    Local Monday of each of the last ANALYTICS_WEEKS weeks, oldest first, and
+    the epoch second each one starts at (plus the start of next week).
+
+    Weeks follow the active timezone like the rollups do, so they are not all
+    SECONDS_PER_WEEK long across a DST change.
+    """
+    today = timezone.localdate(now)
+    this_week = today - timedelta(days=today.weekday())
+    mondays = [this_week - timedelta(weeks=weeks) for weeks in range(ANALYTICS_WEEKS - 1, -2, -1)]
+    boundaries = np.asarray(
+        [timezone.make_aware(datetime.combine(monday, time.min)).timestamp() for monday in mondays],
+        dtype=np.float64,
+    )
+    return mondays[:-1], boundaries
+
+
+def compute_analytics(columns, names, now=None):
+    """Compute every analytics section from columnar set data"""
+    now = now or timezone.now()
+    mondays, week_boundaries = _week_starts(now)
+    week_labels = [monday.isoformat() for monday in mondays]
+    if columns is None:
+        return {
+            'set_count': 0,
+            'one_rep_max': [],
+            'muscle_volume': {'weeks': week_labels, 'muscles': {}},
+            'intensity': {
+                'relative_intensity': dict.fromkeys(INTENSITY_LABELS, 0),
+                'rep_ranges': dict.fromkeys(REP_RANGE_LABELS, 0),
+            },
+            'trends': {'weeks': week_labels, 'volume': [0.0] * ANALYTICS_WEEKS, 'sets': [0] * ANALYTICS_WEEKS,
+                       'volume_slope_per_week': None},
+        }
+
+    weight, reps, volume, timestamp = columns['weight'], columns['reps'], columns['volume'], columns['timestamp']
+    exercise_codes, exercise_index = np.unique(columns['exercise_id'], return_inverse=True)
+    exercise_count = len(exercise_codes)
+
+    # Estimated 1RM: best per exercise, plus its trend in kg per week
+    epley, brzycki = estimate_one_rep_max(weight, reps)
+    best_epley = np.zeros(exercise_count)
+    np.maximum.at(best_epley, exercise_index, epley)
+    best_brzycki = np.zeros(exercise_count)
+    np.maximum.at(best_brzycki, exercise_index, np.nan_to_num(brzycki, nan=0.0))
+    set_counts = np.bincount(exercise_index, minlength=exercise_count)
+    last_trained = np.zeros(exercise_count)
+    np.maximum.at(last_trained, exercise_index, timestamp)
+    slopes = _grouped_slopes(exercise_index, timestamp / SECONDS_PER_WEEK, epley, exercise_count)
+
+    order = np.argsort(-best_epley, kind='stable')
+    one_rep_max = [
+        {
+            'exercise_id': int(exercise_codes[i]),
+            'name': names.get(int(exercise_codes[i])),
+            'epley': round(float(best_epley[i]), 1),
+            'brzycki': round(float(best_brzycki[i]), 1) if best_brzycki[i] else None,
+            'sets': int(set_counts[i]),
+            'trend_per_week': _round([slopes[i]], 2)[0],
+            'last_trained': datetime.fromtimestamp(last_trained[i], dt_timezone.utc).isoformat(),
+        }
+        for i in order
+    ]
+
+    # Weekly volume per muscle over the last ANALYTICS_WEEKS weeks
+    week_index = np.searchsorted(week_boundaries, timestamp, side='right') - 1
+    recent = (week_index >= 0) & (week_index < ANALYTICS_WEEKS)
+    muscle_codes, muscle_index = np.unique(columns['muscle'], return_inverse=True)
+    muscle_volume = np.zeros((len(muscle_codes), ANALYTICS_WEEKS))
+    np.add.at(muscle_volume, (muscle_index[recent], week_index[recent]), volume[recent])
+
+    # Intensity relative to the exercise's best estimated 1RM, and rep ranges
+    with np.errstate(divide='ignore', invalid='ignore'):
+        relative = np.where(best_epley[exercise_index] > 0, weight / best_epley[exercise_index], 0)
+    intensity_counts, _ = np.histogram(relative, bins=INTENSITY_BINS)
+    rep_counts, _ = np.histogram(reps, bins=REP_RANGE_BINS)
+
+    # Weekly totals and their linear trend
+    weekly_volume = muscle_volume.sum(axis=0)
+    weekly_sets = np.bincount(week_index[recent], minlength=ANALYTICS_WEEKS)
+    active = np.nonzero(weekly_volume)[0]
+    volume_slope = float(np.polyfit(active, weekly_volume[active], 1)[0]) if len(active) >= 2 else None
+
+    return {
+        'set_count': int(len(weight)),
+        'one_rep_max': one_rep_max,
+        'muscle_volume': {
+            'weeks': week_labels,
+            'muscles': {
+                str(muscle): _round(muscle_volume[i])
+                for i, muscle in enumerate(muscle_codes) if muscle_volume[i].any()
+            },
+        },
+        'intensity': {
+            'relative_intensity': dict(zip(INTENSITY_LABELS, map(int, intensity_counts))),
+            'rep_ranges': dict(zip(REP_RANGE_LABELS, map(int, rep_counts))),
+        },
+        'trends': {
+            'weeks': week_labels,
+            'volume': _round(weekly_volume),
+            'sets': [int(count) for count in weekly_sets],
+            'volume_slope_per_week': round(volume_slope, 1) if volume_slope is not None else None,
+        },
+    }
+
+
+def _cache_key(user_id):
+    week = timezone.localdate().strftime('%G-W%V')
+    return ANALYTICS_CACHE_KEY.format(user_id=user_id, week=week)
+
+
+def get_user_analytics(user):
+    """Return the cached analytics for a user, recomputing them only on a cache miss"""
+    key = _cache_key(user.pk)
+    analytics = cache.get(key)
+    if analytics is None:
+        columns, names = load_user_sets(user.pk)
+        analytics = compute_analytics(columns, names)
+        cache.set(key, analytics, ANALYTICS_CACHE_TIMEOUT)
+    return analytics
+
+
+def invalidate_user_analytics(user_id):
+    """Drop a user's cached analytics, now and again once the surrounding transaction commits"""
+    key = _cache_key(user_id)
+    cache.delete(key)
+    transaction.on_commit(lambda: cache.delete(key))
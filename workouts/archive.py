@@ -0,0 +1,275 @@
+"""
+Compact storage for the sets of old completed sessions.
+
+A set row costs two decimals, a timestamp, a text column and its indexes.
+Once a session has been completed for longer than WORKOUT_ARCHIVE_AFTER_DAYS
+its sets are moved into a single ArchivedSession row: one array per column
+(exercise id, set number, weight in hundredths, reps, actual rest, completion
+time in microseconds), concatenated and compressed with zlib. Notes are kept
+sparsely beside the blob, volumes are recomputed from weight and reps, and
+offline-sync client ids are dropped.
+
+Reads go through session_sets and load_archived_sets, which return unsaved
+WorkoutSet instances, so history, admin, exports and the rebuild commands see
+archived and live sets alike. Code that only aggregates (analytics, record
+rebuilds) uses load_archived_columns instead, which skips building the
+instances. A set later saved into an archived session stays live until the
+next archive run merges it in.
+"""
+import struct
+import zlib
+from contextvars import ContextVar
+from datetime import datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import ArchivedSession, WorkoutSession, WorkoutSet
+
+FORMAT_VERSION = 1
+HEADER = struct.Struct('<BI')  # Format version, set count
+
+COLUMNS = (
+    ('exercise_id', '<u4'),
+    ('set_number', '<u4'),
+    ('weight', '<i4'),  # Hundredths, as the weight column stores it
+    ('reps', '<u4'),
+    ('rest_time_actual', '<i4'),  # -1 when not recorded
+    ('completed_at', '<i8'),  # Microseconds since the epoch
+)
+# Added by load_archived_columns to every row
+OWNER_COLUMNS = (
+    ('session_id', '<i8'),
+    ('user_id', '<i8'),
+)
+
+DEFAULT_ARCHIVE_AFTER_DAYS = 180
+DEFAULT_CHUNK_SIZE = 200
+
+_moving_sets = ContextVar('workouts_archive_moving_sets', default=False)
+
+EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+MICROSECOND = timedelta(microseconds=1)
+HUNDRED = Decimal(100)
+
+
+def archive_cutoff(days=None):
+    """Sessions completed before this moment are archived"""
+    if days is None:
+        days = getattr(settings, 'WORKOUT_ARCHIVE_AFTER_DAYS', DEFAULT_ARCHIVE_AFTER_DAYS)
+    return timezone.now() - timedelta(days=days)
+
+
+def pack_sets(workout_sets):
+    """Pack sets into (compressed column blob, sparse notes)"""
+    workout_sets = list(workout_sets)
+    values = {
+        'exercise_id': [workout_set.exercise_id for workout_set in workout_sets],
+        'set_number': [workout_set.set_number for workout_set in workout_sets],
+        'weight': [int(Decimal(str(workout_set.weight)) * HUNDRED) for workout_set in workout_sets],
+        'reps': [workout_set.reps for workout_set in workout_sets],
+        'rest_time_actual': [
+            -1 if workout_set.rest_time_actual is None else workout_set.rest_time_actual for workout_set in workout_sets
+        ],
+        'completed_at': [(workout_set.completed_at - EPOCH) // MICROSECOND for workout_set in workout_sets],
+    }
+    body = b''.join(np.asarray(values[name], dtype=dtype).tobytes() for name, dtype in COLUMNS)
+    notes = {str(i): workout_set.notes for i, workout_set in enumerate(workout_sets) if workout_set.notes}
+    return zlib.compress(HEADER.pack(FORMAT_VERSION, len(workout_sets)) + body), notes
+
+
+def unpack_columns(data):
+    """Decode a blob into a dict of equal-length NumPy arrays"""
+    raw = zlib.decompress(bytes(data))
+    version, count = HEADER.unpack_from(raw)
+    if version != FORMAT_VERSION:
+        raise ValueError(f'Unknown archive format version: {version}')
+    columns = {}
+    offset = HEADER.size
+    for name, dtype in COLUMNS:
+        columns[name] = np.frombuffer(raw, dtype=dtype, count=count, offset=offset)
+        offset += columns[name].nbytes
+    return columns
+
+
+def unpack_sets(archive):
+    """The archived sets of a session as unsaved WorkoutSet instances, in the order they were done"""
+    columns = unpack_columns(archive.data)
+    workout_sets = []
+    for i in range(len(columns['exercise_id'])):
+        weight = (Decimal(int(columns['weight'][i])) / HUNDRED).quantize(Decimal('0.01'))
+        reps = int(columns['reps'][i])
+        rest = int(columns['rest_time_actual'][i])
+        workout_sets.append(WorkoutSet(
+            session_id=archive.session_id,
+            exercise_id=int(columns['exercise_id'][i]),
+            set_number=int(columns['set_number'][i]),
+            weight=weight,
+            reps=reps,
+            volume=WorkoutSet.compute_volume(weight, reps),
+            rest_time_actual=None if rest < 0 else rest,
+            completed_at=EPOCH + int(columns['completed_at'][i]) * MICROSECOND,
+            notes=archive.notes.get(str(i), ''),
+        ))
+    return workout_sets
+
+
+def session_sets(session):
+    """Every set of a session, archived and live, ordered by completion time"""
+    archive = ArchivedSession.objects.filter(session_id=session.pk).first()
+    workout_sets = unpack_sets(archive) if archive else []
+    workout_sets.extend(session.workout_sets.all())
+    return sorted(workout_sets, key=lambda workout_set: workout_set.completed_at)
+
+
+def load_archived_sets(sessions, start=None, end=None):
+    """
+    Unpack the archived sets of a session queryset.
+
+    With start and/or end, only archives overlapping that time range are read
+    and only sets completed in [start, end) are returned. Each set's session is
+    set from the queryset, so set.session.user_id costs no query.
+    """
+    archives = ArchivedSession.objects.filter(session__in=sessions).select_related('session')
+    if start is not None:
+        archives = archives.filter(last_set_at__gte=start)
+    if end is not None:
+        archives = archives.filter(first_set_at__lt=end)
+    workout_sets = []
+    for archive in archives.iterator(chunk_size=500):
+        for workout_set in unpack_sets(archive):
+            if (start is None or workout_set.completed_at >= start) and (end is None or workout_set.completed_at < end):
+                workout_set.session = archive.session
+                workout_sets.append(workout_set)
+    return workout_sets
+
+
+def load_archived_columns(sessions, start=None, end=None, exercise_ids=None):
+    """
+    Decode the archived sets of a session queryset into one dict of NumPy columns.
+
+    Holds the COLUMNS as stored (weight in hundredths, completed_at in
+    microseconds) plus each set's session_id and user_id. start, end and
+    exercise_ids filter the rows as in load_archived_sets, before anything is
+    concatenated, and no WorkoutSet instances are built. Archives holding none
+    of exercise_ids are not decompressed at all.
+    """
+    archives = ArchivedSession.objects.filter(session__in=sessions)
+    if start is not None:
+        archives = archives.filter(last_set_at__gte=start)
+    if end is not None:
+        archives = archives.filter(first_set_at__lt=end)
+    wanted = None if exercise_ids is None else np.fromiter(exercise_ids, dtype=np.int64)
+    wanted_ids = None if wanted is None else set(wanted.tolist())
+
+    parts = [{name: np.empty(0, dtype=dtype) for name, dtype in COLUMNS + OWNER_COLUMNS}]
+    for session_id, user_id, archived_ids, data in archives.values_list(
+        'session_id', 'session__user_id', 'exercise_ids', 'data'
+    ).iterator(chunk_size=500):
+        if wanted_ids is not None and wanted_ids.isdisjoint(archived_ids):
+            continue
+        columns = unpack_columns(data)
+        keep = np.ones(len(columns['exercise_id']), dtype=bool)
+        if start is not None:
+            keep &= columns['completed_at'] >= (start - EPOCH) // MICROSECOND
+        if end is not None:
+            keep &= columns['completed_at'] < (end - EPOCH) // MICROSECOND
+        if wanted is not None:
+            keep &= np.isin(columns['exercise_id'], wanted)
+        count = int(keep.sum())
+        if not count:
+            continue
+        part = {name: column[keep] for name, column in columns.items()}
+        part['session_id'] = np.full(count, session_id, dtype=np.int64)
+        part['user_id'] = np.full(count, user_id, dtype=np.int64)
+        parts.append(part)
+    return {name: np.concatenate([part[name] for part in parts]) for name in parts[0]}
+
+
+def is_moving_sets():
+    """Whether the sets being deleted are being moved into an archive (see _delete_moved_sets)"""
+    return _moving_sets.get()
+
+
+def _delete_moved_sets(set_ids):
+    """
+    Delete live sets that were just packed into their archives.
+
+    This goes through the queryset delete, so WorkoutSet.delete() and its
+    rollup and record maintenance are skipped, as they should be: the sets
+    still count through the archive. Nothing references a WorkoutSet, so there
+    is no cascade. The post_delete receivers return early while
+    is_moving_sets() is true.
+    """
+    token = _moving_sets.set(True)
+    try:
+        WorkoutSet.objects.filter(pk__in=set_ids).delete()
+    finally:
+        _moving_sets.reset(token)
+
+
+def _build_archive(session_id, workout_sets, existing=None):
+    """An ArchivedSession (new, or existing updated in place) holding workout_sets"""
+    workout_sets = sorted(workout_sets, key=lambda workout_set: workout_set.completed_at)
+    archive = existing or ArchivedSession(session_id=session_id)
+    archive.data, archive.notes = pack_sets(workout_sets)
+    archive.set_count = len(workout_sets)
+    archive.exercise_ids = sorted({workout_set.exercise_id for workout_set in workout_sets})
+    archive.exercise_count = len(archive.exercise_ids)
+    archive.volume = sum((Decimal(str(workout_set.volume)) for workout_set in workout_sets), Decimal('0'))
+    archive.first_set_at = workout_sets[0].completed_at
+    archive.last_set_at = workout_sets[-1].completed_at
+    return archive
+
+
+def archive_sessions(cutoff=None, user_ids=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Move the live sets of sessions completed before cutoff into their archives.
+
+    Works a chunk of sessions per transaction; sets already archived for a
+    session are merged with its new live ones. Returns (sessions, sets) archived.
+    """
+    from .state import invalidate_session_state
+
+    cutoff = cutoff or archive_cutoff()
+    pending = WorkoutSession.objects.filter(
+        status='completed', completed_at__lt=cutoff, workout_sets__isnull=False,
+    ).distinct().order_by('id')
+    if user_ids is not None:
+        pending = pending.filter(user_id__in=user_ids)
+
+    session_total = set_total = 0
+    # Archived sessions drop out of pending, so each pass takes the next chunk
+    while session_ids := list(pending.values_list('id', flat=True)[:chunk_size]):
+        with transaction.atomic():
+            sets_by_session = {}
+            for workout_set in WorkoutSet.objects.filter(session_id__in=session_ids):
+                sets_by_session.setdefault(workout_set.session_id, []).append(workout_set)
+            existing = {archive.session_id: archive for archive in ArchivedSession.objects.filter(session_id__in=session_ids)}
+
+            created, updated = [], []
+            for session_id, live_sets in sets_by_session.items():
+                archive = existing.get(session_id)
+                archived_sets = unpack_sets(archive) if archive else []
+                (updated if archive else created).append(_build_archive(session_id, archived_sets + live_sets, archive))
+                set_total += len(live_sets)
+
+            ArchivedSession.objects.bulk_create(created)
+            if updated:
+                now = timezone.now()  # bulk_update skips auto_now
+                for archive in updated:
+                    archive.archived_at = now
+                ArchivedSession.objects.bulk_update(updated, [
+                    'data', 'notes', 'set_count', 'exercise_count', 'exercise_ids', 'volume', 'first_set_at',
+                    'last_set_at', 'archived_at',
+                ])
+            # Only the sets read above are deleted; one saved meanwhile stays live until the next run
+            _delete_moved_sets([workout_set.pk for live_sets in sets_by_session.values() for workout_set in live_sets])
+            moved = list(sets_by_session)
+            transaction.on_commit(lambda: invalidate_session_state(*moved))
+        session_total += len(sets_by_session)
+
+    return session_total, set_total
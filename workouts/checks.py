@@ -0,0 +1,20 @@
+from django.conf import settings
+from django.core.checks import Tags, Warning, register
+
+PROCESS_LOCAL_CACHES = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+@register(Tags.caches, deploy=True)
+def check_shared_cache(app_configs, **kwargs):
+    """Session state, routine summaries and analytics rely on every process seeing the same cache"""
+    if settings.CACHES['default']['BACKEND'] in PROCESS_LOCAL_CACHES:
+        return [Warning(
+            'The default cache is local to each process.',
+            hint='Set REDIS_URL (or configure another shared cache) when more than one process serves '
+                 'requests; otherwise cached session state and invalidated summaries go stale across processes.',
+            id='workouts.W001',
+        )]
+    return []
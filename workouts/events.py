@@ -0,0 +1,134 @@
+"""
+Live workout session events.
+
+Views publish events for a session once their transaction commits: sets
+saved, the current exercise advancing, the session completing. The
+session_events view streams them over Server-Sent Events to every device that
+has the session open, so a phone logging sets and a tablet showing the
+session stay in sync without polling.
+
+The broker is chosen by the WORKOUT_EVENTS_BROKER setting. The default
+InProcessBroker fans events out to subscribers in the same process, which
+covers a single ASGI worker. Deployments running several workers point the
+setting at a broker with the same two methods, for example one backed by
+Redis pub/sub:
+
+    publish(channel, event)  callable from any thread, sync code included
+    subscribe(channel)       async context manager yielding an object with
+                             an awaitable get() returning the next event
+"""
+import asyncio
+import contextlib
+import itertools
+import json
+import threading
+from collections import defaultdict
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+DEFAULT_BROKER = 'workouts.events.InProcessBroker'
+SUBSCRIBER_QUEUE_SIZE = 100
+
+EVENT_TYPES = ('set_saved', 'exercise_advanced', 'session_completed')
+
+_event_ids = itertools.count(1)
+
+
+def session_channel(session_id):
+    return f'workouts:session:{session_id}'
+
+
+class InProcessBroker:
+    """Fans events out to subscribers of this process; publish() is safe to call from any thread"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = defaultdict(set)  # channel -> {(event loop, queue)}
+
+    def publish(self, channel, event):
+        """Deliver event to every current subscriber of channel; returns how many there were"""
+        with self._lock:
+            subscribers = list(self._subscribers.get(channel, ()))
+        for loop, queue in subscribers:
+            try:
+                loop.call_soon_threadsafe(self._deliver, queue, event)
+            except RuntimeError:
+                pass  # The subscriber's loop has closed; its unsubscribe is on the way
+        return len(subscribers)
+
+    @staticmethod
+    def _deliver(queue, event):
+        if queue.full():
+            # A stalled client loses its oldest event rather than holding up publishers
+            queue.get_nowait()
+        queue.put_nowait(event)
+
+    @contextlib.asynccontextmanager
+    async def subscribe(self, channel):
+        queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        subscriber = (asyncio.get_running_loop(), queue)
+        with self._lock:
+            self._subscribers[channel].add(subscriber)
+        try:
+            yield queue
+        finally:
+            with self._lock:
+                self._subscribers[channel].discard(subscriber)
+                if not self._subscribers[channel]:
+                    del self._subscribers[channel]
+
+
+@lru_cache(maxsize=None)
+def get_broker():
+    """The process-wide broker named by WORKOUT_EVENTS_BROKER"""
+    return import_string(getattr(settings, 'WORKOUT_EVENTS_BROKER', DEFAULT_BROKER))()
+
+
+def session_event(session_id, event_type, data):
+    """Build an event for a session's channel"""
+    return {
+        'id': next(_event_ids),
+        'type': event_type,
+        'session_id': session_id,
+        'sent_at': timezone.now().isoformat(),
+        'data': data,
+    }
+
+
+def publish_session_event(session_id, event_type, data):
+    """Publish an event to a session's subscribers once the current transaction commits"""
+    event = session_event(session_id, event_type, data)
+    transaction.on_commit(lambda: get_broker().publish(session_channel(session_id), event))
+
+
+def format_sse(event):
+    """Encode an event as a Server-Sent Events message"""
+    payload = json.dumps({**event['data'], 'session_id': event['session_id'], 'sent_at': event['sent_at']},
+                         cls=DjangoJSONEncoder)
+    return f"id: {event['id']}\nevent: {event['type']}\ndata: {payload}\n\n"
+
+
+def serialize_set(workout_set):
+    """Event payload for one saved set"""
+    return {
+        'set_id': workout_set.id,
+        'client_id': workout_set.client_id or None,
+        'exercise_id': workout_set.exercise_id,
+        'set_number': workout_set.set_number,
+        'weight': float(workout_set.weight),
+        'reps': workout_set.reps,
+        'volume': float(workout_set.volume),
+    }
+
+
+def serialize_completion(session):
+    """Event payload for a completed session"""
+    return {
+        'completed_at': session.completed_at,
+        'total_volume': float(session.total_volume),
+    }
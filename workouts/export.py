@@ -0,0 +1,126 @@
+"""
+Streaming export of training logs as NDJSON or CSV.
+
+Sessions are read with a chunked iterator (a server-side cursor where the
+database supports one) and each chunk's sets are fetched in one query joined
+with their exercise names, plus one for its archived sets (see
+workouts.archive). Memory stays bounded by the chunk size, not the length of
+the history, and a response starts streaming straight away.
+
+NDJSON holds one session per line:
+    {"session_id": 12, "username": "...", "routine": "...", "status": "completed",
+     "started_at": "...", "completed_at": "...", "total_volume": "1250.00", "notes": "",
+     "sets": [{"exercise_slug": "squat", "exercise": "Squat", "set_number": 1,
+               "weight": "100.00", "reps": 5, "volume": "500.00", "completed_at": "..."}]}
+
+CSV holds one set per row, with the session columns repeated; rows for the
+same session are consecutive. A session without sets is written as a single
+row with empty set columns.
+"""
+import csv
+import json
+from itertools import islice
+
+from exercises.models import Exercise
+from .archive import load_archived_sets
+from .models import WorkoutSession, WorkoutSet
+
+FORMATS = ('ndjson', 'csv')
+DEFAULT_CHUNK_SIZE = 500
+
+SESSION_FIELDS = [
+    'session_id', 'username', 'routine', 'status', 'started_at', 'completed_at', 'total_volume', 'notes',
+]
+SET_FIELDS = ['exercise_slug', 'exercise', 'set_number', 'weight', 'reps', 'volume', 'completed_at']
+CSV_FIELDS = SESSION_FIELDS + [f'set_{field}' if field == 'completed_at' else field for field in SET_FIELDS]
+
+
+class _Echo:
+    """File-like object whose write() returns the value, so csv.writer can feed a generator"""
+
+    def write(self, value):
+        return value
+
+
+def _chunked(iterable, size):
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+def _isoformat(moment):
+    return moment.isoformat() if moment else None
+
+
+def iter_session_records(sessions, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Yield export records (dicts) for a session queryset, one chunk of sessions at a time"""
+    sessions = sessions.select_related('user', 'routine').order_by('user_id', 'started_at', 'id')
+    for chunk in _chunked(sessions.iterator(chunk_size=chunk_size), chunk_size):
+        sets_by_session = {}
+        session_ids = [session.id for session in chunk]
+        set_rows = list(
+            WorkoutSet.objects.filter(session_id__in=session_ids)
+            .values_list('session_id', 'exercise__slug', 'exercise__title', 'set_number',
+                         'weight', 'reps', 'volume', 'completed_at')
+        )
+        archived = load_archived_sets(WorkoutSession.objects.filter(id__in=session_ids))
+        if archived:
+            exercises = {
+                exercise_id: (slug, title) for exercise_id, slug, title in Exercise.objects.filter(
+                    id__in={workout_set.exercise_id for workout_set in archived}
+                ).values_list('id', 'slug', 'title')
+            }
+            set_rows.extend(
+                (workout_set.session_id, *exercises.get(workout_set.exercise_id, ('', '')), workout_set.set_number,
+                 workout_set.weight, workout_set.reps, workout_set.volume, workout_set.completed_at)
+                for workout_set in archived
+            )
+        set_rows.sort(key=lambda row: (row[0], row[7]))
+        for session_id, slug, title, set_number, weight, reps, volume, completed_at in set_rows:
+            sets_by_session.setdefault(session_id, []).append({
+                'exercise_slug': slug or '',
+                'exercise': title,
+                'set_number': set_number,
+                'weight': str(weight),
+                'reps': reps,
+                'volume': str(volume),
+                'completed_at': _isoformat(completed_at),
+            })
+
+        for session in chunk:
+            yield {
+                'session_id': session.id,
+                'username': session.user.username,
+                'routine': session.routine.name,
+                'status': session.status,
+                'started_at': _isoformat(session.started_at),
+                'completed_at': _isoformat(session.completed_at),
+                'total_volume': str(session.total_volume),
+                'notes': session.notes,
+                'sets': sets_by_session.get(session.id, []),
+            }
+
+
+def export_ndjson(sessions, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Yield NDJSON lines for a session queryset"""
+    for record in iter_session_records(sessions, chunk_size):
+        yield json.dumps(record) + '\n'
+
+
+def export_csv(sessions, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Yield CSV lines (header first) for a session queryset"""
+    writer = csv.writer(_Echo())
+    yield writer.writerow(CSV_FIELDS)
+    for record in iter_session_records(sessions, chunk_size):
+        session_columns = [record[field] or '' for field in SESSION_FIELDS]
+        if not record['sets']:
+            yield writer.writerow(session_columns + [''] * len(SET_FIELDS))
+        for workout_set in record['sets']:
+            yield writer.writerow(session_columns + [workout_set[field] for field in SET_FIELDS])
+
+
+def export_training_log(sessions, fmt, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Yield the export of a session queryset in the given format"""
+    if fmt not in FORMATS:
+        raise ValueError(f'Unknown format: {fmt}')
+    return export_csv(sessions, chunk_size) if fmt == 'csv' else export_ndjson(sessions, chunk_size)
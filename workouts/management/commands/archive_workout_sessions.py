@@ -0,0 +1,39 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from workouts.archive import archive_cutoff, archive_sessions, DEFAULT_CHUNK_SIZE
+
+
+class Command(BaseCommand):
+    help = 'Pack the sets of old completed sessions into compact archive rows'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--older-than-days',
+            type=int,
+            default=None,
+            help='Archive sessions completed more than N days ago (default: WORKOUT_ARCHIVE_AFTER_DAYS)'
+        )
+        parser.add_argument('--user', help='Only archive this username (default: every user)')
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=DEFAULT_CHUNK_SIZE,
+            help=f'Sessions archived per transaction (default: {DEFAULT_CHUNK_SIZE})'
+        )
+
+    def handle(self, *args, **options):
+        if options['chunk_size'] < 1:
+            raise CommandError('--chunk-size must be positive')
+        if options['older_than_days'] is not None and options['older_than_days'] < 0:
+            raise CommandError('--older-than-days must not be negative')
+
+        user_ids = None
+        if options['user']:
+            user_ids = list(User.objects.filter(username=options['user']).values_list('id', flat=True))
+            if not user_ids:
+                raise CommandError(f"Unknown user: {options['user']}")
+
+        sessions, sets = archive_sessions(
+            archive_cutoff(options['older_than_days']), user_ids=user_ids, chunk_size=options['chunk_size']
+        )
+        self.stdout.write(self.style.SUCCESS(f'Archived {sets} sets from {sessions} sessions'))
@@ -0,0 +1,48 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+from workouts.export import export_training_log, FORMATS, DEFAULT_CHUNK_SIZE
+from workouts.models import WorkoutSession
+
+
+class Command(BaseCommand):
+    help = 'Stream workout sessions and their sets to NDJSON or CSV'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', '-o', type=str, default='-', help='Output file (default: stdout)')
+        parser.add_argument('--format', choices=FORMATS, default=None,
+                            help='Output format (default: from the file extension, else ndjson)')
+        parser.add_argument('--user', nargs='+', default=None, help='Only export sessions of these usernames')
+        parser.add_argument('--status', choices=[choice for choice, _ in WorkoutSession.STATUS_CHOICES],
+                            default=None, help='Only export sessions with this status')
+        parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE,
+                            help=f'Sessions fetched per database round trip (default: {DEFAULT_CHUNK_SIZE})')
+
+    def handle(self, *args, **options):
+        if options['chunk_size'] < 1:
+            raise CommandError('--chunk-size must be positive')
+        output = options['output']
+        fmt = options['format'] or ('csv' if output.endswith('.csv') else 'ndjson')
+
+        sessions = WorkoutSession.objects.all()
+        if options['user']:
+            sessions = sessions.filter(user__username__in=options['user'])
+        if options['status']:
+            sessions = sessions.filter(status=options['status'])
+
+        try:
+            stream = open(output, 'w', newline='', encoding='utf-8') if output != '-' else sys.stdout
+        except OSError as e:
+            raise CommandError(f'Cannot open {output}: {e}')
+
+        lines = 0
+        try:
+            for line in export_training_log(sessions, fmt, options['chunk_size']):
+                stream.write(line)
+                lines += 1
+        finally:
+            if stream is not sys.stdout:
+                stream.close()
+
+        if output != '-':
+            self.stdout.write(self.style.SUCCESS(f'Wrote {lines} {fmt} lines to {output}'))
@@ -0,0 +1,38 @@
+from itertools import islice
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from workouts.models import WorkoutSession
+from workouts.performance import rebuild_last_performance
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the "last time" snapshots from completed sessions, a chunk of users at a time'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', help='Only rebuild this username (default: every user with workouts)')
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=200,
+            help='Users rebuilt per transaction (default: 200)'
+        )
+
+    def handle(self, *args, **options):
+        if options['chunk_size'] < 1:
+            raise CommandError('--chunk-size must be positive')
+
+        if options['user']:
+            user_ids = list(User.objects.filter(username=options['user']).values_list('id', flat=True))
+            if not user_ids:
+                raise CommandError(f"Unknown user: {options['user']}")
+        else:
+            user_ids = WorkoutSession.objects.order_by('user_id').values_list('user_id', flat=True).distinct()
+
+        users = snapshots = 0
+        user_ids = iter(user_ids)
+        while chunk := list(islice(user_ids, options['chunk_size'])):
+            snapshots += rebuild_last_performance(chunk)
+            users += len(chunk)
+
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {snapshots} last-performance snapshots for {users} users'))
@@ -0,0 +1,46 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db.models import F, OuterRef, Subquery, Sum, DecimalField, Q
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from workouts.models import WorkoutSession, WorkoutSet
+
+
+class Command(BaseCommand):
+    help = 'Fix session total volumes that drifted from the sum of their sets (e.g. after bulk set deletes)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days',
+            type=int,
+            default=None,
+            help='Only check sessions started in the last N days (default: all sessions)'
+        )
+        parser.add_argument('--dry-run', action='store_true', help='Report drift without fixing it')
+
+    def handle(self, *args, **options):
+        set_totals = (
+            WorkoutSet.objects.filter(session=OuterRef('pk')).order_by().values('session')
+            .annotate(total=Sum('volume')).values('total')
+        )
+        # Archived sets count through their archive's stored volume
+        sessions = WorkoutSession.objects.annotate(
+            actual_volume=Coalesce(
+                Subquery(set_totals, output_field=DecimalField(max_digits=10, decimal_places=2)), 0,
+                output_field=DecimalField(max_digits=10, decimal_places=2)
+            ) + Coalesce('archive__volume', 0, output_field=DecimalField(max_digits=10, decimal_places=2))
+        )
+        if options['days'] is not None:
+            sessions = sessions.filter(started_at__gte=timezone.now() - timedelta(days=options['days']))
+
+        drifted = []
+        for session in sessions.filter(~Q(total_volume=F('actual_volume'))).only('id', 'total_volume').iterator(chunk_size=2000):
+            session.total_volume = session.actual_volume
+            drifted.append(session)
+
+        if drifted and not options['dry_run']:
+            WorkoutSession.objects.bulk_update(drifted, ['total_volume'], batch_size=500)
+
+        verb = 'Found' if options['dry_run'] else 'Fixed'
+        self.stdout.write(self.style.SUCCESS(f'{verb} {len(drifted)} sessions with drifted total volume'))
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 21:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('exercises', '0002_alter_exercise_options_exercise_equipment_and_more'),
+        ('workouts', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='workoutset',
+            name='client_id',
+            field=models.CharField(blank=True, max_length=64),
+        ),
+        migrations.AddConstraint(
+            model_name='workoutset',
+            constraint=models.UniqueConstraint(condition=models.Q(('client_id', ''), _negated=True), fields=('session', 'client_id'), name='workoutset_unique_client_id'),
+        ),
+    ]
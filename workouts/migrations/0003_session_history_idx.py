@@ -0,0 +1,20 @@
+# Generated by Django 5.2.18 on 2026-10-18 21:53
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('routines', '0008_routine_vector'),
+        ('workouts', '0002_workoutset_client_id'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='workoutsession',
+            index=models.Index(fields=['user', '-started_at', '-id'], name='session_history_idx'),
+        ),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 5.2.18 on 2026-10-18 22:00
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('workouts', '0003_session_history_idx'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyTrainingRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('sessions', models.PositiveIntegerField(default=0)),
+                ('sets', models.PositiveIntegerField(default=0)),
+                ('reps', models.PositiveIntegerField(default=0)),
+                ('volume', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('top_weight', models.DecimalField(decimal_places=2, default=0, max_digits=6)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_training_rollups', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['day'],
+                'constraints': [models.UniqueConstraint(fields=('user', 'day'), name='daily_rollup_unique_user_day')],
+            },
+        ),
+        migrations.CreateModel(
+            name='WeeklyMuscleRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('week_start', models.DateField()),
+                ('muscle', models.CharField(max_length=100)),
+                ('sets', models.PositiveIntegerField(default=0)),
+                ('reps', models.PositiveIntegerField(default=0)),
+                ('volume', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('top_weight', models.DecimalField(decimal_places=2, default=0, max_digits=6)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='weekly_muscle_rollups', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['week_start', 'muscle'],
+                'constraints': [models.UniqueConstraint(fields=('user', 'week_start', 'muscle'), name='weekly_rollup_unique_user_week_muscle')],
+            },
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-18 22:36
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('workouts', '0006_last_performance'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedSession',
+            fields=[
+                ('session', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='archive', serialize=False, to='workouts.workoutsession')),
+                ('set_count', models.PositiveIntegerField(default=0)),
+                ('exercise_count', models.PositiveIntegerField(default=0)),
+                ('volume', models.DecimalField(decimal_places=2, default=0, max_digits=10)),
+                ('first_set_at', models.DateTimeField(blank=True, null=True)),
+                ('last_set_at', models.DateTimeField(blank=True, null=True)),
+                ('data', models.BinaryField()),
+                ('notes', models.JSONField(blank=True, default=dict)),
+                ('archived_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-18 23:39
+
+from django.db import migrations, models
+
+
+def fill_exercise_ids(apps, schema_editor):
+    """List the exercises of archives written before the field existed"""
+    from workouts.archive import unpack_columns
+
+    ArchivedSession = apps.get_model('workouts', 'ArchivedSession')
+    archives = []
+    for archive in ArchivedSession.objects.only('session_id', 'data').iterator(chunk_size=500):
+        archive.exercise_ids = sorted(set(unpack_columns(archive.data)['exercise_id'].tolist()))
+        archives.append(archive)
+    ArchivedSession.objects.bulk_update(archives, ['exercise_ids'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('workouts', '0007_archived_session'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='archivedsession',
+            name='exercise_ids',
+            field=models.JSONField(blank=True, default=list),
+        ),
+        migrations.RunPython(fill_exercise_ids, migrations.RunPython.noop),
+    ]
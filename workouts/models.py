@@ -1,4 +1,7 @@
-from django.db import models
+from decimal import Decimal
+
+from django.db import models, transaction
+from django.db.models import F, Sum
 from django.contrib.auth.models import User
 from django.utils import timezone
 from routines.models import Routine
@@ -30,16 +33,29 @@ class WorkoutSession(models.Model):
         return timezone.now() - self.started_at
     
     def calculate_total_volume(self):
-        total = sum([ws.volume for ws in self.workout_sets.all()])
+        """Recompute total volume from every set, archived ones included; only needed to reconcile drift"""
+        total = self.workout_sets.aggregate(total=Sum('volume'))['total'] or Decimal('0')
+        total += ArchivedSession.objects.filter(session=self).values_list('volume', flat=True).first() or 0
+        WorkoutSession.objects.filter(pk=self.pk).update(total_volume=total)
         self.total_volume = total
-        self.save()
         return total
+
+    @staticmethod
+    def adjust_total_volume(session_id, delta):
+        """Atomically add delta to a session's total volume without reading its sets"""
+        if delta:
+            WorkoutSession.objects.filter(pk=session_id).update(total_volume=F('total_volume') + delta)
     
     def get_exercises_completed(self):
-        return self.workout_sets.values('exercise').distinct().count()
+        from .archive import session_sets
+        return len({workout_set.exercise_id for workout_set in session_sets(self)})
     
     class Meta:
         ordering = ['-started_at']
+        indexes = [
+            # Keyset pagination of a user's workout history
+            models.Index(fields=['user', '-started_at', '-id'], name='session_history_idx'),
+        ]
 
 
 class WorkoutSet(models.Model):
@@ -52,13 +68,70 @@ class WorkoutSet(models.Model):
     rest_time_actual = models.PositiveIntegerField(null=True, blank=True)  # Actual rest time taken
     completed_at = models.DateTimeField(default=timezone.now)
     notes = models.TextField(blank=True)
+    client_id = models.CharField(max_length=64, blank=True)  # Idempotency key from offline clients
+
+    @staticmethod
+    def compute_volume(weight, reps):
+        """weight × reps, rounded as the volume column stores it"""
+        return (Decimal(str(weight)) * reps).quantize(Decimal('0.01'))
     
     def save(self, *args, **kwargs):
         # Automatically calculate volume when saving
-        self.volume = self.weight * self.reps
-        super().save(*args, **kwargs)
-        # Update session total volume
-        self.session.calculate_total_volume()
+        self.volume = self.compute_volume(self.weight, self.reps)
+        from .records import holds_record, update_personal_records
+        from .rollups import apply_set_changes, set_contribution
+        from .tasks import rebuild_user_records
+
+        with transaction.atomic():
+            previous = None
+            if not self._state.adding:
+                previous = WorkoutSet.objects.select_for_update().filter(pk=self.pk).values_list(
+                    'session_id', 'volume', 'session__user_id', 'completed_at', 'exercise__muscle', 'weight', 'reps',
+                    'exercise_id',
+                ).first()
+            super().save(*args, **kwargs)
+
+            # Keep the training rollups in step with this set's change
+            removed = [set_contribution(*previous[2:7], previous[1])] if previous else []
+            added = [set_contribution(self.session.user_id, self.completed_at, self.exercise.muscle,
+                                      self.weight, self.reps, self.volume)]
+            if removed != added:
+                apply_set_changes(removed, added)
+
+            # Check the set against the user's personal records; the kinds beaten are kept for the caller
+            self.personal_records = []
+            if previous is None or (previous[0], previous[5], previous[6], previous[7]) != (
+                self.session_id, Decimal(str(self.weight)), self.reps, self.exercise_id
+            ):
+                held = previous is not None and holds_record(
+                    previous[2], previous[7], previous[5], previous[6], previous[0]
+                )
+                self.personal_records = update_personal_records(self.session.user_id, [self])[0]
+                if held:
+                    # The old values stood as a record that may no longer be earned
+                    rebuild_user_records.enqueue(unique=True, user_id=previous[2], exercise_ids=[previous[7]])
+
+            # Update session total volume by this set's change only, O(1) per set
+            if previous and previous[0] == self.session_id:
+                WorkoutSession.adjust_total_volume(self.session_id, self.volume - previous[1])
+            else:
+                if previous:
+                    WorkoutSession.adjust_total_volume(previous[0], -previous[1])
+                WorkoutSession.adjust_total_volume(self.session_id, self.volume)
+
+    def delete(self, *args, **kwargs):
+        from .records import holds_record
+        from .rollups import apply_set_changes, set_contribution
+        from .tasks import rebuild_user_records
+
+        with transaction.atomic():
+            result = super().delete(*args, **kwargs)
+            WorkoutSession.adjust_total_volume(self.session_id, -self.volume)
+            apply_set_changes([set_contribution(self.session.user_id, self.completed_at, self.exercise.muscle,
+                                                self.weight, self.reps, self.volume)], [])
+            if holds_record(self.session.user_id, self.exercise_id, self.weight, self.reps, self.session_id):
+                rebuild_user_records.enqueue(unique=True, user_id=self.session.user_id, exercise_ids=[self.exercise_id])
+        return result
     
     def __str__(self):
         return f"{self.exercise.name} - Set {self.set_number}: {self.weight}kg × {self.reps} reps"
@@ -66,3 +139,124 @@ class WorkoutSet(models.Model):
     class Meta:
         ordering = ['completed_at']
         unique_together = ['session', 'exercise', 'set_number']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['session', 'client_id'],
+                condition=~models.Q(client_id=''),
+                name='workoutset_unique_client_id',
+            ),
+        ]
+
+
+class ArchivedSession(models.Model):
+    """The sets of an old completed session, packed into one compressed row (see workouts.archive)"""
+    session = models.OneToOneField(WorkoutSession, on_delete=models.CASCADE, primary_key=True, related_name='archive')
+    set_count = models.PositiveIntegerField(default=0)
+    exercise_count = models.PositiveIntegerField(default=0)
+    exercise_ids = models.JSONField(default=list, blank=True)  # Sorted ids in data, to find archives without unpacking
+    volume = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    first_set_at = models.DateTimeField(null=True, blank=True)
+    last_set_at = models.DateTimeField(null=True, blank=True)
+    data = models.BinaryField()  # zlib-compressed columns: exercise, set number, weight, reps, rest, time
+    notes = models.JSONField(default=dict, blank=True)  # Set index (as a string) -> note, for sets that had one
+    archived_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.session} - {self.set_count} archived sets"
+
+
+class DailyTrainingRollup(models.Model):
+    """Per user and day totals, maintained as sets are logged (see workouts.rollups)"""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='daily_training_rollups')
+    day = models.DateField()
+    sessions = models.PositiveIntegerField(default=0)  # Sessions completed that day
+    sets = models.PositiveIntegerField(default=0)
+    reps = models.PositiveIntegerField(default=0)
+    volume = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    top_weight = models.DecimalField(max_digits=6, decimal_places=2, default=0)
+
+    def __str__(self):
+        return f"{self.user} - {self.day}: {self.sets} sets, {self.volume}kg"
+
+    class Meta:
+        ordering = ['day']
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'day'], name='daily_rollup_unique_user_day'),
+        ]
+
+
+class WeeklyMuscleRollup(models.Model):
+    """Per user, ISO week and muscle totals, maintained as sets are logged (see workouts.rollups)"""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='weekly_muscle_rollups')
+    week_start = models.DateField()  # Monday of the ISO week
+    muscle = models.CharField(max_length=100)
+    sets = models.PositiveIntegerField(default=0)
+    reps = models.PositiveIntegerField(default=0)
+    volume = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    top_weight = models.DecimalField(max_digits=6, decimal_places=2, default=0)
+
+    def __str__(self):
+        return f"{self.user} - {self.week_start} {self.muscle}: {self.sets} sets, {self.volume}kg"
+
+    class Meta:
+        ordering = ['week_start', 'muscle']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'week_start', 'muscle'], name='weekly_rollup_unique_user_week_muscle'
+            ),
+        ]
+
+
+class PersonalRecord(models.Model):
+    """A user's best results on one exercise, maintained as sets are saved (see workouts.records)"""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='personal_records')
+    exercise = models.ForeignKey(Exercise, on_delete=models.CASCADE, related_name='+')
+    best_weights = models.JSONField(default=dict)  # Rep count (as a string) -> heaviest weight, e.g. {"5": "100.00"}
+    best_one_rep_max = models.DecimalField(max_digits=7, decimal_places=2, default=0)  # Epley estimate
+    best_session_volume = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    best_session = models.ForeignKey(WorkoutSession, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.user} - {self.exercise}: e1RM {self.best_one_rep_max}kg"
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'exercise'], name='personal_record_unique_user_exercise'),
+        ]
+
+
+class LastPerformance(models.Model):
+    """A user's sets of one exercise in their latest completed session (see workouts.performance)"""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='last_performances')
+    exercise = models.ForeignKey(Exercise, on_delete=models.CASCADE, related_name='+')
+    session = models.ForeignKey(WorkoutSession, on_delete=models.CASCADE, related_name='+')
+    performed_at = models.DateTimeField()  # When the session was completed
+    sets = models.JSONField(default=list)  # [{"set_number": 1, "weight": "80.00", "reps": 8}, ...]
+
+    def __str__(self):
+        return f"{self.user} - {self.exercise}: {self.summary()}"
+
+    def summary(self):
+        """Compact description, e.g. "80 kg × 8, 8, 7" (or "80 kg × 8, 85 kg × 6" when weights vary)"""
+        if not self.sets:
+            return ''
+        weights = [f"{Decimal(workout_set['weight']).normalize():f}" for workout_set in self.sets]
+        if len(set(weights)) == 1:
+            return f"{weights[0]} kg × {', '.join(str(workout_set['reps']) for workout_set in self.sets)}"
+        return ', '.join(f"{weight} kg × {workout_set['reps']}" for weight, workout_set in zip(weights, self.sets))
+
+    def as_dict(self):
+        return {
+            'session_id': self.session_id,
+            'performed_at': self.performed_at.isoformat(),
+            'sets': [
+                {**workout_set, 'weight': float(workout_set['weight'])} for workout_set in self.sets
+            ],
+            'summary': self.summary(),
+        }
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'exercise'], name='last_performance_unique_user_exercise'),
+        ]
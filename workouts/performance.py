@@ -0,0 +1,102 @@
+"""
+"Last time" lookups for the workout pages.
+
+LastPerformance keeps, per user and exercise, a snapshot of the sets done in
+the latest completed session. Completing a session rewrites the snapshots for
+its exercises with one read of its sets and one upsert, so showing "last
+time: 80 kg × 8, 8, 7" is a single indexed lookup rather than a search back
+through past sessions.
+"""
+from decimal import Decimal
+
+from django.db import transaction
+
+from .archive import load_archived_sets
+from .models import LastPerformance, WorkoutSession, WorkoutSet
+
+
+def _snapshot_sets(rows):
+    return [
+        {'set_number': set_number, 'weight': str(Decimal(str(weight)).quantize(Decimal('0.01'))), 'reps': reps}
+        for set_number, weight, reps in rows
+    ]
+
+
+def record_last_performance(session):
+    """Make a newly completed session the last performance of every exercise it contains"""
+    rows = {}
+    for exercise_id, set_number, weight, reps in session.workout_sets.order_by('exercise_id', 'set_number').values_list(
+        'exercise_id', 'set_number', 'weight', 'reps'
+    ):
+        rows.setdefault(exercise_id, []).append((set_number, weight, reps))
+    # Recorded from a background task, so a later session may have got there first
+    for exercise_id in LastPerformance.objects.filter(
+        user_id=session.user_id, exercise_id__in=rows, performed_at__gt=session.completed_at,
+    ).values_list('exercise_id', flat=True):
+        del rows[exercise_id]
+    if not rows:
+        return 0
+
+    LastPerformance.objects.bulk_create(
+        [
+            LastPerformance(user_id=session.user_id, exercise_id=exercise_id, session_id=session.id,
+                            performed_at=session.completed_at, sets=_snapshot_sets(exercise_rows))
+            for exercise_id, exercise_rows in rows.items()
+        ],
+        update_conflicts=True,
+        unique_fields=['user', 'exercise'],
+        update_fields=['session', 'performed_at', 'sets'],
+    )
+    return len(rows)
+
+
+def get_last_performances(user_id, exercise_ids, exclude_session=None):
+    """Return {exercise id: LastPerformance} for the given exercises, in one query"""
+    performances = LastPerformance.objects.filter(user_id=user_id, exercise_id__in=exercise_ids)
+    if exclude_session is not None:
+        # The current session is not "last time", even once it is completed
+        performances = performances.exclude(session_id=exclude_session.id)
+    return {performance.exercise_id: performance for performance in performances}
+
+
+def rebuild_last_performance(user_ids):
+    """
+    Recompute every snapshot of the given users from their completed sessions.
+
+    Reads sets newest session first, so only the first session seen per
+    exercise is kept; archived sessions are then compared against it.
+    Returns the number of snapshots written.
+    """
+    user_ids = list(user_ids)
+    latest = {}
+    for user_id, exercise_id, session_id, completed_at, set_number, weight, reps in WorkoutSet.objects.filter(
+        session__user_id__in=user_ids, session__status='completed', session__completed_at__isnull=False,
+    ).order_by('-session__completed_at', '-session_id', 'exercise_id', 'set_number').values_list(
+        'session__user_id', 'exercise_id', 'session_id', 'session__completed_at', 'set_number', 'weight', 'reps'
+    ).iterator(chunk_size=2000):
+        snapshot = latest.setdefault((user_id, exercise_id), (session_id, completed_at, []))
+        if snapshot[0] == session_id:
+            snapshot[2].append((set_number, weight, reps))
+
+    for workout_set in load_archived_sets(WorkoutSession.objects.filter(
+        user_id__in=user_ids, status='completed', completed_at__isnull=False,
+    )):
+        session = workout_set.session
+        key = (session.user_id, workout_set.exercise_id)
+        snapshot = latest.get(key)
+        if snapshot is None or (session.completed_at, session.id) > (snapshot[1], snapshot[0]):
+            snapshot = latest[key] = (session.id, session.completed_at, [])
+        if snapshot[0] == session.id:
+            snapshot[2].append((workout_set.set_number, workout_set.weight, workout_set.reps))
+
+    with transaction.atomic():
+        LastPerformance.objects.filter(user_id__in=user_ids).delete()
+        written = LastPerformance.objects.bulk_create(
+            [
+                LastPerformance(user_id=user_id, exercise_id=exercise_id, session_id=session_id,
+                                performed_at=completed_at, sets=_snapshot_sets(sorted(rows)))
+                for (user_id, exercise_id), (session_id, completed_at, rows) in latest.items()
+            ],
+            batch_size=1000,
+        )
+    return len(written)
@@ -0,0 +1,206 @@
+"""
+Personal records, detected as sets are saved.
+
+PersonalRecord keeps one row per user and exercise: the heaviest weight at
+each rep count, the best Epley estimated 1RM, and the best single-session
+volume. Saving a set locks that row, compares the set against it and writes
+any improvement in the same transaction. Detecting a PR therefore never scans
+past sets.
+
+Records only move up as sets are added. When a set that holds a record is
+deleted or edited down, that exercise's record is rebuilt from history by
+rebuild_personal_records, which the rebuild_personal_records command also
+runs for existing data. Rebuilds count archived sets (see workouts.archive).
+"""
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Max, Sum
+from django.utils import timezone
+
+from .archive import load_archived_columns
+from .models import PersonalRecord, WorkoutSession, WorkoutSet
+
+RECORD_KINDS = ('weight', 'one_rep_max', 'session_volume')
+
+TWO_PLACES = Decimal('0.01')
+
+
+def estimate_one_rep_max(weight, reps):
+    """Epley estimated 1RM (a single rep is the weight itself)"""
+    weight = Decimal(str(weight))
+    if reps == 1:
+        return weight.quantize(TWO_PLACES)
+    return (weight * (1 + Decimal(reps) / 30)).quantize(TWO_PLACES)
+
+
+def _apply(record, weight, reps, session_id, session_volume, established):
+    """
+    Fold one set into a record in place.
+
+    Returns (record kinds beaten, whether the record changed). Nothing counts
+    as beaten while the record is being established by its first set, nor at
+    a rep count never done before.
+    """
+    beaten = []
+    changed = False
+
+    key = str(reps)
+    best_weight = record.best_weights.get(key)
+    if best_weight is None or weight > Decimal(best_weight):
+        record.best_weights[key] = str(weight)
+        changed = True
+        if best_weight is not None:
+            beaten.append('weight')
+
+    one_rep_max = estimate_one_rep_max(weight, reps)
+    if one_rep_max > record.best_one_rep_max:
+        record.best_one_rep_max = one_rep_max
+        changed = True
+        beaten.append('one_rep_max')
+
+    if session_volume > record.best_session_volume:
+        # Report a session only when it first overtakes the previous best, not on every set after
+        if record.best_session_id != session_id:
+            beaten.append('session_volume')
+        record.best_session_volume = session_volume
+        record.best_session_id = session_id
+        changed = True
+
+    return (beaten if established else []), changed
+
+
+def update_personal_records(user_id, workout_sets):
+    """
+    Compare saved sets against the user's records, updating any that were beaten.
+
+    Returns, for each set in order, the list of RECORD_KINDS it beat. Costs one
+    locked read of the affected records, one grouped read of the sets'
+    session volumes and one write, however many sets are passed (plus an
+    insert and a second locked read when an exercise has no record yet). Must
+    run in the transaction that saved the sets.
+    """
+    results = [[] for _ in workout_sets]
+    candidates = [
+        (i, workout_set, Decimal(str(workout_set.weight)).quantize(TWO_PLACES))
+        for i, workout_set in enumerate(workout_sets) if workout_set.reps > 0
+    ]
+    candidates = [candidate for candidate in candidates if candidate[2] > 0]
+    if not candidates:
+        return results
+
+    exercise_ids = {workout_set.exercise_id for _, workout_set, _ in candidates}
+    locked = PersonalRecord.objects.select_for_update()
+    records = {
+        record.exercise_id: record for record in locked.filter(user_id=user_id, exercise_id__in=exercise_ids)
+    }
+    missing = exercise_ids - records.keys()
+    if missing:
+        # Insert empty rows, leaving any a concurrent save created first, then lock whichever row won
+        PersonalRecord.objects.bulk_create(
+            [PersonalRecord(user_id=user_id, exercise_id=exercise_id, best_weights={}) for exercise_id in missing],
+            ignore_conflicts=True,
+        )
+        records.update(
+            (record.exercise_id, record) for record in locked.filter(user_id=user_id, exercise_id__in=missing)
+        )
+    session_volumes = {
+        (session_id, exercise_id): total
+        for session_id, exercise_id, total in WorkoutSet.objects.filter(
+            session_id__in={workout_set.session_id for _, workout_set, _ in candidates},
+            exercise_id__in=exercise_ids,
+        ).values_list('session_id', 'exercise_id').annotate(total=Sum('volume')).order_by()
+    }
+
+    changed = set()
+    for i, workout_set, weight in sorted(candidates, key=lambda candidate: candidate[1].completed_at):
+        record = records[workout_set.exercise_id]
+        established = bool(record.best_weights)  # Still empty until its first set is folded in
+        session_volume = session_volumes.get((workout_set.session_id, workout_set.exercise_id), Decimal('0'))
+        results[i], record_changed = _apply(
+            record, weight, workout_set.reps, workout_set.session_id, session_volume, established
+        )
+        if record_changed:
+            changed.add(record)
+
+    if changed:
+        now = timezone.now()  # bulk_update skips auto_now
+        for record in changed:
+            record.updated_at = now
+        PersonalRecord.objects.bulk_update(
+            changed, ['best_weights', 'best_one_rep_max', 'best_session_volume', 'best_session', 'updated_at']
+        )
+    return results
+
+
+def holds_record(user_id, exercise_id, weight, reps, session_id):
+    """Whether a set's values currently stand as one of its exercise's records"""
+    record = PersonalRecord.objects.filter(user_id=user_id, exercise_id=exercise_id).first()
+    if record is None or not reps:
+        return False
+    weight = Decimal(str(weight))
+    best_weight = record.best_weights.get(str(reps))
+    return (
+        (best_weight is not None and weight >= Decimal(best_weight))
+        or estimate_one_rep_max(weight, reps) >= record.best_one_rep_max
+        or record.best_session_id == session_id
+    )
+
+
+def rebuild_personal_records(user_ids, exercise_ids=None):
+    """
+    Recompute records from set history with grouped aggregate queries.
+
+    Rebuilds every record of the given users, or only those for exercise_ids.
+    Returns the number of records written.
+    """
+    user_ids = list(user_ids)
+    sets = WorkoutSet.objects.filter(session__user_id__in=user_ids, reps__gt=0, weight__gt=0)
+    existing = PersonalRecord.objects.filter(user_id__in=user_ids)
+    if exercise_ids is not None:
+        sets = sets.filter(exercise_id__in=exercise_ids)
+        existing = existing.filter(exercise_id__in=exercise_ids)
+
+    records = defaultdict(lambda: {'best_weights': {}, 'best_one_rep_max': Decimal('0'),
+                                   'best_session_volume': Decimal('0'), 'best_session_id': None})
+    for user_id, exercise_id, reps, weight in sets.values_list(
+        'session__user_id', 'exercise_id', 'reps'
+    ).annotate(best=Max('weight')).order_by():
+        record = records[(user_id, exercise_id)]
+        weight = Decimal(str(weight)).quantize(TWO_PLACES)
+        record['best_weights'][str(reps)] = str(weight)
+        record['best_one_rep_max'] = max(record['best_one_rep_max'], estimate_one_rep_max(weight, reps))
+    session_volumes = defaultdict(Decimal)
+    for user_id, exercise_id, session_id, volume in sets.values_list(
+        'session__user_id', 'exercise_id', 'session_id'
+    ).annotate(total=Sum('volume')).order_by():
+        session_volumes[(user_id, exercise_id, session_id)] += volume
+
+    archived = load_archived_columns(WorkoutSession.objects.filter(user_id__in=user_ids), exercise_ids=exercise_ids)
+    done = (archived['reps'] > 0) & (archived['weight'] > 0)
+    for user_id, exercise_id, session_id, reps, hundredths in zip(*(
+        archived[name][done].tolist() for name in ('user_id', 'exercise_id', 'session_id', 'reps', 'weight')
+    )):
+        weight = Decimal(hundredths).scaleb(-2)  # Exact, two places like the weight column
+        record = records[(user_id, exercise_id)]
+        key = str(reps)
+        if key not in record['best_weights'] or weight > Decimal(record['best_weights'][key]):
+            record['best_weights'][key] = str(weight)
+        record['best_one_rep_max'] = max(record['best_one_rep_max'], estimate_one_rep_max(weight, reps))
+        session_volumes[(user_id, exercise_id, session_id)] += Decimal(hundredths * reps).scaleb(-2)
+
+    for (user_id, exercise_id, session_id), volume in sorted(session_volumes.items(), key=lambda item: item[0][2]):
+        record = records[(user_id, exercise_id)]
+        if volume > record['best_session_volume']:
+            record['best_session_volume'] = volume
+            record['best_session_id'] = session_id
+
+    with transaction.atomic():
+        existing.delete()
+        written = PersonalRecord.objects.bulk_create(
+            [PersonalRecord(user_id=user_id, exercise_id=exercise_id, **fields)
+             for (user_id, exercise_id), fields in records.items()],
+            batch_size=1000,
+        )
+    return len(written)
@@ -0,0 +1,289 @@
+"""
+Pre-aggregated training rollups.
+
+DailyTrainingRollup holds one row per user and day, and WeeklyMuscleRollup one
+row per user, ISO week and muscle. Calendar heatmaps and progress charts read
+these few hundred rows instead of scanning every WorkoutSet.
+
+Rows are maintained incrementally. Each set save or delete applies its change
+to the two buckets it falls in, using F() updates (see apply_set_changes).
+Completing a session bumps the day's session count. The only read of raw sets
+happens when the heaviest set of a bucket is removed, and then only that
+bucket's sets are read. Archived sets (see workouts.archive) count like live
+ones in rebuilds and top weight recomputes. Writes that bypass the model (queryset deletes, or an
+exercise's muscle being changed) are repaired by rebuild_rollups, or for
+everything by the backfill_training_rollups command.
+"""
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+from typing import NamedTuple
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, DateField, DecimalField, F, Max, Q, Sum, Value
+from django.db.models.functions import Coalesce, Greatest, NullIf, TruncDate, TruncWeek
+from django.utils import timezone
+
+from exercises.models import Exercise
+from .archive import load_archived_sets
+from .models import DailyTrainingRollup, WeeklyMuscleRollup, WorkoutSession, WorkoutSet
+
+OTHER_MUSCLE = 'other'  # Bucket for exercises without a primary muscle
+
+
+class SetContribution(NamedTuple):
+    """What one set adds to its rollup buckets"""
+    user_id: int
+    day: object
+    muscle: str
+    weight: Decimal
+    reps: int
+    volume: Decimal
+
+
+def set_contribution(user_id, completed_at, muscle, weight, reps, volume):
+    return SetContribution(
+        user_id, timezone.localdate(completed_at), muscle or OTHER_MUSCLE,
+        Decimal(str(weight)), reps, Decimal(str(volume)),
+    )
+
+
+def week_start(day):
+    """Monday of the ISO week containing day"""
+    return day - timedelta(days=day.weekday())
+
+
+def _day_range(day, days=1):
+    start = timezone.make_aware(datetime.combine(day, time.min))
+    return start, start + timedelta(days=days)
+
+
+def _bucket_totals(contributions):
+    """Sum contributions per daily and per weekly bucket: lookup -> [sets, reps, volume, top weight]"""
+    daily = defaultdict(lambda: [0, 0, Decimal('0'), Decimal('0')])
+    weekly = defaultdict(lambda: [0, 0, Decimal('0'), Decimal('0')])
+    for item in contributions:
+        for totals in (
+            daily[(item.user_id, item.day)],
+            weekly[(item.user_id, week_start(item.day), item.muscle)],
+        ):
+            totals[0] += 1
+            totals[1] += item.reps
+            totals[2] += item.volume
+            totals[3] = max(totals[3], item.weight)
+    return daily, weekly
+
+
+def _add(model, lookup, sets=0, reps=0, volume=Decimal('0'), top_weight=Decimal('0'), sessions=0):
+    """Add to a bucket with F() updates, creating the row the first time the bucket is hit"""
+    changes = {
+        'sets': F('sets') + sets,
+        'reps': F('reps') + reps,
+        'volume': F('volume') + volume,
+        'top_weight': Greatest(F('top_weight'), Value(top_weight, output_field=DecimalField())),
+    }
+    if sessions:
+        changes['sessions'] = F('sessions') + sessions
+    if model.objects.filter(**lookup).update(**changes):
+        return
+    try:
+        with transaction.atomic():
+            fields = {'sessions': sessions} if sessions else {}
+            model.objects.create(**lookup, sets=sets, reps=reps, volume=volume, top_weight=top_weight, **fields)
+    except IntegrityError:
+        # Created concurrently between our update and insert
+        model.objects.filter(**lookup).update(**changes)
+
+
+def _bucket_top_weight(model, lookup):
+    """The heaviest raw set, live or archived, in a bucket"""
+    if model is DailyTrainingRollup:
+        start, end = _day_range(lookup['day'])
+        muscle_filter = Q()
+    else:
+        start, end = _day_range(lookup['week_start'], days=7)
+        muscle = lookup['muscle']
+        muscle_filter = Q(exercise__muscle=muscle)
+        if muscle == OTHER_MUSCLE:
+            muscle_filter |= Q(exercise__muscle='')
+    top = WorkoutSet.objects.filter(
+        muscle_filter, session__user_id=lookup['user_id'], completed_at__gte=start, completed_at__lt=end
+    ).aggregate(top=Max('weight'))['top'] or Decimal('0')
+    archived = _archived_contributions([lookup['user_id']], start, end)
+    if model is WeeklyMuscleRollup:
+        archived = [item for item in archived if item.muscle == lookup['muscle']]
+    return max([top] + [item.weight for item in archived])
+
+
+def _remove(model, lookup, sets, reps, volume, top_weight):
+    """Subtract from a bucket, dropping emptied rows and recomputing the top weight if it was removed"""
+    model.objects.filter(**lookup).update(
+        sets=Greatest(F('sets') - sets, Value(0)),
+        reps=Greatest(F('reps') - reps, Value(0)),
+        volume=F('volume') - volume,
+    )
+    fields = ['id', 'sets', 'top_weight'] + (['sessions'] if model is DailyTrainingRollup else [])
+    row = model.objects.filter(**lookup).values(*fields).first()
+    if row is None:
+        return
+    if not row['sets']:
+        if row.get('sessions'):
+            # A day with a completed session but no sets left keeps its row
+            model.objects.filter(pk=row['id']).update(reps=0, volume=0, top_weight=0)
+        else:
+            model.objects.filter(pk=row['id']).delete()
+    elif top_weight >= row['top_weight']:
+        model.objects.filter(pk=row['id']).update(top_weight=_bucket_top_weight(model, lookup))
+
+
+def apply_set_changes(removed, added):
+    """
+    Apply set contributions (see set_contribution) leaving and entering the rollups.
+
+    An edited set is removed with its old values and added with its new ones.
+    Contributions are summed per bucket first, so a batch costs a few queries
+    per bucket touched rather than per set.
+    """
+    with transaction.atomic(savepoint=False):
+        for contributions, apply in ((removed, _remove), (added, _add)):
+            if not contributions:
+                continue
+            daily, weekly = _bucket_totals(contributions)
+            for (user_id, day), totals in daily.items():
+                apply(DailyTrainingRollup, {'user_id': user_id, 'day': day}, *totals)
+            for (user_id, week, muscle), totals in weekly.items():
+                apply(WeeklyMuscleRollup, {'user_id': user_id, 'week_start': week, 'muscle': muscle}, *totals)
+
+
+def record_session_completed(session):
+    """Count a newly completed session on the day it was completed"""
+    _add(DailyTrainingRollup, {'user_id': session.user_id, 'day': timezone.localdate(session.completed_at)},
+         sessions=1)
+
+
+def _archived_contributions(user_ids, start=None, end=None):
+    """Contributions of the users' archived sets completed in [start, end)"""
+    archived = load_archived_sets(WorkoutSession.objects.filter(user_id__in=user_ids), start, end)
+    if not archived:
+        return []
+    muscles = dict(
+        Exercise.objects.filter(id__in={workout_set.exercise_id for workout_set in archived}).values_list('id', 'muscle')
+    )
+    return [
+        set_contribution(workout_set.session.user_id, workout_set.completed_at, muscles.get(workout_set.exercise_id),
+                         workout_set.weight, workout_set.reps, workout_set.volume)
+        for workout_set in archived
+    ]
+
+
+def _merge_archived(rows, totals, make_row):
+    """Add archived bucket totals (see _bucket_totals) into unsaved rollup rows keyed like totals"""
+    for key, (sets, reps, volume, top_weight) in totals.items():
+        row = rows.get(key)
+        if row is None:
+            row = rows[key] = make_row(key)
+        row.sets += sets
+        row.reps += reps
+        row.volume = Decimal(str(row.volume)) + volume
+        row.top_weight = max(Decimal(str(row.top_weight)), top_weight)
+
+
+def _aggregate_daily(sets, sessions):
+    """Build unsaved daily rows from set and completed-session querysets"""
+    rows = {}
+    for row in sets.annotate(day=TruncDate('completed_at')).values('session__user_id', 'day').annotate(
+        set_count=Count('id'), rep_count=Sum('reps'), total_volume=Sum('volume'), top=Max('weight'),
+    ).order_by():
+        rows[(row['session__user_id'], row['day'])] = DailyTrainingRollup(
+            user_id=row['session__user_id'], day=row['day'], sets=row['set_count'],
+            reps=row['rep_count'] or 0, volume=row['total_volume'] or 0, top_weight=row['top'] or 0,
+        )
+    for row in sessions.annotate(day=TruncDate('completed_at')).values('user_id', 'day').annotate(
+        session_count=Count('id'),
+    ).order_by():
+        key = (row['user_id'], row['day'])
+        rows.setdefault(key, DailyTrainingRollup(user_id=row['user_id'], day=row['day']))
+        rows[key].sessions = row['session_count']
+    return rows
+
+
+def _aggregate_weekly(sets):
+    """Build unsaved weekly muscle rows from a set queryset"""
+    return {
+        (row['session__user_id'], row['week'], row['muscle_bucket']): WeeklyMuscleRollup(
+            user_id=row['session__user_id'], week_start=row['week'], muscle=row['muscle_bucket'],
+            sets=row['set_count'], reps=row['rep_count'] or 0, volume=row['total_volume'] or 0,
+            top_weight=row['top'] or 0,
+        )
+        for row in sets.annotate(
+            week=TruncWeek('completed_at', output_field=DateField()),
+            muscle_bucket=Coalesce(NullIf('exercise__muscle', Value('')), Value(OTHER_MUSCLE)),
+        ).values('session__user_id', 'week', 'muscle_bucket').annotate(
+            set_count=Count('id'), rep_count=Sum('reps'), total_volume=Sum('volume'), top=Max('weight'),
+        ).order_by()
+    }
+
+
+def rebuild_rollups(user_ids, days=None):
+    """
+    Recompute rollups from raw sets with grouped aggregate queries.
+
+    Rebuilds every row of the given users, or only the given days (and the
+    weeks containing them). Returns (daily rows, weekly rows) written.
+    """
+    user_ids = list(user_ids)
+    sets = WorkoutSet.objects.filter(session__user_id__in=user_ids)
+    sessions = WorkoutSession.objects.filter(user_id__in=user_ids, status='completed', completed_at__isnull=False)
+    daily = DailyTrainingRollup.objects.filter(user_id__in=user_ids)
+    weekly = WeeklyMuscleRollup.objects.filter(user_id__in=user_ids)
+
+    weekly_sets = sets
+    archived_start = archived_end = None
+    if days is not None:
+        days = set(days)
+        weeks = {week_start(day) for day in days}
+        day_ranges, week_ranges = Q(pk__in=[]), Q(pk__in=[])
+        for day in days:
+            start, end = _day_range(day)
+            day_ranges |= Q(completed_at__gte=start, completed_at__lt=end)
+        for week in weeks:
+            start, end = _day_range(week, days=7)
+            week_ranges |= Q(completed_at__gte=start, completed_at__lt=end)
+        sets, weekly_sets, sessions = sets.filter(day_ranges), sets.filter(week_ranges), sessions.filter(day_ranges)
+        daily, weekly = daily.filter(day__in=days), weekly.filter(week_start__in=weeks)
+        archived_start = _day_range(min(weeks))[0]
+        archived_end = _day_range(max(weeks), days=7)[1]
+
+    with transaction.atomic():
+        daily_rows = _aggregate_daily(sets, sessions)
+        weekly_rows = _aggregate_weekly(weekly_sets)
+        archived_daily, archived_weekly = _bucket_totals(
+            _archived_contributions(user_ids, archived_start, archived_end)
+        )
+        if days is not None:
+            archived_daily = {key: totals for key, totals in archived_daily.items() if key[1] in days}
+            archived_weekly = {key: totals for key, totals in archived_weekly.items() if key[1] in weeks}
+        _merge_archived(daily_rows, archived_daily,
+                        lambda key: DailyTrainingRollup(user_id=key[0], day=key[1]))
+        _merge_archived(weekly_rows, archived_weekly,
+                        lambda key: WeeklyMuscleRollup(user_id=key[0], week_start=key[1], muscle=key[2]))
+
+        daily.delete()
+        weekly.delete()
+        daily_rows = DailyTrainingRollup.objects.bulk_create(daily_rows.values(), batch_size=1000)
+        weekly_rows = WeeklyMuscleRollup.objects.bulk_create(weekly_rows.values(), batch_size=1000)
+    return len(daily_rows), len(weekly_rows)
+
+
+def session_rollup_days(session):
+    """Days whose rollups a session contributes to (its sets' days, archived too, and its completion day)"""
+    days = set(
+        session.workout_sets.annotate(day=TruncDate('completed_at')).values_list('day', flat=True).distinct()
+    )
+    days.update(
+        timezone.localdate(workout_set.completed_at)
+        for workout_set in load_archived_sets(WorkoutSession.objects.filter(pk=session.pk))
+    )
+    if session.status == 'completed' and session.completed_at:
+        days.add(timezone.localdate(session.completed_at))
+    return days
@@ -0,0 +1,124 @@
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import Q, QuerySet
+from django.db.models.signals import post_save, post_delete, pre_delete
+from django.dispatch import receiver
+from routines.models import Routine, RoutineExercise
+from routines.summaries import exercises_changed
+
+from .analytics import invalidate_user_analytics
+from .archive import is_moving_sets
+from .models import LastPerformance, WorkoutSession, WorkoutSet
+from .rollups import session_rollup_days
+from .state import apply_deleted_set, apply_saved_sets, invalidate_session_state
+from .tasks import rebuild_user_last_performance, rebuild_user_rollups
+
+
+def _is_origin(origin, model):
+    """Whether a delete started from an instance or queryset of model"""
+    return isinstance(origin, model) or (isinstance(origin, QuerySet) and origin.model is model)
+
+
+@receiver(post_save, sender=WorkoutSet)
+@receiver(post_delete, sender=WorkoutSet)
+def invalidate_analytics_on_set_change(sender, instance, origin=None, **kwargs):
+    """Drop the session owner's cached analytics whenever one of their sets changes"""
+    # Cascades from a session (or user) delete are handled once by the session receiver,
+    # and sets moved into an archive still count
+    if (origin is not None and not _is_origin(origin, WorkoutSet)) or is_moving_sets():
+        return
+    invalidate_user_analytics(instance.session.user_id)
+
+
+@receiver(post_delete, sender=WorkoutSession)
+def invalidate_analytics_on_session_delete(sender, instance, **kwargs):
+    """Drop the owner's cached analytics when a session and its sets are deleted"""
+    invalidate_user_analytics(instance.user_id)
+
+
+@receiver(pre_delete, sender=WorkoutSession)
+def collect_session_rollup_days(sender, instance, origin=None, **kwargs):
+    """Note which rollup days a session touches while its sets still exist"""
+    # Deleting the user drops their rollups by cascade
+    if not _is_origin(origin, User):
+        instance._rollup_days = session_rollup_days(instance)
+
+
+@receiver(post_delete, sender=WorkoutSession)
+def rebuild_rollups_on_session_delete(sender, instance, **kwargs):
+    """Rebuild the rollup days a deleted session (and its cascaded sets) contributed to"""
+    days = getattr(instance, '_rollup_days', None)
+    if days:
+        rebuild_user_rollups.enqueue(user_id=instance.user_id, days=sorted(day.isoformat() for day in days))
+
+
+@receiver(pre_delete, sender=WorkoutSession)
+def collect_last_performance(sender, instance, origin=None, **kwargs):
+    """Note whether a session is some exercise's last performance before the cascade removes it"""
+    if not _is_origin(origin, User):
+        instance._was_last_performance = LastPerformance.objects.filter(session=instance).exists()
+
+
+@receiver(post_delete, sender=WorkoutSession)
+def rebuild_last_performance_on_session_delete(sender, instance, **kwargs):
+    """Fall back to the previous session for exercises whose last performance was deleted"""
+    if getattr(instance, '_was_last_performance', False):
+        rebuild_user_last_performance.enqueue(unique=True, user_id=instance.user_id)
+
+
+@receiver(post_save, sender=WorkoutSet)
+def write_saved_set_to_session_state(sender, instance, **kwargs):
+    """Apply a saved set to its session's cached state once it commits"""
+    transaction.on_commit(lambda: apply_saved_sets(instance.session_id, [instance]))
+
+
+@receiver(post_delete, sender=WorkoutSet)
+def remove_deleted_set_from_session_state(sender, instance, origin=None, **kwargs):
+    """Remove a deleted set from its session's cached state once the delete commits"""
+    # A cascade from the session drops the whole state in the session receiver; archive_sessions
+    # drops the state of sessions whose sets it moved
+    if (origin is not None and not _is_origin(origin, WorkoutSet)) or is_moving_sets():
+        return
+    session_id, set_id = instance.session_id, instance.pk  # pk is cleared before on_commit runs
+    transaction.on_commit(lambda: apply_deleted_set(session_id, set_id))
+
+
+@receiver(post_save, sender=WorkoutSession)
+@receiver(post_delete, sender=WorkoutSession)
+def invalidate_session_state_on_session_change(sender, instance, **kwargs):
+    """Drop a session's cached state whenever the session row itself changes"""
+    session_id = instance.pk
+    invalidate_session_state(session_id)
+    transaction.on_commit(lambda: invalidate_session_state(session_id))
+
+
+def _invalidate_routine_session_states(routine_id):
+    """Drop the cached state of in-progress sessions that follow a routine's exercise list"""
+    session_ids = list(WorkoutSession.objects.filter(
+        Q(routine_id=routine_id) | Q(routine__source_id=routine_id, routine__shares_exercises=True), status='in_progress'
+    ).values_list('id', flat=True))
+    if session_ids:
+        invalidate_session_state(*session_ids)
+        transaction.on_commit(lambda: invalidate_session_state(*session_ids))
+
+
+@receiver(post_save, sender=Routine)
+def invalidate_session_state_on_routine_save(sender, instance, **kwargs):
+    """Drop the state of sessions showing this routine, whose name or settings may have changed"""
+    _invalidate_routine_session_states(instance.pk)
+
+
+@receiver(exercises_changed, sender=Routine)
+def invalidate_session_state_on_exercises_changed(sender, routine, **kwargs):
+    """Drop the state of sessions following a routine whose exercise list was edited"""
+    _invalidate_routine_session_states(routine.pk)
+
+
+@receiver(post_save, sender=RoutineExercise)
+@receiver(post_delete, sender=RoutineExercise)
+def invalidate_session_state_on_routine_exercise_change(sender, instance, origin=None, **kwargs):
+    """Drop the state of sessions following a routine when one of its exercise rows is saved or deleted"""
+    # Deleting the routine itself deletes its sessions too
+    if origin is not None and not _is_origin(origin, RoutineExercise):
+        return
+    _invalidate_routine_session_states(instance.routine_id)
@@ -0,0 +1,178 @@
+"""
+Cached state of a workout session.
+
+Every in-workout request needs the same things: the session, its routine's
+exercise plan, the sets logged so far and the exercises' last performances.
+The session state keeps these in the cache as model instances. It is built
+with a few queries on first use and then kept current write-through: saved
+and deleted sets are applied to the cached state once their transaction
+commits, instead of the state being dropped and rebuilt. Rare changes (the
+session itself, or its routine's exercises) drop the state.
+
+Updates to one session's state are serialised with a short cache lock. A
+generation counter stops a slow rebuild from caching state read before a
+write it did not see. A write that cannot get the lock drops the state
+rather than risk losing itself.
+
+Writes only reach the processes that share the cache, so with several
+processes the cache must be shared (REDIS_URL; see the workouts.W001 deploy
+check), or each process would serve its own stale copy.
+"""
+import time
+
+from django.core.cache import cache
+
+from .archive import session_sets
+from .models import WorkoutSession, WorkoutSet
+from .performance import get_last_performances
+
+SESSION_STATE_CACHE_KEY = 'workouts:session:{session_id}:state'
+SESSION_STATE_TIMEOUT = 60 * 60 * 6  # Comfortably longer than a workout
+
+STATE_LOCK_TIMEOUT = 5
+STATE_LOCK_ATTEMPTS = 20
+STATE_LOCK_WAIT_SECONDS = 0.005
+
+
+def _keys(session_id):
+    key = SESSION_STATE_CACHE_KEY.format(session_id=session_id)
+    return key, f'{key}:lock', f'{key}:generation', f'{key}:conflict'
+
+
+def _acquire(lock_key, attempts=STATE_LOCK_ATTEMPTS):
+    for attempt in range(attempts):
+        if cache.add(lock_key, 1, STATE_LOCK_TIMEOUT):
+            return True
+        if attempt + 1 < attempts:
+            time.sleep(STATE_LOCK_WAIT_SECONDS)
+    return False
+
+
+def _bump_generation(generation_key):
+    cache.add(generation_key, 0, SESSION_STATE_TIMEOUT)
+    try:
+        cache.incr(generation_key)
+    except ValueError:
+        # Expired between add() and incr()
+        cache.set(generation_key, 1, SESSION_STATE_TIMEOUT)
+
+
+def _detached(workout_set):
+    """A copy of a set without its cached relations, so the state does not pickle them"""
+    copy = WorkoutSet(**{field.attname: getattr(workout_set, field.attname) for field in WorkoutSet._meta.concrete_fields})
+    copy._state.adding = False
+    copy._state.db = workout_set._state.db
+    return copy
+
+
+def build_session_state(session_id):
+    """Load a session's state from the database, or None if the session does not exist"""
+    session = WorkoutSession.objects.select_related('routine').filter(pk=session_id).first()
+    if session is None:
+        return None
+    routine_exercises = list(session.routine.get_routine_exercises().select_related('exercise'))
+    sets = {}
+    for workout_set in sorted(session_sets(session), key=lambda item: (item.exercise_id, item.set_number)):
+        sets.setdefault(workout_set.exercise_id, []).append(workout_set)
+    return {
+        'session': session,
+        'routine_exercises': routine_exercises,
+        'sets': sets,  # exercise id -> sets ordered by set number
+        'last_performances': get_last_performances(
+            session.user_id, [re.exercise_id for re in routine_exercises], exclude_session=session
+        ),
+    }
+
+
+def get_session_state(session_id):
+    """Return a session's state, from the cache when possible (None if the session does not exist)"""
+    key, lock_key, generation_key, _ = _keys(session_id)
+    state = cache.get(key)
+    if state is not None:
+        return state
+
+    generation = cache.get(generation_key)
+    state = build_session_state(session_id)
+    # Only cache what was read if no write landed meanwhile; otherwise the next request rebuilds
+    if state is not None and _acquire(lock_key, attempts=1):
+        try:
+            if cache.get(generation_key) == generation:
+                cache.set(key, state, SESSION_STATE_TIMEOUT)
+        finally:
+            cache.delete(lock_key)
+    return state
+
+
+def _update_state(session_id, mutate):
+    """Apply mutate(state) to the cached state, if there is one, under the session's lock"""
+    key, lock_key, generation_key, conflict_key = _keys(session_id)
+    if not _acquire(lock_key):
+        # Drop the state, then flag the lock holder so it drops whatever it is about to write
+        cache.delete(key)
+        cache.set(conflict_key, 1, STATE_LOCK_TIMEOUT)
+        _bump_generation(generation_key)
+        return
+    try:
+        cache.delete(conflict_key)
+        _bump_generation(generation_key)
+        state = cache.get(key)
+        if state is not None:
+            mutate(state)
+            cache.set(key, state, SESSION_STATE_TIMEOUT)
+            if cache.get(conflict_key):
+                cache.delete(key)
+    finally:
+        cache.delete(lock_key)
+
+
+def _remove_set(state, set_id):
+    """Remove a set from the state by id, returning it (or None)"""
+    for exercise_sets in state['sets'].values():
+        for i, workout_set in enumerate(exercise_sets):
+            if workout_set.pk == set_id:
+                return exercise_sets.pop(i)
+    return None
+
+
+def apply_saved_sets(session_id, workout_sets):
+    """Write saved (new or edited) sets through to the session's cached state"""
+    workout_sets = [_detached(workout_set) for workout_set in workout_sets]
+
+    def mutate(state):
+        session = state['session']
+        for workout_set in workout_sets:
+            previous = _remove_set(state, workout_set.pk)
+            exercise_sets = state['sets'].setdefault(workout_set.exercise_id, [])
+            exercise_sets.append(workout_set)
+            exercise_sets.sort(key=lambda item: item.set_number)
+            session.total_volume += workout_set.volume - (previous.volume if previous else 0)
+
+    _update_state(session_id, mutate)
+
+
+def apply_deleted_set(session_id, set_id):
+    """Remove a deleted set from the session's cached state"""
+    def mutate(state):
+        previous = _remove_set(state, set_id)
+        if previous is not None:
+            state['session'].total_volume -= previous.volume
+
+    _update_state(session_id, mutate)
+
+
+def invalidate_session_state(*session_ids):
+    """Drop cached session states so the next request rebuilds them"""
+    for session_id in session_ids:
+        key, _, generation_key, _ = _keys(session_id)
+        _bump_generation(generation_key)
+        cache.delete(key)
+
+
+def completed_counts(state):
+    """{exercise id: sets logged} for a session state"""
+    return {exercise_id: len(exercise_sets) for exercise_id, exercise_sets in state['sets'].items()}
+
+
+def routine_exercise_for(state, exercise_id):
+    """The plan entry for an exercise, or None if it is not in the session's routine"""
+    return next((re for re in state['routine_exercises'] if re.exercise_id == exercise_id), None)
@@ -0,0 +1,72 @@
+"""
+Background tasks for side effects that need not hold up a request (see taskqueue).
+
+Each task reads current state rather than trusting its arguments, so one that
+runs late, or after the session it names was deleted, still leaves the
+derived tables right.
+"""
+from datetime import date
+
+from taskqueue.queue import task
+
+from .models import ArchivedSession, WorkoutSession, WorkoutSet
+from .performance import rebuild_last_performance, record_last_performance
+from .records import rebuild_personal_records
+from .rollups import rebuild_rollups, record_session_completed
+
+REBUILD_CHUNK_SIZE = 100  # Users per rollup rebuild
+
+
+@task(priority=10)
+def process_completed_session(session_id):
+    """Count a completed session in the rollups and record it as each exercise's last performance"""
+    session = WorkoutSession.objects.filter(
+        pk=session_id, status='completed', completed_at__isnull=False,
+    ).first()
+    if session is None:
+        return  # Deleted or reopened since; its delete rebuilt anything it touched
+    record_session_completed(session)
+    record_last_performance(session)
+
+
+@task(priority=5)
+def rebuild_user_records(user_id, exercise_ids):
+    """Recompute records that an edited or deleted set may have held"""
+    rebuild_personal_records([user_id], exercise_ids)
+
+
+@task()
+def rebuild_user_rollups(user_id, days):
+    """Recompute the rollup days (ISO dates) a deleted session contributed to"""
+    rebuild_rollups([user_id], [date.fromisoformat(day) for day in days])
+
+
+@task()
+def rebuild_user_last_performance(user_id):
+    """Fall back to earlier sessions after a last performance was deleted"""
+    rebuild_last_performance([user_id])
+
+
+@task(priority=-5)
+def rebuild_rollups_for_exercises(exercise_ids):
+    """Queue rollup rebuilds, a chunk of users per task, for users who trained exercises whose muscle changed"""
+    user_ids = set(
+        WorkoutSet.objects.filter(exercise_id__in=exercise_ids).values_list('session__user_id', flat=True).distinct()
+    )
+    # Archived sets are packed, but each archive lists its exercises
+    wanted = set(exercise_ids)
+    user_ids.update(
+        user_id for user_id, archived_ids in ArchivedSession.objects.values_list(
+            'session__user_id', 'exercise_ids'
+        ).iterator(chunk_size=1000)
+        if not wanted.isdisjoint(archived_ids)
+    )
+    user_ids = sorted(user_ids)
+    for i in range(0, len(user_ids), REBUILD_CHUNK_SIZE):
+        rebuild_user_chunk_rollups.enqueue(user_ids=user_ids[i:i + REBUILD_CHUNK_SIZE])
+
+
+@task(priority=-5, timeout=10 * 60)
+def rebuild_user_chunk_rollups(user_ids):
+    """Rebuild every rollup row of a chunk of users, committed (and retried) on its own"""
+    rebuild_rollups(user_ids)
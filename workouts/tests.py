@@ -1,10 +1,27 @@
-from django.test import TestCase, Client
+from datetime import datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+
+import asyncio
+import threading
+from unittest import mock
+
+from asgiref.sync import sync_to_async
+
+from django.core.cache import cache
+from django.test import TestCase, Client, override_settings
 from django.contrib.auth.models import User
 from django.urls import reverse
 from django.utils import timezone
-from workouts.models import WorkoutSession, WorkoutSet
+from workouts.analytics import compute_analytics, get_user_analytics, load_user_sets
+from workouts.events import InProcessBroker, get_broker, session_channel
+from workouts.models import (WorkoutSession, WorkoutSet, DailyTrainingRollup, WeeklyMuscleRollup, PersonalRecord,
+                             LastPerformance, ArchivedSession)
+from workouts.state import SESSION_STATE_CACHE_KEY, get_session_state
 from routines.models import Routine, RoutineExercise
+from routines.summaries import routine_exercises_changed
 from exercises.models import Exercise
+from taskqueue.models import Task
+from taskqueue.worker import run_pending
 
 
 class WorkoutSessionModelTests(TestCase):
@@ -87,6 +104,606 @@ class WorkoutSetModelTests(TestCase):
         self.assertEqual(str(self.workout_set), expected)
 
 
+class SessionVolumeTests(TestCase):
+    """Test session total volume is maintained incrementally"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='testuser',
+            password='testpass123!@#'
+        )
+        self.routine = Routine.objects.create(name='Test Routine', user=self.user)
+        self.exercise = Exercise.objects.create(title='Bench', name='bench', slug='bench', equipment='barbell')
+        self.session = WorkoutSession.objects.create(routine=self.routine, user=self.user)
+
+    def _log_set(self, set_number, weight, reps):
+        return WorkoutSet.objects.create(
+            session=self.session, exercise=self.exercise, set_number=set_number, weight=weight, reps=reps
+        )
+
+    def _total(self):
+        self.session.refresh_from_db()
+        return self.session.total_volume
+
+    def test_new_set_adds_volume_in_constant_queries(self):
+        """Test logging a set costs the same number of queries however many sets exist"""
+        for set_number in range(1, 6):
+            self._log_set(set_number, 50, 10)
+
+        # savepoint, insert, volume update, two rollup updates, record read, session volume, record write, release
+        with self.assertNumQueries(9):
+            self._log_set(6, 52.5, 8)
+
+        self.assertEqual(self._total(), Decimal('2920.00'))
+
+    def test_edit_and_delete_adjust_volume(self):
+        """Test editing a set applies the difference and deleting removes its volume"""
+        first = self._log_set(1, 60, 10)
+        self._log_set(2, 60, 8)
+
+        first.reps = 12
+        first.save()
+        self.assertEqual(self._total(), Decimal('1200.00'))
+
+        first.delete()
+        self.assertEqual(self._total(), Decimal('480.00'))
+
+    def test_reconcile_command_fixes_drift(self):
+        """Test the reconcile command restores totals after bulk deletes"""
+        from io import StringIO
+        from django.core.management import call_command
+        self._log_set(1, 60, 10)
+        self._log_set(2, 60, 8)
+        WorkoutSet.objects.filter(set_number=2).delete()  # Queryset deletes bypass the adjustment
+
+        call_command('reconcile_session_volume', stdout=StringIO())
+
+        self.assertEqual(self._total(), Decimal('600.00'))
+
+
+class TrainingRollupTests(TestCase):
+    """Test daily and weekly rollups are maintained incrementally and can be rebuilt"""
+
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(username='testuser', password='testpass123!@#')
+        self.routine = Routine.objects.create(name='Test Routine', user=self.user)
+        self.squat = Exercise.objects.create(title='Squat', slug='squat', muscle='quads')
+        self.curl = Exercise.objects.create(title='Curl', slug='curl')
+        RoutineExercise.objects.create(routine=self.routine, exercise=self.squat, order=0)
+        self.session = WorkoutSession.objects.create(routine=self.routine, user=self.user)
+        self.today = timezone.localdate()
+
+    def _log_set(self, exercise, set_number, weight, reps, **kwargs):
+        return WorkoutSet.objects.create(
+            session=self.session, exercise=exercise, set_number=set_number, weight=weight, reps=reps, **kwargs
+        )
+
+    def _snapshot(self):
+        daily = DailyTrainingRollup.objects.filter(user=self.user).values_list(
+            'day', 'sessions', 'sets', 'reps', 'volume', 'top_weight')
+        weekly = WeeklyMuscleRollup.objects.filter(user=self.user).values_list(
+            'week_start', 'muscle', 'sets', 'reps', 'volume', 'top_weight')
+        return sorted(daily), sorted(weekly)
+
+    def test_logging_sets_updates_rollups(self):
+        """Test each set is added to its day and its week and muscle"""
+        self._log_set(self.squat, 1, 100, 5)
+        self._log_set(self.squat, 2, 90, 8)
+        self._log_set(self.curl, 1, 20, 12)
+
+        day = DailyTrainingRollup.objects.get(user=self.user, day=self.today)
+        self.assertEqual((day.sets, day.reps, day.volume, day.top_weight), (3, 25, Decimal('1460.00'), Decimal('100.00')))
+        quads = WeeklyMuscleRollup.objects.get(user=self.user, muscle='quads')
+        self.assertEqual(quads.week_start, self.today - timedelta(days=self.today.weekday()))
+        self.assertEqual((quads.sets, quads.volume), (2, Decimal('1220.00')))
+        self.assertTrue(WeeklyMuscleRollup.objects.filter(user=self.user, muscle='other', sets=1).exists())
+
+    def test_edit_and_delete_update_rollups(self):
+        """Test lowering the top set recomputes the top weight and removing every set drops the rows"""
+        top = self._log_set(self.squat, 1, 100, 5)
+        other = self._log_set(self.squat, 2, 90, 8)
+
+        top.weight = 80
+        top.save()
+        day = DailyTrainingRollup.objects.get(user=self.user)
+        self.assertEqual((day.sets, day.volume, day.top_weight), (2, Decimal('1120.00'), Decimal('90.00')))
+
+        top.delete()
+        other.delete()
+        self.assertFalse(DailyTrainingRollup.objects.filter(user=self.user).exists())
+        self.assertFalse(WeeklyMuscleRollup.objects.filter(user=self.user).exists())
+
+    def test_moving_a_set_to_another_day(self):
+        """Test changing when a set was done moves it between days"""
+        workout_set = self._log_set(self.squat, 1, 100, 5)
+
+        workout_set.completed_at = timezone.now() - timedelta(days=8)
+        workout_set.save()
+
+        day = DailyTrainingRollup.objects.get(user=self.user)
+        self.assertEqual(day.day, self.today - timedelta(days=8))
+        self.assertEqual(WeeklyMuscleRollup.objects.filter(user=self.user).count(), 1)
+
+    def test_completing_session_counts_once(self):
+        """Test completing a session counts it on the day, even if completion is resubmitted"""
+        self.client.login(username='testuser', password='testpass123!@#')
+        url = reverse('workouts:workout_complete', kwargs={'session_id': self.session.id})
+
+        self.client.post(url)
+        self.client.post(url)
+        run_pending()
+
+        self.assertEqual(DailyTrainingRollup.objects.get(user=self.user, day=self.today).sessions, 1)
+
+    def test_batch_sync_updates_rollups(self):
+        """Test sets written by the batch endpoint are rolled up, including overwrites"""
+        import json
+        self.client.login(username='testuser', password='testpass123!@#')
+        url = reverse('workouts:save_workout_sets_batch', kwargs={'session_id': self.session.id})
+        sets = [
+            {'client_id': 'a', 'exercise_id': self.squat.id, 'set_number': 1, 'weight': 100, 'reps': 5},
+            {'client_id': 'b', 'exercise_id': self.squat.id, 'set_number': 2, 'weight': 80, 'reps': 5},
+        ]
+        self.client.post(url, json.dumps({'sets': sets}), content_type='application/json')
+        overwrite = [{'client_id': 'c', 'exercise_id': self.squat.id, 'set_number': 1, 'weight': 60, 'reps': 5}]
+        self.client.post(url, json.dumps({'sets': overwrite}), content_type='application/json')
+
+        day = DailyTrainingRollup.objects.get(user=self.user)
+        self.assertEqual((day.sets, day.volume, day.top_weight), (2, Decimal('700.00'), Decimal('80.00')))
+
+    def test_deleting_session_rebuilds_its_days(self):
+        """Test deleting a session removes its sets and completion from the rollups"""
+        self._log_set(self.squat, 1, 100, 5)
+        other_session = WorkoutSession.objects.create(routine=self.routine, user=self.user)
+        WorkoutSet.objects.create(session=other_session, exercise=self.squat, set_number=1, weight=50, reps=10)
+
+        self.session.delete()
+        run_pending()
+
+        day = DailyTrainingRollup.objects.get(user=self.user)
+        self.assertEqual((day.sets, day.volume, day.top_weight), (1, Decimal('500.00'), Decimal('50.00')))
+
+    def test_backfill_matches_incremental_rollups(self):
+        """Test the backfill command rebuilds exactly what incremental maintenance produced"""
+        from io import StringIO
+        from django.core.management import call_command
+        self._log_set(self.squat, 1, 100, 5)
+        self._log_set(self.squat, 2, 90, 8, completed_at=timezone.now() - timedelta(days=10))
+        self._log_set(self.curl, 1, 20, 12)
+        self.client.login(username='testuser', password='testpass123!@#')
+        self.client.post(reverse('workouts:workout_complete', kwargs={'session_id': self.session.id}))
+        run_pending()
+        expected = self._snapshot()
+
+        DailyTrainingRollup.objects.all().delete()
+        WeeklyMuscleRollup.objects.all().delete()
+        call_command('backfill_training_rollups', '--chunk-size', '1', stdout=StringIO())
+
+        self.assertEqual(self._snapshot(), expected)
+
+    def test_rollups_api(self):
+        """Test the API returns rollup rows for the requested period"""
+        self._log_set(self.squat, 1, 100, 5)
+        self.client.login(username='testuser', password='testpass123!@#')
+
+        daily = self.client.get(reverse('workouts:training_rollups_api', kwargs={'period': 'daily'})).json()
+        weekly = self.client.get(reverse('workouts:training_rollups_api', kwargs={'period': 'weekly'})).json()
+        missing = self.client.get(reverse('workouts:training_rollups_api', kwargs={'period': 'hourly'}))
+
+        self.assertEqual(daily['rows'][0]['volume'], 500.0)
+        self.assertEqual(weekly['rows'][0]['muscle'], 'quads')
+        self.assertEqual(missing.status_code, 404)
+
+    def test_rollups_api_requires_authentication(self):
+        """Test anonymous users get 401"""
+        response = self.client.get(reverse('workouts:training_rollups_api', kwargs={'period': 'daily'}))
+
+        self.assertEqual(response.status_code, 401)
+
+
+class PersonalRecordTests(TestCase):
+    """Test personal records are detected as sets are saved"""
+
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(username='testuser', password='testpass123!@#')
+        self.routine = Routine.objects.create(name='Test Routine', user=self.user)
+        self.exercise = Exercise.objects.create(title='Squat', slug='squat', muscle='quads')
+        RoutineExercise.objects.create(routine=self.routine, exercise=self.exercise, order=0)
+        self.session = WorkoutSession.objects.create(routine=self.routine, user=self.user)
+
+    def _log_set(self, set_number, weight, reps, session=None):
+        workout_set = WorkoutSet(session=session or self.session, exercise=self.exercise,
+                                 set_number=set_number, weight=weight, reps=reps)
+        workout_set.save()
+        return workout_set
+
+    def _record(self):
+        return PersonalRecord.objects.get(user=self.user, exercise=self.exercise)
+
+    def test_first_set_establishes_record_without_flag(self):
+        """Test the first set of an exercise sets the baseline but is not reported as a PR"""
+        workout_set = self._log_set(1, 100, 5)
+
+        self.assertEqual(workout_set.personal_records, [])
+        record = self._record()
+        self.assertEqual(record.best_weights, {'5': '100.00'})
+        self.assertEqual(record.best_one_rep_max, Decimal('116.67'))
+        self.assertEqual(record.best_session_volume, Decimal('500.00'))
+
+    def test_heavier_set_is_flagged(self):
+        """Test beating the weight at a rep count and the estimated 1RM is reported"""
+        self._log_set(1, 100, 5)
+
+        lighter = self._log_set(2, 90, 5)
+        heavier = self._log_set(3, 105, 5)
+
+        self.assertEqual(lighter.personal_records, [])
+        self.assertEqual(heavier.personal_records, ['weight', 'one_rep_max'])
+        self.assertEqual(self._record().best_weights, {'5': '105.00'})
+
+    def test_session_volume_reported_once(self):
+        """Test a session is reported when it overtakes the best session volume, not on every set after"""
+        self._log_set(1, 100, 5)
+        other = WorkoutSession.objects.create(routine=self.routine, user=self.user)
+
+        first = self._log_set(1, 60, 5, session=other)
+        second = self._log_set(2, 60, 5, session=other)
+        third = self._log_set(3, 60, 5, session=other)
+
+        self.assertEqual(first.personal_records, [])
+        self.assertEqual(second.personal_records, ['session_volume'])
+        self.assertEqual(third.personal_records, [])
+        self.assertEqual(self._record().best_session_id, other.id)
+
+    def test_record_created_concurrently_is_locked_and_updated(self):
+        """Test a record inserted by a concurrent save after the first read is reused, not duplicated"""
+        original_bulk_create = PersonalRecord.objects.bulk_create
+
+        def concurrent_first(records, **kwargs):
+            PersonalRecord.objects.create(user=self.user, exercise=self.exercise, best_weights={'5': '100.00'},
+                                          best_one_rep_max=Decimal('116.67'), best_session_volume=Decimal('500.00'))
+            return original_bulk_create(records, **kwargs)
+
+        with mock.patch.object(PersonalRecord.objects, 'bulk_create', side_effect=concurrent_first):
+            workout_set = self._log_set(1, 110, 5)
+
+        self.assertEqual(workout_set.personal_records, ['weight', 'one_rep_max', 'session_volume'])
+        self.assertEqual(self._record().best_weights, {'5': '110.00'})
+
+    def test_deleting_record_set_rebuilds(self):
+        """Test deleting the set that holds a record falls back to the next best"""
+        self._log_set(1, 100, 5)
+        best = self._log_set(2, 120, 5)
+
+        best.delete()
+        run_pending()
+
+        record = self._record()
+        self.assertEqual(record.best_weights, {'5': '100.00'})
+        self.assertEqual(record.best_one_rep_max, Decimal('116.67'))
+
+    def test_save_response_includes_pr_flag(self):
+        """Test the save endpoint reports a new PR"""
+        self._log_set(1, 100, 5)
+        self.client.login(username='testuser', password='testpass123!@#')
+
+        response = self.client.post(reverse('workouts:save_workout_set'), {
+            'session_id': self.session.id, 'exercise_id': self.exercise.id,
+            'set_number': 2, 'weight': 110, 'reps': 5,
+        })
+
+        data = response.json()
+        self.assertTrue(data['is_pr'])
+        self.assertIn('one_rep_max', data['personal_records'])
+
+    def test_batch_results_include_records(self):
+        """Test batch-synced sets are checked against records too"""
+        import json
+        self._log_set(1, 100, 5)
+        self.client.login(username='testuser', password='testpass123!@#')
+
+        response = self.client.post(
+            reverse('workouts:save_workout_sets_batch', kwargs={'session_id': self.session.id}),
+            json.dumps({'sets': [
+                {'client_id': 'a', 'exercise_id': self.exercise.id, 'set_number': 2, 'weight': 80, 'reps': 5},
+                {'client_id': 'b', 'exercise_id': self.exercise.id, 'set_number': 3, 'weight': 110, 'reps': 5},
+            ]}),
+            content_type='application/json',
+        )
+
+        first, second = response.json()['results']
+        self.assertEqual(first['personal_records'], [])
+        self.assertEqual(second['personal_records'], ['weight', 'one_rep_max'])
+
+    def test_rebuild_command_matches_incremental(self):
+        """Test the rebuild command reproduces the incrementally maintained records"""
+        from io import StringIO
+        from django.core.management import call_command
+        self._log_set(1, 100, 5)
+        self._log_set(2, 80, 10)
+        self._log_set(3, 130, 1)
+        expected = PersonalRecord.objects.values('best_weights', 'best_one_rep_max',
+                                                 'best_session_volume', 'best_session').get()
+
+        PersonalRecord.objects.all().delete()
+        call_command('rebuild_personal_records', stdout=StringIO())
+
+        self.assertEqual(
+            PersonalRecord.objects.values('best_weights', 'best_one_rep_max',
+                                          'best_session_volume', 'best_session').get(),
+            expected,
+        )
+
+
+class LastPerformanceTests(TestCase):
+    """Test the "last time" snapshot is kept on session completion and served with the workout pages"""
+
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(username='testuser', password='testpass123!@#')
+        self.routine = Routine.objects.create(name='Test Routine', user=self.user)
+        self.exercise = Exercise.objects.create(title='Squat', slug='squat', muscle='quads')
+        self.other_exercise = Exercise.objects.create(title='Curl', slug='curl')
+        RoutineExercise.objects.create(routine=self.routine, exercise=self.exercise, sets_count=3, order=0)
+        RoutineExercise.objects.create(routine=self.routine, exercise=self.other_exercise, sets_count=3, order=1)
+        self.client.login(username='testuser', password='testpass123!@#')
+
+    def _complete_session(self, sets):
+        session = WorkoutSession.objects.create(routine=self.routine, user=self.user)
+        for set_number, (weight, reps) in enumerate(sets, start=1):
+            WorkoutSet.objects.create(session=session, exercise=self.exercise, set_number=set_number,
+                                      weight=weight, reps=reps)
+        self.client.post(reverse('workouts:workout_complete', kwargs={'session_id': session.id}))
+        run_pending()
+        return session
+
+    def test_completion_records_snapshot(self):
+        """Test completing a session stores its sets as the last performance"""
+        session = self._complete_session([(80, 8), (80, 8), (80, 7)])
+
+        performance = LastPerformance.objects.get(user=self.user, exercise=self.exercise)
+        self.assertEqual(performance.session, session)
+        self.assertEqual(performance.summary(), '80 kg × 8, 8, 7')
+
+    def test_completion_is_processed_by_worker(self):
+        """Test completing a session queues its rollup count and snapshot for the worker"""
+        session = WorkoutSession.objects.create(routine=self.routine, user=self.user)
+        WorkoutSet.objects.create(session=session, exercise=self.exercise, set_number=1, weight=100, reps=5)
+
+        self.client.post(reverse('workouts:workout_complete', kwargs={'session_id': session.id}))
+        self.assertFalse(LastPerformance.objects.exists())
+        self.assertEqual(Task.objects.get().name, 'workouts.tasks.process_completed_session')
+
+        run_pending()
+        self.assertEqual(LastPerformance.objects.get().session, session)
+        self.assertEqual(DailyTrainingRollup.objects.get(user=self.user).sessions, 1)
+
+    def test_later_session_replaces_snapshot(self):
+        """Test only the latest completed session is kept, with mixed weights summarised per set"""
+        self._complete_session([(80, 8)])
+        self._complete_session([(82.5, 6), (85, 5)])
+
+        performance = LastPerformance.objects.get(user=self.user, exercise=self.exercise)
+        self.assertEqual(performance.summary(), '82.5 kg × 6, 85 kg × 5')
+
+    def test_shown_on_exercise_page_and_sets_api(self):
+        """Test the exercise page and sets API serve the previous session's sets"""
+        self._complete_session([(80, 8), (80, 7)])
+        session = WorkoutSession.objects.create(routine=self.routine, user=self.user)
+
+        page = self.client.get(reverse('workouts:workout_exercise', kwargs={
+            'session_id': session.id, 'exercise_id': self.exercise.id}))
+        api = self.client.get(reverse('workouts:workout_exercise_sets_api', kwargs={
+            'session_id': session.id, 'exercise_id': self.exercise.id})).json()
+
+        self.assertContains(page, '80 kg × 8, 7')
+        self.assertEqual(api['last_performance']['sets'][0], {'set_number': 1, 'weight': 80.0, 'reps': 8})
+
+    def test_session_page_uses_one_lookup(self):
+        """Test the session page attaches last performances to each exercise"""
+        self._complete_session([(80, 8)])
+        session = WorkoutSession.objects.create(routine=self.routine, user=self.user)
+
+        response = self.client.get(reverse('workouts:workout_session', kwargs={'session_id': session.id}))
+
+        progress = response.context['exercise_progress']
+        self.assertEqual(progress[0]['last_performance'].summary(), '80 kg × 8')
+        self.assertIsNone(progress[1]['last_performance'])
+
+    def test_deleting_last_session_falls_back(self):
+        """Test deleting the latest session restores the one before it"""
+        self._complete_session([(80, 8)])
+        latest = self._complete_session([(90, 5)])
+
+        latest.delete()
+        run_pending()
+
+        self.assertEqual(LastPerformance.objects.get(user=self.user, exercise=self.exercise).summary(), '80 kg × 8')
+
+    def test_rebuild_command(self):
+        """Test the rebuild command recreates snapshots from history"""
+        from io import StringIO
+        from django.core.management import call_command
+        self._complete_session([(80, 8)])
+        self._complete_session([(90, 5), (90, 5)])
+        LastPerformance.objects.all().delete()
+
+        call_command('rebuild_last_performance', stdout=StringIO())
+
+        self.assertEqual(LastPerformance.objects.get(user=self.user, exercise=self.exercise).summary(), '90 kg × 5, 5')
+
+
+class RecordingBroker:
+    """Test broker keeping every published event"""
+    events = []
+
+    def publish(self, channel, event):
+        self.events.append((channel, event))
+
+
+@override_settings(WORKOUT_EVENTS_BROKER='workouts.tests.RecordingBroker')
+class SessionEventPublishingTests(TestCase):
+    """Test set, exercise and completion events are published for a session"""
+
+    def setUp(self):
+        get_broker.cache_clear()
+        RecordingBroker.events = []
+        self.client = Client()
+        self.user = User.objects.create_user(username='testuser', password='testpass123!@#')
+        self.routine = Routine.objects.create(name='Test Routine', user=self.user)
+        self.first = Exercise.objects.create(title='Squat', slug='squat')
+        self.second = Exercise.objects.create(title='Curl', slug='curl')
+        RoutineExercise.objects.create(routine=self.routine, exercise=self.first, sets_count=2, order=0)
+        RoutineExercise.objects.create(routine=self.routine, exercise=self.second, sets_count=1, order=1)
+        self.session = WorkoutSession.objects.create(routine=self.routine, user=self.user)
+        self.client.login(username='testuser', password='testpass123!@#')
+
+    def tearDown(self):
+        get_broker.cache_clear()
+
+    def _save_set(self, exercise, set_number, **extra):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post(reverse('workouts:save_workout_set'), {
+                'session_id': self.session.id, 'exercise_id': exercise.id,
+                'set_number': set_number, 'weight': 50, 'reps': 10, **extra,
+            })
+
+    def _event_types(self):
+        return [event['type'] for _, event in RecordingBroker.events]
+
+    def test_set_saved_event(self):
+        """Test saving a set publishes it, tagged with the saving page's client id"""
+        response = self._save_set(self.first, 1, client_id='tab-1')
+
+        channel, event = RecordingBroker.events[0]
+        self.assertEqual(channel, session_channel(self.session.id))
+        self.assertEqual(event['type'], 'set_saved')
+        self.assertEqual(event['data']['sets'][0]['set_id'], response.json()['set_id'])
+        self.assertEqual(event['data']['sets'][0]['client_id'], 'tab-1')
+        self.assertEqual(self._event_types(), ['set_saved'])
+
+    def test_exercise_advanced_event(self):
+        """Test reaching an exercise's target sets announces the next exercise"""
+        self._save_set(self.first, 1)
+        self._save_set(self.first, 2)
+
+        self.assertEqual(self._event_types(), ['set_saved', 'set_saved', 'exercise_advanced'])
+        self.assertEqual(RecordingBroker.events[-1][1]['data'], {
+            'completed_exercise_id': self.first.id, 'current_exercise_id': self.second.id,
+        })
+
+    def test_session_completed_event(self):
+        """Test completing the session publishes once"""
+        url = reverse('workouts:workout_complete', kwargs={'session_id': self.session.id})
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(url)
+            self.client.post(url)
+
+        self.assertEqual(self._event_types(), ['session_completed'])
+
+
+class InProcessBrokerTests(TestCase):
+    """Test the in-process broker fans events out across threads"""
+
+    async def test_publish_from_another_thread(self):
+        """Test a sync publisher on another thread reaches an async subscriber"""
+        broker = InProcessBroker()
+        async with broker.subscribe('channel') as subscription:
+            publisher = threading.Thread(target=broker.publish, args=('channel', {'type': 'set_saved'}))
+            publisher.start()
+            event = await asyncio.wait_for(subscription.get(), 5)
+            publisher.join()
+
+        self.assertEqual(event, {'type': 'set_saved'})
+        self.assertEqual(broker.publish('channel', {'type': 'set_saved'}), 0)  # Unsubscribed on exit
+
+    async def test_other_channels_not_delivered(self):
+        """Test subscribers only see their own channel"""
+        broker = InProcessBroker()
+        async with broker.subscribe('a') as subscription:
+            broker.publish('b', {'type': 'set_saved'})
+            with self.assertRaises(asyncio.TimeoutError):
+                await asyncio.wait_for(subscription.get(), 0.1)
+
+
+class SessionEventsStreamTests(TestCase):
+    """Test the Server-Sent Events endpoint"""
+
+    def setUp(self):
+        get_broker.cache_clear()
+        self.user = User.objects.create_user(username='testuser', password='testpass123!@#')
+        self.routine = Routine.objects.create(name='Test Routine', user=self.user)
+        self.session = WorkoutSession.objects.create(routine=self.routine, user=self.user)
+        self.url = reverse('workouts:session_events', kwargs={'session_id': self.session.id})
+
+    def tearDown(self):
+        get_broker.cache_clear()
+
+    async def test_streams_events_until_completion(self):
+        """Test published events are streamed as SSE messages and completion ends the stream"""
+        await self.async_client.alogin(username='testuser', password='testpass123!@#')
+        response = await self.async_client.get(self.url)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        stream = aiter(response.streaming_content)
+
+        self.assertEqual(await asyncio.wait_for(anext(stream), 5), b'retry: 3000\n\n')
+        channel = session_channel(self.session.id)
+        get_broker().publish(channel, {'id': 1, 'type': 'set_saved', 'session_id': self.session.id,
+                                       'sent_at': 'now', 'data': {'sets': []}})
+        get_broker().publish(channel, {'id': 2, 'type': 'session_completed', 'session_id': self.session.id,
+                                       'sent_at': 'now', 'data': {}})
+
+        message = (await asyncio.wait_for(anext(stream), 5)).decode()
+        self.assertTrue(message.startswith('id: 1\nevent: set_saved\ndata: {"sets": []'))
+        message = (await asyncio.wait_for(anext(stream), 5)).decode()
+        self.assertIn('event: session_completed', message)
+        with self.assertRaises(StopAsyncIteration):
+            await asyncio.wait_for(anext(stream), 5)
+
+    async def test_completed_session_ends_immediately(self):
+        """Test following an already completed session gets a final session_completed instead of polling"""
+        await WorkoutSession.objects.filter(id=self.session.id).aupdate(status='completed',
+                                                                        completed_at=timezone.now())
+        await self.async_client.alogin(username='testuser', password='testpass123!@#')
+        response = await self.async_client.get(self.url)
+        stream = aiter(response.streaming_content)
+
+        self.assertEqual(await asyncio.wait_for(anext(stream), 5), b'retry: 3000\n\n')
+        message = (await asyncio.wait_for(anext(stream), 5)).decode()
+        self.assertIn('event: session_completed', message)
+        self.assertIn('"total_volume": 0.0', message)
+        with self.assertRaises(StopAsyncIteration):
+            await asyncio.wait_for(anext(stream), 5)
+
+    async def test_completion_without_event_ends_on_heartbeat(self):
+        """Test a session completed without its event reaching the stream is noticed at the next heartbeat"""
+        await self.async_client.alogin(username='testuser', password='testpass123!@#')
+        with mock.patch('workouts.views.SSE_HEARTBEAT_SECONDS', 0.05):
+            response = await self.async_client.get(self.url)
+            stream = aiter(response.streaming_content)
+            await asyncio.wait_for(anext(stream), 5)
+            self.assertEqual(await asyncio.wait_for(anext(stream), 5), b': heartbeat\n\n')
+
+            await WorkoutSession.objects.filter(id=self.session.id).aupdate(status='completed',
+                                                                            completed_at=timezone.now())
+
+            message = (await asyncio.wait_for(anext(stream), 5)).decode()
+            self.assertIn('event: session_completed', message)
+            with self.assertRaises(StopAsyncIteration):
+                await asyncio.wait_for(anext(stream), 5)
+
+    async def test_other_users_are_refused(self):
+        """Test another user's session cannot be followed"""
+        await sync_to_async(User.objects.create_user)(username='otheruser', password='testpass123!@#')
+        await self.async_client.alogin(username='otheruser', password='testpass123!@#')
+
+        response = await self.async_client.get(self.url)
+
+        self.assertEqual(response.status_code, 403)
+
+
 class WorkoutSessionViewTests(TestCase):
     """Test workout session views"""
 
@@ -143,6 +760,173 @@ class WorkoutSessionViewTests(TestCase):
         self.assertContains(response, 'push-up')  # Lowercase in template
 
 
+class WorkoutSessionProgressQueryTests(TestCase):
+    """Test the workout page renders in a constant number of queries"""
+
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(
+            username='testuser',
+            password='testpass123!@#'
+        )
+        self.routine = Routine.objects.create(name='Test Routine', user=self.user)
+        self.session = WorkoutSession.objects.create(routine=self.routine, user=self.user)
+        self.client.login(username='testuser', password='testpass123!@#')
+
+    def _add_exercises(self, count):
+        start = self.routine.routine_exercises.count()
+        for i in range(start, start + count):
+            exercise = Exercise.objects.create(title=f'Exercise {i}', slug=f'exercise-{i}', equipment='bodyweight')
+            RoutineExercise.objects.create(routine=self.routine, exercise=exercise, sets_count=3, order=i)
+            WorkoutSet.objects.create(session=self.session, exercise=exercise, set_number=1, weight=10, reps=10)
+
+    def _count_queries(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        url = reverse('workouts:workout_session', kwargs={'session_id': self.session.id})
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(context.captured_queries)
+
+    def test_query_count_independent_of_exercise_count(self):
+        """Test adding exercises does not add queries"""
+        self._add_exercises(2)
+        few = self._count_queries()
+
+        self._add_exercises(6)
+
+        self.assertEqual(self._count_queries(), few)
+
+    def test_progress_counts_completed_sets(self):
+        """Test progress reflects sets logged per exercise"""
+        self._add_exercises(2)
+        first = self.routine.routine_exercises.order_by('order').first()
+        WorkoutSet.objects.create(session=self.session, exercise=first.exercise, set_number=2, weight=10, reps=10)
+
+        response = self.client.get(reverse('workouts:workout_session', kwargs={'session_id': self.session.id}))
+
+        progress = response.context['exercise_progress']
+        self.assertEqual([item['completed_sets_count'] for item in progress], [2, 1])
+        self.assertTrue(progress[0]['is_current'])
+
+
+class SessionStateCacheTests(TestCase):
+    """Test the cached session state behind the in-workout pages"""
+
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.user = User.objects.create_user(
+            username='testuser',
+            password='testpass123!@#'
+        )
+        self.routine = Routine.objects.create(name='Test Routine', user=self.user)
+        self.exercise = Exercise.objects.create(title='Squat', slug='squat', equipment='barbell')
+        RoutineExercise.objects.create(routine=self.routine, exercise=self.exercise, sets_count=3, order=0)
+        self.session = WorkoutSession.objects.create(routine=self.routine, user=self.user)
+        self.client.login(username='testuser', password='testpass123!@#')
+
+    def tearDown(self):
+        cache.clear()
+
+    def _save_set(self, set_number, weight=100, reps=5):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post(reverse('workouts:save_workout_set'), {
+                'session_id': self.session.id,
+                'exercise_id': self.exercise.id,
+                'set_number': set_number,
+                'weight': weight,
+                'reps': reps,
+            })
+
+    def _sets_api(self):
+        return self.client.get(reverse('workouts:workout_exercise_sets_api', kwargs={
+            'session_id': self.session.id, 'exercise_id': self.exercise.id,
+        })).json()
+
+    def test_warm_state_serves_pages_without_session_queries(self):
+        """Test the workout pages read the session, plan and sets from the cache once warm"""
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        self._sets_api()
+        url = reverse('workouts:workout_exercise', kwargs={
+            'session_id': self.session.id, 'exercise_id': self.exercise.id,
+        })
+        self.client.get(url)
+
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+            self._sets_api()
+
+        self.assertEqual(response.status_code, 200)
+        tables = ' '.join(query['sql'] for query in context.captured_queries)
+        for table in ('workouts_workoutsession', 'workouts_workoutset', 'routines_routineexercise'):
+            self.assertNotIn(table, tables)
+
+    def test_saved_set_is_written_through(self):
+        """Test saving a set updates the cached state instead of dropping it"""
+        self._sets_api()
+        self._save_set(1)
+        self._save_set(2, weight=110)
+
+        key = SESSION_STATE_CACHE_KEY.format(session_id=self.session.id)
+        state = cache.get(key)
+        self.assertIsNotNone(state)
+        self.assertEqual([s.set_number for s in state['sets'][self.exercise.id]], [1, 2])
+        self.assertEqual(state['session'].total_volume, Decimal('1050'))
+        self.assertEqual(self._sets_api()['total_sets'], 2)
+
+    def test_edited_and_deleted_sets_update_the_state(self):
+        """Test editing or deleting a set is reflected in the cached state"""
+        self._save_set(1)
+        self._save_set(2)
+        self._sets_api()
+        first, second = WorkoutSet.objects.filter(session=self.session).order_by('set_number')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            first.reps = 10
+            first.save()
+        with self.captureOnCommitCallbacks(execute=True):
+            second.delete()
+
+        data = self._sets_api()
+        self.assertEqual(data['total_sets'], 1)
+        self.assertEqual(data['sets'][0]['reps'], 10)
+        state = cache.get(SESSION_STATE_CACHE_KEY.format(session_id=self.session.id))
+        self.assertEqual(state['session'].total_volume, Decimal('1000'))
+
+    def test_routine_exercise_change_drops_the_state(self):
+        """Test editing the routine's exercise list is picked up by an open session"""
+        self._sets_api()
+        bench = Exercise.objects.create(title='Bench Press', slug='bench-press', equipment='barbell')
+        RoutineExercise.objects.create(routine=self.routine, exercise=bench, sets_count=3, order=1)
+
+        response = self.client.get(reverse('workouts:workout_session', kwargs={'session_id': self.session.id}))
+
+        self.assertEqual(len(response.context['exercise_progress']), 2)
+
+    def test_shared_copy_sessions_follow_the_source_routine(self):
+        """Test sessions of a copy sharing its source's exercises are dropped when the source changes"""
+        copy = Routine.objects.create(name='Copy', user=self.user, source=self.routine, shares_exercises=True)
+        session = WorkoutSession.objects.create(routine=copy, user=self.user)
+        get_session_state(session.id)
+
+        routine_exercises_changed(self.routine)
+
+        self.assertIsNone(cache.get(SESSION_STATE_CACHE_KEY.format(session_id=session.id)))
+
+    def test_deploy_check_requires_shared_cache(self):
+        """Test the deploy check warns about a process-local cache and accepts a shared one"""
+        from workouts.checks import check_shared_cache
+        self.assertEqual([message.id for message in check_shared_cache(None)], ['workouts.W001'])
+
+        with override_settings(CACHES={'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': 'redis://localhost:6379/0',
+        }}):
+            self.assertEqual(check_shared_cache(None), [])
+
+
 class WorkoutHistoryViewTests(TestCase):
     """Test workout history views"""
 
@@ -203,6 +987,67 @@ class WorkoutHistoryViewTests(TestCase):
         self.assertIsNotNone(default_user)
 
 
+class WorkoutHistoryPaginationTests(TestCase):
+    """Test keyset-paginated, annotated workout history"""
+
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(
+            username='testuser',
+            password='testpass123!@#'
+        )
+        self.routine = Routine.objects.create(name='Test Routine', user=self.user)
+        self.exercise = Exercise.objects.create(title='Bench', slug='bench', equipment='barbell')
+        now = timezone.now()
+        self.sessions = [
+            WorkoutSession.objects.create(
+                routine=self.routine, user=self.user, started_at=now - timedelta(days=i), status='completed'
+            )
+            for i in range(25)
+        ]
+        for set_number in (1, 2):
+            WorkoutSet.objects.create(
+                session=self.sessions[0], exercise=self.exercise, set_number=set_number, weight=50, reps=10
+            )
+        self.client.login(username='testuser', password='testpass123!@#')
+
+    def test_first_page_is_annotated_and_limited(self):
+        """Test the first page holds the newest sessions with their counts"""
+        from workouts.views import HISTORY_PAGE_SIZE
+        response = self.client.get(reverse('workouts:workout_history'))
+
+        sessions = response.context['sessions']
+        self.assertEqual(len(sessions), HISTORY_PAGE_SIZE)
+        self.assertEqual(sessions[0].id, self.sessions[0].id)
+        self.assertEqual((sessions[0].set_count, sessions[0].exercise_count), (2, 1))
+        self.assertEqual(sessions[0].exercise_breakdown, [{'name': 'Bench', 'sets': 2}])
+        self.assertIsNotNone(response.context['next_cursor'])
+        self.assertTrue(response.context['monthly_summary'])
+
+    def test_cursor_returns_remaining_sessions(self):
+        """Test following the cursor returns the older sessions without overlap"""
+        first = self.client.get(reverse('workouts:workout_history'))
+        response = self.client.get(reverse('workouts:workout_history'), {'cursor': first.context['next_cursor']})
+
+        ids = [session.id for session in response.context['sessions']]
+        self.assertEqual(ids, [session.id for session in self.sessions[20:]])
+        self.assertIsNone(response.context['next_cursor'])
+
+    def test_query_count_independent_of_history_length(self):
+        """Test adding sessions does not add queries to a page"""
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        with CaptureQueriesContext(connection) as before:
+            self.client.get(reverse('workouts:workout_history'))
+
+        for i in range(30):
+            WorkoutSession.objects.create(routine=self.routine, user=self.user, status='completed')
+        with CaptureQueriesContext(connection) as after:
+            self.client.get(reverse('workouts:workout_history'))
+
+        self.assertEqual(len(after.captured_queries), len(before.captured_queries))
+
+
 class WorkoutSessionAccessTests(TestCase):
     """Test workout session access control"""
 
@@ -450,6 +1295,230 @@ class SaveWorkoutSetTests(TestCase):
         self.assertFalse(data['success'])
 
 
+class SaveWorkoutSetsBatchTests(TestCase):
+    """Test the batch set endpoint used by offline clients"""
+
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(
+            username='testuser',
+            password='testpass123!@#'
+        )
+        self.other_user = User.objects.create_user(username='otheruser', password='testpass123!@#')
+        self.routine = Routine.objects.create(name='Test Routine', user=self.user)
+        self.bench = Exercise.objects.create(title='Bench', slug='bench', equipment='barbell')
+        self.row = Exercise.objects.create(title='Row', slug='row', equipment='barbell')
+        self.squat = Exercise.objects.create(title='Squat', slug='squat', equipment='barbell')
+        RoutineExercise.objects.create(routine=self.routine, exercise=self.bench, rest_time_seconds=90, order=1)
+        RoutineExercise.objects.create(routine=self.routine, exercise=self.row, rest_time_seconds=60, order=2)
+        self.session = WorkoutSession.objects.create(routine=self.routine, user=self.user)
+        self.url = reverse('workouts:save_workout_sets_batch', kwargs={'session_id': self.session.id})
+
+    def _post(self, sets):
+        import json
+        return self.client.post(self.url, data=json.dumps({'sets': sets}), content_type='application/json')
+
+    def _queued(self):
+        return [
+            {'client_id': f'c{i}', 'exercise_id': exercise.id, 'set_number': number, 'weight': 50, 'reps': 10}
+            for i, (exercise, number) in enumerate([(self.bench, 1), (self.bench, 2), (self.row, 1)])
+        ]
+
+    def test_batch_creates_sets_and_volume(self):
+        """Test a whole queue is saved in one request"""
+        self.client.login(username='testuser', password='testpass123!@#')
+
+        response = self._post(self._queued())
+
+        data = response.json()
+        self.assertEqual(data['saved'], 3)
+        self.assertEqual([result['status'] for result in data['results']], ['created'] * 3)
+        self.assertEqual(data['results'][0]['rest_time'], 90)
+        self.session.refresh_from_db()
+        self.assertEqual(self.session.total_volume, Decimal('1500.00'))
+
+    def test_resending_queue_is_idempotent(self):
+        """Test replaying the same client ids does not duplicate sets or volume"""
+        self.client.login(username='testuser', password='testpass123!@#')
+        self._post(self._queued())
+
+        response = self._post(self._queued())
+
+        self.assertEqual([result['status'] for result in response.json()['results']], ['duplicate'] * 3)
+        self.assertEqual(self.session.workout_sets.count(), 3)
+        self.session.refresh_from_db()
+        self.assertEqual(self.session.total_volume, Decimal('1500.00'))
+
+    def test_existing_slot_is_updated(self):
+        """Test a new client id for an existing set number overwrites that set"""
+        self.client.login(username='testuser', password='testpass123!@#')
+        WorkoutSet.objects.create(session=self.session, exercise=self.bench, set_number=1, weight=40, reps=10)
+
+        response = self._post([
+            {'client_id': 'retry', 'exercise_id': self.bench.id, 'set_number': 1, 'weight': 60, 'reps': 5}
+        ])
+
+        self.assertEqual(response.json()['results'][0]['status'], 'updated')
+        self.session.refresh_from_db()
+        self.assertEqual(self.session.total_volume, Decimal('300.00'))
+
+    def test_invalid_items_reported_individually(self):
+        """Test bad items fail on their own without blocking the rest"""
+        self.client.login(username='testuser', password='testpass123!@#')
+
+        response = self._post([
+            {'client_id': 'ok', 'exercise_id': self.bench.id, 'set_number': 1, 'weight': 50, 'reps': 10},
+            {'client_id': 'not-in-routine', 'exercise_id': self.squat.id, 'set_number': 1, 'weight': 50, 'reps': 10},
+            {'exercise_id': self.bench.id, 'set_number': 2, 'weight': 50, 'reps': 10},
+            {'client_id': 'bad', 'exercise_id': self.bench.id, 'set_number': 3, 'weight': 'heavy', 'reps': 10},
+        ])
+
+        statuses = [result['status'] for result in response.json()['results']]
+        self.assertEqual(statuses, ['created', 'error', 'error', 'error'])
+        self.assertEqual(self.session.workout_sets.count(), 1)
+
+    def test_batch_requires_session_owner(self):
+        """Test other users cannot write to the session"""
+        self.client.login(username='otheruser', password='testpass123!@#')
+
+        response = self._post(self._queued())
+
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(self.session.workout_sets.count(), 0)
+
+
+class TrainingAnalyticsTests(TestCase):
+    """Test the vectorised analytics engine and its per-user cache"""
+
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.user = User.objects.create_user(username='testuser', password='testpass123!@#')
+        self.routine = Routine.objects.create(name='Strength', user=self.user)
+        self.squat = Exercise.objects.create(title='Squat', slug='squat', muscle='quads')
+        self.bench = Exercise.objects.create(title='Bench Press', slug='bench-press', muscle='chest')
+        self.session = WorkoutSession.objects.create(routine=self.routine, user=self.user)
+        now = timezone.now()
+        WorkoutSet.objects.create(session=self.session, exercise=self.squat, set_number=1,
+                                  weight=Decimal('100'), reps=5, completed_at=now)
+        WorkoutSet.objects.create(session=self.session, exercise=self.squat, set_number=2,
+                                  weight=Decimal('80'), reps=10, completed_at=now)
+        WorkoutSet.objects.create(session=self.session, exercise=self.bench, set_number=1,
+                                  weight=Decimal('60'), reps=1, completed_at=now - timedelta(weeks=1))
+
+    def tearDown(self):
+        cache.clear()
+
+    def test_one_rep_max_estimates(self):
+        """Test best Epley/Brzycki estimates per exercise, strongest first"""
+        analytics = compute_analytics(*load_user_sets(self.user.id))
+
+        squat, bench = analytics['one_rep_max']
+        self.assertEqual(squat['name'], 'Squat')
+        self.assertEqual(squat['epley'], 116.7)  # 100 x 5 beats 80 x 10 (106.7)
+        self.assertEqual(squat['brzycki'], 112.5)
+        self.assertEqual(squat['sets'], 2)
+        self.assertEqual(bench['epley'], 60.0)  # A single is the weight itself
+        self.assertIsNone(bench['trend_per_week'])
+
+    def test_weekly_muscle_volume_and_trends(self):
+        """Test volume lands in the right muscle and week"""
+        analytics = compute_analytics(*load_user_sets(self.user.id))
+
+        muscles = analytics['muscle_volume']['muscles']
+        self.assertEqual(muscles['quads'][-1], 1300.0)
+        self.assertEqual(muscles['chest'][-2], 60.0)
+        self.assertEqual(sum(muscles['chest']), 60.0)
+        self.assertEqual(analytics['trends']['sets'][-2:], [1, 2])
+        self.assertEqual(analytics['trends']['volume'][-1], 1300.0)
+        self.assertEqual(analytics['trends']['volume_slope_per_week'], 1240.0)
+
+    @override_settings(TIME_ZONE='America/New_York')
+    def test_weeks_follow_local_time(self):
+        """Test a set late on a local Sunday counts towards that week even though it is Monday in UTC"""
+        other = User.objects.create_user(username='otheruser', password='testpass123!@#')
+        session = WorkoutSession.objects.create(routine=self.routine, user=other)
+        monday_utc = datetime(2026, 10, 12, 2, 0, tzinfo=dt_timezone.utc)  # Sunday 22:00 in New York
+        WorkoutSet.objects.create(session=session, exercise=self.squat, set_number=1,
+                                  weight=Decimal('100'), reps=5, completed_at=monday_utc)
+
+        analytics = compute_analytics(*load_user_sets(other.id), now=monday_utc + timedelta(days=2))
+
+        self.assertEqual(analytics['trends']['weeks'][-2:], ['2026-10-05', '2026-10-12'])
+        self.assertEqual(analytics['trends']['sets'][-2:], [1, 0])
+
+    def test_intensity_distribution(self):
+        """Test every set is counted once in the intensity and rep range histograms"""
+        intensity = compute_analytics(*load_user_sets(self.user.id))['intensity']
+
+        self.assertEqual(sum(intensity['relative_intensity'].values()), 3)
+        self.assertEqual(intensity['relative_intensity']['80-90%'], 1)  # 100 / 116.7
+        self.assertEqual(intensity['relative_intensity']['60-70%'], 1)  # 80 / 116.7
+        self.assertEqual(intensity['rep_ranges'], {'1-3': 1, '4-6': 1, '7-12': 1, '13-20': 0, '21+': 0})
+
+    def test_no_sets(self):
+        """Test a user without sets gets empty sections"""
+        other = User.objects.create_user(username='otheruser', password='testpass123!@#')
+
+        analytics = compute_analytics(*load_user_sets(other.id))
+
+        self.assertEqual(analytics['set_count'], 0)
+        self.assertEqual(analytics['one_rep_max'], [])
+        self.assertEqual(analytics['muscle_volume']['muscles'], {})
+
+    def test_analytics_are_cached(self):
+        """Test repeat lookups are served from the cache without queries"""
+        self.client.login(username='testuser', password='testpass123!@#')
+        response = self.client.get(reverse('workouts:analytics_api'))
+        self.assertEqual(response.json()['set_count'], 3)
+
+        with self.assertNumQueries(0):
+            analytics = get_user_analytics(self.user)
+
+        self.assertEqual(analytics['set_count'], 3)
+
+    def test_new_set_invalidates_cache(self):
+        """Test saving a set drops the owner's cached analytics"""
+        self.client.login(username='testuser', password='testpass123!@#')
+        url = reverse('workouts:analytics_api')
+        self.client.get(url)
+
+        WorkoutSet.objects.create(session=self.session, exercise=self.bench, set_number=2,
+                                  weight=Decimal('70'), reps=3)
+        response = self.client.get(url)
+
+        self.assertEqual(response.json()['set_count'], 4)
+
+    def test_deleted_set_invalidates_cache(self):
+        """Test deleting a set drops the owner's cached analytics"""
+        self.client.login(username='testuser', password='testpass123!@#')
+        url = reverse('workouts:analytics_api')
+        self.client.get(url)
+
+        self.session.workout_sets.filter(exercise=self.bench).delete()
+        response = self.client.get(url)
+
+        self.assertEqual(response.json()['set_count'], 2)
+
+    def test_section_endpoint(self):
+        """Test a single section can be requested, and unknown sections 404"""
+        self.client.login(username='testuser', password='testpass123!@#')
+
+        response = self.client.get(reverse('workouts:analytics_section_api', kwargs={'section': 'intensity'}))
+        data = response.json()
+        self.assertIn('intensity', data)
+        self.assertNotIn('one_rep_max', data)
+
+        response = self.client.get(reverse('workouts:analytics_section_api', kwargs={'section': 'bogus'}))
+        self.assertEqual(response.status_code, 404)
+
+    def test_requires_authentication(self):
+        """Test anonymous users get 401"""
+        response = self.client.get(reverse('workouts:analytics_api'))
+
+        self.assertEqual(response.status_code, 401)
+
+
 class WorkoutExerciseSetsAPITests(TestCase):
     """Test workout exercise sets API endpoint"""
 
@@ -616,3 +1685,293 @@ class WorkoutCompleteTests(TestCase):
         # Should redirect to login
         self.assertEqual(response.status_code, 302)
         self.assertIn('/accounts/login/', response.url)
+
+
+class TrainingLogExportTests(TestCase):
+    """Test the streaming training log export"""
+
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(
+            username='testuser',
+            password='testpass123!@#'
+        )
+        self.other = User.objects.create_user(username='other', password='testpass123!@#')
+        self.exercise = Exercise.objects.create(title='Squat', slug='squat', equipment='barbell')
+        self.routine = Routine.objects.create(name='Leg Day', user=self.user)
+        self.session = WorkoutSession.objects.create(routine=self.routine, user=self.user, notes='Felt strong')
+        for set_number in (1, 2):
+            WorkoutSet.objects.create(session=self.session, exercise=self.exercise, set_number=set_number,
+                                      weight=100, reps=5)
+        self.empty_session = WorkoutSession.objects.create(routine=self.routine, user=self.user)
+        other_routine = Routine.objects.create(name='Other Routine', user=self.other)
+        WorkoutSession.objects.create(routine=other_routine, user=self.other)
+
+    def _export(self, fmt, **kwargs):
+        from workouts.export import export_training_log
+        return list(export_training_log(WorkoutSession.objects.filter(user=self.user), fmt, **kwargs))
+
+    def test_ndjson_has_one_session_per_line_with_its_sets(self):
+        """Test NDJSON records carry the routine name and the sets joined with exercise names"""
+        import json
+        records = [json.loads(line) for line in self._export('ndjson', chunk_size=1)]
+
+        self.assertEqual([record['session_id'] for record in records], [self.session.id, self.empty_session.id])
+        first = records[0]
+        self.assertEqual((first['username'], first['routine'], first['notes']), ('testuser', 'Leg Day', 'Felt strong'))
+        self.assertEqual(first['total_volume'], '1000.00')
+        self.assertEqual([s['set_number'] for s in first['sets']], [1, 2])
+        self.assertEqual((first['sets'][0]['exercise'], first['sets'][0]['weight']), ('Squat', '100.00'))
+        self.assertEqual(records[1]['sets'], [])
+
+    def test_csv_has_one_row_per_set(self):
+        """Test CSV repeats the session columns per set and keeps sessions without sets"""
+        import csv
+        rows = list(csv.DictReader(self._export('csv')))
+
+        self.assertEqual(len(rows), 3)
+        self.assertEqual([row['set_number'] for row in rows], ['1', '2', ''])
+        self.assertEqual({row['routine'] for row in rows}, {'Leg Day'})
+        self.assertEqual(rows[0]['exercise_slug'], 'squat')
+
+    def test_export_reads_sessions_in_chunks(self):
+        """Test the export costs a query per chunk of sessions, not per session"""
+        for _ in range(4):
+            WorkoutSession.objects.create(routine=self.routine, user=self.user)
+
+        # One streamed session query, then a set and an archive query per chunk of three
+        with self.assertNumQueries(5):
+            self._export('ndjson', chunk_size=3)
+
+    def test_export_endpoint_streams_own_log(self):
+        """Test the export endpoint streams only the user's sessions"""
+        import json
+        self.client.login(username='testuser', password='testpass123!@#')
+        response = self.client.get(reverse('workouts:export_training_log_api'))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        records = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+        self.assertEqual({record['username'] for record in records}, {'testuser'})
+
+    def test_export_endpoint_requires_login_and_a_known_format(self):
+        """Test the export endpoint rejects anonymous users and unknown formats"""
+        url = reverse('workouts:export_training_log_api')
+        self.assertEqual(self.client.get(url).status_code, 401)
+        self.client.login(username='testuser', password='testpass123!@#')
+        self.assertEqual(self.client.get(url, {'format': 'xml'}).status_code, 400)
+
+    def test_command_exports_every_user(self):
+        """Test the command writes every user's sessions to a file"""
+        import json
+        import os
+        import tempfile
+        from io import StringIO
+        from django.core.management import call_command
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'log.ndjson')
+            call_command('export_training_log', output=path, stdout=StringIO())
+            with open(path, encoding='utf-8') as exported:
+                records = [json.loads(line) for line in exported]
+
+        self.assertEqual({record['username'] for record in records}, {'testuser', 'other'})
+
+
+class ArchivedSessionTests(TestCase):
+    """Test compacting old completed sessions into packed archive rows"""
+
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.user = User.objects.create_user(
+            username='testuser',
+            password='testpass123!@#'
+        )
+        self.routine = Routine.objects.create(name='Strength', user=self.user)
+        self.squat = Exercise.objects.create(title='Squat', slug='squat', muscle='quads')
+        self.bench = Exercise.objects.create(title='Bench Press', slug='bench-press', muscle='chest')
+        RoutineExercise.objects.create(routine=self.routine, exercise=self.squat, sets_count=2, order=0)
+        RoutineExercise.objects.create(routine=self.routine, exercise=self.bench, sets_count=1, order=1)
+
+        self.done_at = timezone.now() - timedelta(days=200)
+        self.old_session = self._completed_session(self.done_at)
+        self._add_set(self.old_session, self.squat, 1, '102.50', 5, notes='Belt on')
+        self._add_set(self.old_session, self.squat, 2, '100', 5, rest_time_actual=90)
+        self._add_set(self.old_session, self.bench, 1, '60', 8)
+        self.recent_session = self._completed_session(timezone.now() - timedelta(days=2))
+        self._add_set(self.recent_session, self.squat, 1, '90', 5)
+
+    def tearDown(self):
+        cache.clear()
+
+    def _completed_session(self, completed_at):
+        session = WorkoutSession.objects.create(routine=self.routine, user=self.user, started_at=completed_at)
+        WorkoutSession.objects.filter(pk=session.pk).update(status='completed', completed_at=completed_at)
+        session.refresh_from_db()
+        return session
+
+    def _add_set(self, session, exercise, set_number, weight, reps, **fields):
+        return WorkoutSet.objects.create(
+            session=session, exercise=exercise, set_number=set_number, weight=Decimal(weight), reps=reps,
+            completed_at=session.completed_at - timedelta(minutes=10 - set_number), **fields
+        )
+
+    def _archive(self):
+        from workouts.archive import archive_sessions
+        with self.captureOnCommitCallbacks(execute=True):
+            return archive_sessions()
+
+    def test_pack_round_trip(self):
+        """Test packed sets unpack to the same values, notes and timestamps"""
+        from workouts.archive import unpack_sets
+        original = list(self.old_session.workout_sets.order_by('completed_at'))
+        self._archive()
+
+        unpacked = unpack_sets(ArchivedSession.objects.get(session=self.old_session))
+
+        fields = ['exercise_id', 'set_number', 'weight', 'reps', 'volume', 'rest_time_actual', 'completed_at', 'notes']
+        self.assertEqual(
+            [[getattr(workout_set, field) for field in fields] for workout_set in unpacked],
+            [[getattr(workout_set, field) for field in fields] for workout_set in original],
+        )
+
+    def test_only_old_completed_sessions_are_archived(self):
+        """Test archiving moves old sessions' sets and leaves recent ones and the totals alone"""
+        sessions, sets = self._archive()
+
+        self.assertEqual((sessions, sets), (1, 3))
+        self.assertFalse(self.old_session.workout_sets.exists())
+        self.assertEqual(self.recent_session.workout_sets.count(), 1)
+        archive = ArchivedSession.objects.get(session=self.old_session)
+        self.assertEqual((archive.set_count, archive.exercise_count, archive.volume), (3, 2, Decimal('1492.50')))
+        self.old_session.refresh_from_db()
+        self.assertEqual(self.old_session.total_volume, Decimal('1492.50'))
+        self.assertEqual(self._archive(), (0, 0))
+
+    def test_live_sets_are_merged_into_an_existing_archive(self):
+        """Test a set saved into an archived session joins the archive on the next run"""
+        self._archive()
+        self._add_set(self.old_session, self.bench, 2, '65', 6)
+
+        self.assertEqual(self._archive(), (1, 1))
+
+        self.assertEqual(ArchivedSession.objects.get(session=self.old_session).set_count, 4)
+
+    def test_history_counts_archived_sets(self):
+        """Test the history page shows archived sessions' set counts and breakdown"""
+        self._archive()
+        self.client.login(username='testuser', password='testpass123!@#')
+
+        response = self.client.get(reverse('workouts:workout_history'))
+
+        session = next(session for session in response.context['sessions'] if session.id == self.old_session.id)
+        self.assertEqual((session.set_count, session.exercise_count), (3, 2))
+        self.assertEqual(session.exercise_breakdown, [{'name': 'Squat', 'sets': 2}, {'name': 'Bench Press', 'sets': 1}])
+
+    def test_analytics_and_rebuilds_read_archived_sets(self):
+        """Test analytics and the rebuild commands give the same results once sets are archived"""
+        from workouts.performance import rebuild_last_performance
+        from workouts.records import rebuild_personal_records
+        from workouts.rollups import rebuild_rollups
+
+        def snapshot():
+            rebuild_rollups([self.user.id])
+            rebuild_personal_records([self.user.id])
+            rebuild_last_performance([self.user.id])
+            return (
+                compute_analytics(*load_user_sets(self.user.id)),
+                list(DailyTrainingRollup.objects.order_by('day').values('day', 'sets', 'reps', 'volume', 'top_weight')),
+                list(WeeklyMuscleRollup.objects.order_by('week_start', 'muscle')
+                     .values('week_start', 'muscle', 'sets', 'volume', 'top_weight')),
+                list(PersonalRecord.objects.order_by('exercise_id')
+                     .values('best_weights', 'best_one_rep_max', 'best_session_volume', 'best_session')),
+                list(LastPerformance.objects.order_by('exercise_id').values('session', 'sets')),
+            )
+
+        before = snapshot()
+        self._archive()
+
+        self.assertEqual(snapshot(), before)
+
+    def test_archived_columns_are_filtered_before_concatenating(self):
+        """Test archived sets decode to columns holding only the requested exercises and time range"""
+        from workouts.archive import load_archived_columns
+        self._archive()
+        sessions = WorkoutSession.objects.filter(user=self.user)
+
+        columns = load_archived_columns(sessions, exercise_ids=[self.squat.id])
+        self.assertEqual(columns['weight'].tolist(), [10250, 10000])
+        self.assertEqual(columns['session_id'].tolist(), [self.old_session.id] * 2)
+        self.assertEqual(columns['user_id'].tolist(), [self.user.id] * 2)
+
+        columns = load_archived_columns(sessions, start=self.done_at - timedelta(minutes=8, seconds=30))
+        self.assertEqual(columns['weight'].tolist(), [10000])
+        self.assertEqual(len(load_archived_columns(sessions, exercise_ids=[])['exercise_id']), 0)
+
+    def test_record_rebuild_for_one_exercise_reads_archived_sets(self):
+        """Test rebuilding one exercise's record uses its archived sets and leaves other records alone"""
+        from workouts.records import rebuild_personal_records
+        self._archive()
+        PersonalRecord.objects.filter(exercise=self.squat).update(best_weights={'5': '1.00'})
+        PersonalRecord.objects.filter(exercise=self.bench).delete()
+
+        self.assertEqual(rebuild_personal_records([self.user.id], exercise_ids=[self.bench.id]), 1)
+
+        bench = PersonalRecord.objects.get(user=self.user, exercise=self.bench)
+        self.assertEqual(bench.best_weights, {'8': '60.00'})
+        self.assertEqual(bench.best_session_volume, Decimal('480.00'))
+        self.assertEqual(PersonalRecord.objects.get(user=self.user, exercise=self.squat).best_weights, {'5': '1.00'})
+
+    def test_rollup_rebuilds_skip_users_whose_archives_lack_the_exercises(self):
+        """Test reclassifying an exercise queues rebuilds only for users who trained it, archived sets included"""
+        from workouts.tasks import rebuild_rollups_for_exercises
+        other = User.objects.create_user(username='otheruser', password='testpass123!@#')
+        deadlift = Exercise.objects.create(title='Deadlift', slug='deadlift', muscle='back')
+        other_session = WorkoutSession.objects.create(routine=self.routine, user=other)
+        WorkoutSession.objects.filter(pk=other_session.pk).update(status='completed', completed_at=self.done_at)
+        other_session.refresh_from_db()
+        self._add_set(other_session, deadlift, 1, '140', 3)
+        self._archive()
+        self.assertEqual(ArchivedSession.objects.get(session=self.old_session).exercise_ids,
+                         sorted([self.squat.id, self.bench.id]))
+
+        rebuild_rollups_for_exercises(exercise_ids=[self.bench.id])
+
+        self.assertEqual(
+            list(Task.objects.filter(name='workouts.tasks.rebuild_user_chunk_rollups').values_list('kwargs', flat=True)),
+            [{'user_ids': [self.user.id]}],
+        )
+
+    def test_session_pages_show_archived_sets(self):
+        """Test an archived session's sets still appear on its pages"""
+        self._archive()
+        self.client.login(username='testuser', password='testpass123!@#')
+
+        data = self.client.get(reverse('workouts:workout_exercise_sets_api', kwargs={
+            'session_id': self.old_session.id, 'exercise_id': self.squat.id,
+        })).json()
+
+        self.assertEqual([(s['set_number'], s['weight']) for s in data['sets']], [(1, 102.5), (2, 100.0)])
+
+    def test_admin_shows_archived_sets(self):
+        """Test the session admin renders the archived sets read-only"""
+        self._archive()
+        User.objects.create_superuser(username='admin', password='testpass123!@#')
+        self.client.login(username='admin', password='testpass123!@#')
+
+        response = self.client.get(reverse('admin:workouts_workoutsession_change', args=[self.old_session.id]))
+
+        self.assertContains(response, 'Bench Press')
+        self.assertContains(response, '102.50')
+
+    def test_command_respects_the_age(self):
+        """Test the command archives only sessions older than --older-than-days"""
+        from io import StringIO
+        from django.core.management import call_command
+
+        out = StringIO()
+        call_command('archive_workout_sessions', older_than_days=1, stdout=out)
+
+        self.assertIn('Archived 4 sets from 2 sessions', out.getvalue())
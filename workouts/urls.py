@@ -10,4 +10,10 @@ urlpatterns = [
     path('session/<int:session_id>/exercise/<int:exercise_id>/sets/', views.workout_exercise_sets_api, name='workout_exercise_sets_api'),
     path('session/<int:session_id>/complete/', views.workout_complete, name='workout_complete'),
     path('set/save/', views.save_workout_set, name='save_workout_set'),
+    path('session/<int:session_id>/sets/batch/', views.save_workout_sets_batch, name='save_workout_sets_batch'),
+    path('session/<int:session_id>/events/', views.session_events, name='session_events'),
+    path('analytics/', views.analytics_api, name='analytics_api'),
+    path('analytics/<str:section>/', views.analytics_api, name='analytics_section_api'),
+    path('rollups/<str:period>/', views.training_rollups_api, name='training_rollups_api'),
+    path('export/', views.export_training_log_api, name='export_training_log_api'),
 ]
\ No newline at end of file
@@ -1,11 +1,31 @@
-from django.shortcuts import render, get_object_or_404, redirect
+from asgiref.sync import sync_to_async
+from django.shortcuts import render, get_object_or_404, aget_object_or_404, redirect
 from django.contrib import messages
 from django.contrib.auth.models import User
 from django.contrib.auth.decorators import login_required
-from django.http import JsonResponse
+from django.http import Http404, JsonResponse, StreamingHttpResponse
 from django.views.decorators.http import require_POST
+from django.db import transaction
+from django.db.models import Q, Count, Sum, Min, OuterRef, Subquery, IntegerField
+from django.db.models.functions import Coalesce, TruncMonth
+from django.utils.encoding import force_str
+from django.utils.http import urlsafe_base64_encode, urlsafe_base64_decode
 from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from datetime import datetime, timedelta
+from decimal import Decimal, InvalidOperation
+import asyncio
+import json
+from .archive import load_archived_sets
+from .analytics import SECTIONS as ANALYTICS_SECTIONS, get_user_analytics, invalidate_user_analytics
+from .export import export_training_log, FORMATS as EXPORT_FORMATS
+from .events import (format_sse, get_broker, publish_session_event, serialize_completion, serialize_set,
+                     session_channel, session_event)
 from .models import WorkoutSession, WorkoutSet
+from .records import holds_record, update_personal_records
+from .rollups import apply_set_changes, set_contribution
+from .state import apply_saved_sets, completed_counts, get_session_state, routine_exercise_for
+from .tasks import process_completed_session, rebuild_user_records
 from routines.models import RoutineExercise
 from exercises.models import Exercise
 
@@ -14,6 +34,22 @@ WORKOUT_HISTORY_URL = 'workouts:workout_history'
 WORKOUT_SESSION_URL = 'workouts:workout_session'
 LOGIN_URL = 'accounts:login'
 
+# Workout history page size
+HISTORY_PAGE_SIZE = 20
+
+ROLLUP_PERIODS = ('daily', 'weekly')
+ROLLUP_DEFAULT_WEEKS = 52
+ROLLUP_MAX_WEEKS = 260
+
+# Offline set sync limits
+MAX_BATCH_SETS = 200
+MAX_SET_WEIGHT = Decimal('9999.99')  # WorkoutSet.weight is max_digits=6, decimal_places=2
+
+# Live session events (Server-Sent Events)
+SSE_HEARTBEAT_SECONDS = 15  # Keeps proxies from closing an idle stream
+SSE_RETRY_MILLISECONDS = 3000
+SSE_STATUS_FIELDS = ['status', 'completed_at', 'total_volume']  # Re-read to end streams of completed sessions
+
 
 def _verify_session_access(request, session):
     """
@@ -22,18 +58,173 @@ def _verify_session_access(request, session):
     Returns None if access is granted, otherwise returns a redirect response.
     """
     if request.user.is_authenticated:
-        if session.user != request.user:
+        if session.user_id != request.user.id:
             messages.error(request, 'You do not have permission to view this workout session.')
             return redirect(WORKOUT_HISTORY_URL)
     else:
         # Allow demo user access
         default_user = User.objects.filter(username='default_user').first()
-        if not default_user or session.user != default_user:
+        if not default_user or session.user_id != default_user.id:
             messages.error(request, 'Please log in to view workout sessions.')
             return redirect(LOGIN_URL)
     return None
 
 
+def _session_access_error(request, session):
+    """
+    JSON counterpart of _verify_session_access for API endpoints.
+
+    Returns None if access is granted, otherwise an error JsonResponse.
+    """
+    if request.user.is_authenticated:
+        if session.user_id != request.user.id:
+            return JsonResponse({'success': False, 'error': 'Permission denied'}, status=403)
+    else:
+        # Allow demo user access
+        default_user = User.objects.filter(username='default_user').first()
+        if not default_user or session.user_id != default_user.id:
+            return JsonResponse({'success': False, 'error': 'Authentication required'}, status=401)
+    return None
+
+
+def _publish_exercise_advanced(state, created_counts):
+    """
+    Publish exercise_advanced for exercises whose target set count was just reached.
+
+    state is the session state read before the write and created_counts maps
+    exercise id -> sets just created for it. The event names the exercise now
+    current (the first still short of its sets), or null when every exercise
+    is done.
+    """
+    targets = [(re.exercise_id, re.sets_count) for re in state['routine_exercises']]
+    counts = completed_counts(state)
+    for exercise_id, created in created_counts.items():
+        counts[exercise_id] = counts.get(exercise_id, 0) + created
+    current_exercise_id = next(
+        (exercise_id for exercise_id, sets_count in targets if counts.get(exercise_id, 0) < sets_count), None
+    )
+    for exercise_id, sets_count in targets:
+        count = counts.get(exercise_id, 0)
+        if count >= sets_count > count - created_counts.get(exercise_id, 0):
+            publish_session_event(state['session'].id, 'exercise_advanced', {
+                'completed_exercise_id': exercise_id,
+                'current_exercise_id': current_exercise_id,
+            })
+
+
+def _encode_history_cursor(session):
+    """Encode the (started_at, id) keyset position of a session as an opaque cursor"""
+    position = f"{session.started_at.isoformat()}|{session.id}"
+    return urlsafe_base64_encode(position.encode())
+
+
+def _decode_history_cursor(cursor):
+    """Decode a history cursor, returning (started_at, id) or None if it is missing or invalid"""
+    if not cursor:
+        return None
+    try:
+        started_at, session_id = force_str(urlsafe_base64_decode(cursor)).split('|')
+        return datetime.fromisoformat(started_at), int(session_id)
+    except (ValueError, TypeError, UnicodeDecodeError):
+        return None
+
+
+def _history_page(user, cursor):
+    """
+    Return one page of a user's sessions, newest first, and the cursor for the next page.
+
+    Set and exercise counts are correlated subqueries, so they are only
+    computed for the rows on the page, and each session's per-exercise
+    breakdown comes from one grouped query for the whole page. Archived sets
+    are counted from their archive row and unpacked only for the page.
+    """
+    session_sets = WorkoutSet.objects.filter(session=OuterRef('pk')).order_by().values('session')
+    set_count = session_sets.annotate(count=Count('id')).values('count')
+    exercise_count = session_sets.annotate(count=Count('exercise', distinct=True)).values('count')
+
+    sessions = (
+        WorkoutSession.objects.filter(user=user)
+        .select_related('routine')
+        .annotate(
+            set_count=Coalesce(Subquery(set_count, output_field=IntegerField()), 0)
+            + Coalesce('archive__set_count', 0),
+            exercise_count=Coalesce('archive__exercise_count', Subquery(exercise_count, output_field=IntegerField()), 0),
+        )
+        .order_by('-started_at', '-id')
+    )
+    position = _decode_history_cursor(cursor)
+    if position:
+        started_at, session_id = position
+        sessions = sessions.filter(Q(started_at__lt=started_at) | Q(started_at=started_at, id__lt=session_id))
+
+    page = list(sessions[:HISTORY_PAGE_SIZE + 1])
+    next_cursor = _encode_history_cursor(page[HISTORY_PAGE_SIZE - 1]) if len(page) > HISTORY_PAGE_SIZE else None
+    page = page[:HISTORY_PAGE_SIZE]
+
+    page_ids = [session.id for session in page]
+    breakdown = list(
+        WorkoutSet.objects.filter(session__in=page_ids)
+        .values('session_id', 'exercise_id', 'exercise__title', 'exercise__name')
+        .annotate(sets=Count('id'), first_set_at=Min('completed_at'))
+    ) if page else []
+    archived = load_archived_sets(WorkoutSession.objects.filter(id__in=page_ids)) if page else []
+    if archived:
+        names = {
+            exercise_id: title or name for exercise_id, title, name in Exercise.objects.filter(
+                id__in={workout_set.exercise_id for workout_set in archived}
+            ).values_list('id', 'title', 'name')
+        }
+        rows = {(row['session_id'], row['exercise_id']): row for row in breakdown}
+        for workout_set in archived:
+            row = rows.setdefault((workout_set.session_id, workout_set.exercise_id), {
+                'session_id': workout_set.session_id, 'exercise__title': names.get(workout_set.exercise_id),
+                'exercise__name': '', 'sets': 0, 'first_set_at': workout_set.completed_at,
+            })
+            row['sets'] += 1
+            row['first_set_at'] = min(row['first_set_at'], workout_set.completed_at)
+        breakdown = list(rows.values())
+    exercises_by_session = {}
+    for row in sorted(breakdown, key=lambda row: (row['session_id'], row['first_set_at'])):
+        exercises_by_session.setdefault(row['session_id'], []).append({
+            'name': row['exercise__title'] or row['exercise__name'],
+            'sets': row['sets'],
+        })
+    for session in page:
+        session.exercise_breakdown = exercises_by_session.get(session.id, [])
+
+    return page, next_cursor
+
+
+def _month_start(moment):
+    """Start of the (local) calendar month containing moment"""
+    return timezone.localtime(moment).replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def _monthly_summary(user, sessions):
+    """
+    Per-month session count and volume for the months a page of sessions spans.
+
+    One aggregate over an indexed date range, so the cost depends on the
+    page, not on how long the user has been training.
+    """
+    if not sessions:
+        return []
+    first_month = _month_start(sessions[-1].started_at)
+    after_last_month = _month_start(_month_start(sessions[0].started_at) + timedelta(days=32))
+    months = (
+        WorkoutSession.objects.filter(user=user, started_at__gte=first_month, started_at__lt=after_last_month)
+        .annotate(month=TruncMonth('started_at'))
+        .values('month')
+        .annotate(
+            sessions=Count('id'),
+            completed=Count('id', filter=Q(status='completed')),
+            volume=Sum('total_volume'),
+        )
+        .order_by('-month')
+    )
+    return list(months)
+
+
 def workout_history(request):
     """
     Display workout history for the current user.
@@ -51,10 +242,14 @@ def workout_history(request):
             'email': 'demo@example.com'
         })
 
-    sessions = WorkoutSession.objects.filter(user=user).order_by('-started_at')
+    cursor = request.GET.get('cursor')
+    sessions, next_cursor = _history_page(user, cursor)
 
     context = {
         'sessions': sessions,
+        'next_cursor': next_cursor,
+        'monthly_summary': _monthly_summary(user, sessions),
+        'is_first_page': not cursor,
         'user': user,
     }
     return render(request, 'workouts/workout_history.html', context)
@@ -66,26 +261,32 @@ def workout_session(request, session_id):
 
     SECURITY: Verifies user owns the workout session or uses default demo user.
     """
-    session = get_object_or_404(WorkoutSession, id=session_id)
+    state = get_session_state(session_id)
+    if state is None:
+        raise Http404('Workout session not found')
+    session = state['session']
 
     # Verify user owns this session (or is demo user)
     access_check = _verify_session_access(request, session)
     if access_check:
         return access_check
 
-    routine_exercises = session.routine.routine_exercises.all().order_by('order')
+    routine_exercises = state['routine_exercises']
+    set_counts = completed_counts(state)
+    last_performances = state['last_performances']
     
     # Calculate progress for each exercise
     exercise_progress = []
     current_exercise = None
     
     for re in routine_exercises:
-        completed_sets_count = session.workout_sets.filter(exercise=re.exercise).count()
+        completed_sets_count = set_counts.get(re.exercise_id, 0)
         progress_data = {
             'routine_exercise': re,
             'completed_sets_count': completed_sets_count,
             'progress_percent': int((completed_sets_count / re.sets_count) * 100) if re.sets_count > 0 else 0,
             'is_complete': completed_sets_count >= re.sets_count,
+            'last_performance': last_performances.get(re.exercise_id),
         }
         exercise_progress.append(progress_data)
         
@@ -97,7 +298,7 @@ def workout_session(request, session_id):
             progress_data['is_current'] = False
     
     # If no current exercise, workout is complete
-    if not current_exercise and routine_exercises.exists():
+    if not current_exercise and routine_exercises:
         return redirect('workouts:workout_complete', session_id=session.id)  # Note: workout_complete is not duplicated
     
     context = {
@@ -110,19 +311,22 @@ def workout_session(request, session_id):
 
 
 def workout_exercise(request, session_id, exercise_id):
-    session = get_object_or_404(WorkoutSession, id=session_id)
-    exercise = get_object_or_404(Exercise, id=exercise_id)
-    
+    state = get_session_state(session_id)
+    if state is None:
+        raise Http404('Workout session not found')
+    session = state['session']
+
     # Get routine exercise info
-    try:
-        routine_exercise = session.routine.routine_exercises.get(exercise=exercise)
-    except RoutineExercise.DoesNotExist:
+    routine_exercise = routine_exercise_for(state, exercise_id)
+    if routine_exercise is None:
+        get_object_or_404(Exercise, id=exercise_id)
         messages.error(request, 'Exercise not found in this routine')
         return redirect(WORKOUT_SESSION_URL, session_id=session.id)
+    exercise = routine_exercise.exercise
     
     # Get completed sets
-    completed_sets = session.workout_sets.filter(exercise=exercise).order_by('set_number')
-    next_set_number = completed_sets.count() + 1
+    completed_sets = state['sets'].get(exercise_id, [])
+    next_set_number = len(completed_sets) + 1
     
     context = {
         'session': session,
@@ -130,7 +334,8 @@ def workout_exercise(request, session_id, exercise_id):
         'routine_exercise': routine_exercise,
         'completed_sets': completed_sets,
         'next_set_number': next_set_number,
-        'sets_remaining': routine_exercise.sets_count - completed_sets.count(),
+        'sets_remaining': routine_exercise.sets_count - len(completed_sets),
+        'last_performance': state['last_performances'].get(exercise_id),
     }
     return render(request, 'workouts/workout_exercise.html', context)
 
@@ -140,6 +345,9 @@ def save_workout_set(request):
     """
     Save a workout set for a session.
 
+    An optional client_id lets the saving page recognise its own set in the
+    live session events.
+
     SECURITY: Verifies user owns the workout session before saving data.
     """
     try:
@@ -149,22 +357,22 @@ def save_workout_set(request):
         weight = float(request.POST.get('weight'))
         reps = int(request.POST.get('reps'))
 
-        session = get_object_or_404(WorkoutSession, id=session_id)
+        state = get_session_state(int(session_id))
+        if state is None:
+            raise Http404('Workout session not found')
+        session = state['session']
 
         # Verify user owns this session
-        if request.user.is_authenticated:
-            if session.user != request.user:
-                return JsonResponse({'success': False, 'error': 'Permission denied'}, status=403)
-        else:
-            # Allow demo user access
-            default_user = User.objects.filter(username='default_user').first()
-            if not default_user or session.user != default_user:
-                return JsonResponse({'success': False, 'error': 'Authentication required'}, status=401)
+        access_error = _session_access_error(request, session)
+        if access_error:
+            return access_error
 
-        exercise = get_object_or_404(Exercise, id=exercise_id)
-        
         # Get routine exercise for rest time
-        routine_exercise = session.routine.routine_exercises.get(exercise=exercise)
+        routine_exercise = routine_exercise_for(state, int(exercise_id))
+        if routine_exercise is None:
+            get_object_or_404(Exercise, id=exercise_id)
+            raise RoutineExercise.DoesNotExist('Exercise not found in this routine')
+        exercise = routine_exercise.exercise
         
         # Create workout set
         workout_set = WorkoutSet.objects.create(
@@ -172,13 +380,21 @@ def save_workout_set(request):
             exercise=exercise,
             set_number=set_number,
             weight=weight,
-            reps=reps
+            reps=reps,
+            client_id=(request.POST.get('client_id') or '')[:64],
         )
+
+        # Let the session's other open devices know
+        publish_session_event(session.id, 'set_saved', {'sets': [serialize_set(workout_set)]})
+        _publish_exercise_advanced(state, {exercise.id: 1})
         
         return JsonResponse({
             'success': True,
+            'set_id': workout_set.id,
             'volume': float(workout_set.volume),
             'rest_time': routine_exercise.rest_time_seconds,
+            'is_pr': bool(workout_set.personal_records),
+            'personal_records': workout_set.personal_records,
             'message': f'Set {set_number} saved successfully!'
         })
         
@@ -200,22 +416,20 @@ def workout_exercise_sets_api(request, session_id, exercise_id):
         session_id: ID of the workout session
         exercise_id: ID of the exercise
     """
-    session = get_object_or_404(WorkoutSession, id=session_id)
+    state = get_session_state(session_id)
+    if state is None:
+        raise Http404('Workout session not found')
 
     # Verify user owns this session
-    if request.user.is_authenticated:
-        if session.user != request.user:
-            return JsonResponse({'success': False, 'error': 'Permission denied'}, status=403)
-    else:
-        # Allow demo user access
-        default_user = User.objects.filter(username='default_user').first()
-        if not default_user or session.user != default_user:
-            return JsonResponse({'success': False, 'error': 'Authentication required'}, status=401)
+    access_error = _session_access_error(request, state['session'])
+    if access_error:
+        return access_error
 
-    exercise = get_object_or_404(Exercise, id=exercise_id)
+    if routine_exercise_for(state, exercise_id) is None:
+        get_object_or_404(Exercise, id=exercise_id)
     
     # Get completed sets
-    completed_sets = session.workout_sets.filter(exercise=exercise).order_by('set_number')
+    completed_sets = state['sets'].get(exercise_id, [])
     
     sets_data = []
     for workout_set in completed_sets:
@@ -227,10 +441,13 @@ def workout_exercise_sets_api(request, session_id, exercise_id):
             'completed_at': workout_set.completed_at.strftime('%I:%M %p'),
         })
     
+    last_performance = state['last_performances'].get(exercise_id)
+
     return JsonResponse({
         'success': True,
         'sets': sets_data,
-        'total_sets': len(sets_data)
+        'total_sets': len(sets_data),
+        'last_performance': last_performance.as_dict() if last_performance else None,
     })
 
 
@@ -255,12 +472,16 @@ def workout_complete(request, session_id):
             return redirect(LOGIN_URL)
 
     if request.method == 'POST':
+        newly_completed = session.status != 'completed'
         session.status = 'completed'
         session.completed_at = timezone.now()
-        session.save()
-        
-        # Calculate final total volume
-        session.calculate_total_volume()
+        with transaction.atomic():
+            # Total volume is kept up to date as sets are logged, so leave it out of the write
+            session.save(update_fields=['status', 'completed_at'])
+            if newly_completed:
+                # The rollup count and "last time" snapshots follow in the background
+                process_completed_session.enqueue(session_id=session.id)
+                publish_session_event(session.id, 'session_completed', serialize_completion(session))
         
         messages.success(request, 'Workout completed! Great job! 💪')
         return redirect(WORKOUT_HISTORY_URL)
@@ -279,3 +500,330 @@ def workout_complete(request, session_id):
         'exercises_completed': exercises_completed,
     }
     return render(request, 'workouts/workout_complete.html', context)
+
+
+def _parse_batch_set(item):
+    """Validate one queued set from an offline client, raising ValueError on bad input"""
+    if not isinstance(item, dict):
+        raise ValueError('Each set must be an object')
+    client_id = str(item.get('client_id') or '').strip()
+    if not client_id or len(client_id) > 64:
+        raise ValueError('client_id is required (at most 64 characters)')
+    try:
+        parsed = {
+            'client_id': client_id,
+            'exercise_id': int(item['exercise_id']),
+            'set_number': int(item['set_number']),
+            'weight': Decimal(str(item['weight'])).quantize(Decimal('0.01')),
+            'reps': int(item['reps']),
+            'completed_at': None,
+        }
+        if item.get('completed_at'):
+            parsed['completed_at'] = parse_datetime(str(item['completed_at']))
+            if parsed['completed_at'] is None:
+                raise ValueError('Invalid completed_at')
+            if timezone.is_naive(parsed['completed_at']):
+                parsed['completed_at'] = timezone.make_aware(parsed['completed_at'])
+    except KeyError as e:
+        raise ValueError(f'Missing field {e}')
+    except (TypeError, InvalidOperation):
+        raise ValueError('Invalid set values')
+    if parsed['set_number'] < 1 or parsed['reps'] < 0 or not 0 <= parsed['weight'] <= MAX_SET_WEIGHT:
+        raise ValueError('Invalid set values')
+    return parsed
+
+
+def _apply_batch_sets(session, items):
+    """
+    Upsert parsed sets into a (locked) session and return per-item results.
+
+    A client_id the session has already seen is reported as a duplicate and
+    left alone, so resending a queue is safe. A set for an existing
+    (exercise, set number) slot overwrites that slot. Validation reads the
+    routine's exercises from the cached session state and queries only the
+    affected existing sets; writes
+    are one bulk insert, one bulk update and one session volume adjustment.
+    """
+    state = get_session_state(session.id)
+    valid = [item for item in items if 'error' not in item]
+    exercise_ids = {item['exercise_id'] for item in valid}
+    rest_times = {}
+    muscles = {}
+    for routine_exercise in state['routine_exercises']:
+        if routine_exercise.exercise_id in exercise_ids:
+            rest_times[routine_exercise.exercise_id] = routine_exercise.rest_time_seconds
+            muscles[routine_exercise.exercise_id] = routine_exercise.exercise.muscle
+    existing = session.workout_sets.filter(
+        Q(client_id__in=[item['client_id'] for item in valid])
+        | Q(exercise_id__in=exercise_ids, set_number__in={item['set_number'] for item in valid})
+    )
+    by_client = {}
+    by_slot = {}
+    for workout_set in existing:
+        by_slot[(workout_set.exercise_id, workout_set.set_number)] = workout_set
+        if workout_set.client_id:
+            by_client[workout_set.client_id] = workout_set
+
+    results = []
+    to_create = []
+    to_update = []
+    replaced = []  # Rollup contributions of existing sets before they are overwritten
+    overwritten = []  # (exercise_id, weight, reps) of existing sets before they are overwritten
+    volume_delta = Decimal('0')
+    for item in items:
+        if 'error' in item:
+            results.append({'client_id': item.get('client_id'), 'status': 'error', 'error': item['error']})
+            continue
+        if item['client_id'] in by_client:
+            results.append({'client_id': item['client_id'], 'status': 'duplicate', 'set': by_client[item['client_id']]})
+            continue
+        if item['exercise_id'] not in rest_times:
+            results.append({'client_id': item['client_id'], 'status': 'error', 'error': 'Exercise not in routine'})
+            continue
+
+        volume = WorkoutSet.compute_volume(item['weight'], item['reps'])
+        workout_set = by_slot.get((item['exercise_id'], item['set_number']))
+        if workout_set is None:
+            workout_set = WorkoutSet(
+                session=session,
+                exercise_id=item['exercise_id'],
+                set_number=item['set_number'],
+            )
+            to_create.append(workout_set)
+            by_slot[(item['exercise_id'], item['set_number'])] = workout_set
+            status = 'created'
+        else:
+            volume_delta -= workout_set.volume
+            if workout_set.pk is not None and workout_set not in to_update:
+                to_update.append(workout_set)
+                replaced.append(set_contribution(
+                    session.user_id, workout_set.completed_at, muscles[workout_set.exercise_id],
+                    workout_set.weight, workout_set.reps, workout_set.volume,
+                ))
+                overwritten.append((workout_set.exercise_id, workout_set.weight, workout_set.reps))
+            status = 'updated' if workout_set.pk is not None else 'created'
+
+        workout_set.weight = item['weight']
+        workout_set.reps = item['reps']
+        workout_set.volume = volume
+        workout_set.client_id = item['client_id']
+        workout_set.completed_at = item['completed_at'] or timezone.now()
+        volume_delta += volume
+        by_client[item['client_id']] = workout_set
+        results.append({
+            'client_id': item['client_id'],
+            'status': status,
+            'set': workout_set,
+            'rest_time': rest_times[item['exercise_id']],
+        })
+
+    if to_create:
+        WorkoutSet.objects.bulk_create(to_create)
+    if to_update:
+        WorkoutSet.objects.bulk_update(to_update, ['weight', 'reps', 'volume', 'client_id', 'completed_at'])
+    WorkoutSession.adjust_total_volume(session.id, volume_delta)
+    records = {}
+    if to_create or to_update:
+        # bulk_create/bulk_update bypass WorkoutSet.save() and its signals
+        saved = to_create + to_update
+        apply_set_changes(replaced, [
+            set_contribution(session.user_id, workout_set.completed_at, muscles[workout_set.exercise_id],
+                             workout_set.weight, workout_set.reps, workout_set.volume)
+            for workout_set in saved
+        ])
+        stale = {
+            exercise_id for exercise_id, weight, reps in overwritten
+            if holds_record(session.user_id, exercise_id, weight, reps, session.id)
+        }
+        records = dict(zip(map(id, saved), update_personal_records(session.user_id, saved)))
+        if stale:
+            rebuild_user_records.enqueue(unique=True, user_id=session.user_id, exercise_ids=sorted(stale))
+        invalidate_user_analytics(session.user_id)
+
+        transaction.on_commit(lambda: apply_saved_sets(session.id, saved))
+        publish_session_event(session.id, 'set_saved', {'sets': [serialize_set(workout_set) for workout_set in saved]})
+        created_counts = {}
+        for workout_set in to_create:
+            created_counts[workout_set.exercise_id] = created_counts.get(workout_set.exercise_id, 0) + 1
+        _publish_exercise_advanced(state, created_counts)
+
+    for result in results:
+        workout_set = result.pop('set', None)
+        if workout_set is not None:
+            result.update({
+                'set_id': workout_set.id,
+                'exercise_id': workout_set.exercise_id,
+                'set_number': workout_set.set_number,
+                'volume': float(workout_set.volume),
+            })
+            if result['status'] != 'duplicate':
+                result['personal_records'] = records.get(id(workout_set), [])
+    return results
+
+
+@require_POST
+def save_workout_sets_batch(request, session_id):
+    """
+    Save many queued sets for a session in one request (offline sync).
+
+    Expects JSON: {"sets": [{"client_id": "uuid", "exercise_id": 1, "set_number": 1,
+    "weight": 50, "reps": 10, "completed_at": "2024-01-01T10:00:00Z"}, ...]}.
+    Every set needs a client-generated client_id; resending the same queue is
+    safe. Returns one result per set, in order.
+
+    SECURITY: Verifies user owns the workout session before saving data.
+    """
+    try:
+        data = json.loads(request.body)
+        raw_sets = data.get('sets') if isinstance(data, dict) else None
+    except json.JSONDecodeError:
+        return JsonResponse({'success': False, 'error': 'Invalid JSON'}, status=400)
+    if not isinstance(raw_sets, list) or not raw_sets:
+        return JsonResponse({'success': False, 'error': 'Expected a non-empty "sets" list'}, status=400)
+    if len(raw_sets) > MAX_BATCH_SETS:
+        return JsonResponse({'success': False, 'error': f'At most {MAX_BATCH_SETS} sets per request'}, status=400)
+
+    items = []
+    for raw in raw_sets:
+        try:
+            items.append(_parse_batch_set(raw))
+        except ValueError as e:
+            client_id = raw.get('client_id') if isinstance(raw, dict) else None
+            items.append({'client_id': client_id, 'error': str(e)})
+
+    with transaction.atomic():
+        session = get_object_or_404(
+            WorkoutSession.objects.select_for_update().select_related('routine'), id=session_id
+        )
+        access_error = _session_access_error(request, session)
+        if access_error:
+            return access_error
+        results = _apply_batch_sets(session, items)
+
+    return JsonResponse({
+        'success': True,
+        'results': results,
+        'saved': sum(result['status'] in ('created', 'updated') for result in results),
+    })
+
+
+def analytics_api(request, section=None):
+    """
+    Training analytics for the current user: estimated 1RMs, weekly muscle
+    volume, intensity distribution and volume trends.
+
+    Returns every section, or only `section` when given. Computed in one pass
+    over the user's sets and cached until one of them changes.
+    """
+    if not request.user.is_authenticated:
+        return JsonResponse({'success': False, 'error': 'Authentication required'}, status=401)
+    if section is not None and section not in ANALYTICS_SECTIONS:
+        return JsonResponse({'success': False, 'error': f'Unknown section: {section}'}, status=404)
+
+    analytics = get_user_analytics(request.user)
+    if section is not None:
+        return JsonResponse({'success': True, 'set_count': analytics['set_count'], section: analytics[section]})
+    return JsonResponse({'success': True, **analytics})
+
+
+def training_rollups_api(request, period):
+    """
+    Pre-aggregated training totals for calendar heatmaps and progress charts.
+
+    `daily` returns one row per training day; `weekly` one row per ISO week and
+    muscle. Covers the last ?weeks=N weeks (default 52). Reads only rollup rows,
+    never the raw sets.
+    """
+    if not request.user.is_authenticated:
+        return JsonResponse({'success': False, 'error': 'Authentication required'}, status=401)
+    if period not in ROLLUP_PERIODS:
+        return JsonResponse({'success': False, 'error': f'Unknown period: {period}'}, status=404)
+    try:
+        weeks = min(max(int(request.GET.get('weeks', ROLLUP_DEFAULT_WEEKS)), 1), ROLLUP_MAX_WEEKS)
+    except ValueError:
+        return JsonResponse({'success': False, 'error': 'weeks must be an integer'}, status=400)
+
+    today = timezone.localdate()
+    since = today - timedelta(days=today.weekday(), weeks=weeks - 1)
+    if period == 'daily':
+        rows = request.user.daily_training_rollups.filter(day__gte=since).order_by('day').values(
+            'day', 'sessions', 'sets', 'reps', 'volume', 'top_weight'
+        )
+    else:
+        rows = request.user.weekly_muscle_rollups.filter(week_start__gte=since).order_by(
+            'week_start', 'muscle'
+        ).values('week_start', 'muscle', 'sets', 'reps', 'volume', 'top_weight')
+
+    return JsonResponse({
+        'success': True,
+        'since': since.isoformat(),
+        'rows': [
+            {**row, 'volume': float(row['volume']), 'top_weight': float(row['top_weight'])} for row in rows
+        ],
+    })
+
+
+def export_training_log_api(request):
+    """
+    Stream the current user's full training log as NDJSON (default) or CSV.
+
+    Use ?format=csv for CSV. Sessions and their sets are fetched in chunks, so
+    the response starts immediately and memory use does not grow with the
+    length of the history.
+    """
+    if not request.user.is_authenticated:
+        return JsonResponse({'success': False, 'error': 'Authentication required'}, status=401)
+
+    fmt = request.GET.get('format', 'ndjson')
+    if fmt not in EXPORT_FORMATS:
+        return JsonResponse({'success': False, 'error': f"Format must be one of: {', '.join(EXPORT_FORMATS)}"},
+                            status=400)
+
+    response = StreamingHttpResponse(
+        export_training_log(WorkoutSession.objects.filter(user=request.user), fmt),
+        content_type='text/csv' if fmt == 'csv' else 'application/x-ndjson'
+    )
+    response['Content-Disposition'] = f'attachment; filename="training-log.{fmt}"'
+    return response
+
+
+async def session_events(request, session_id):
+    """
+    Live events for a workout session, as a Server-Sent Events stream.
+
+    Pushes set_saved, exercise_advanced and session_completed events as any
+    device logs to the session, and ends after session_completed. Idle
+    streams get a comment line every SSE_HEARTBEAT_SECONDS, and the session's
+    status is re-read then too: a session that is (or became) completed without
+    its event reaching this stream gets a final session_completed. Needs an ASGI
+    server (see ironroutine/asgi.py) so an open stream holds no worker thread.
+
+    SECURITY: Verifies user owns the workout session before streaming.
+    """
+    session = await aget_object_or_404(WorkoutSession, id=session_id)
+    access_error = await sync_to_async(_session_access_error)(request, session)
+    if access_error:
+        return access_error
+
+    async def stream():
+        async with get_broker().subscribe(session_channel(session.id)) as subscription:
+            yield f'retry: {SSE_RETRY_MILLISECONDS}\n\n'
+            # Checked once subscribed, so a completion after this read still arrives as an event
+            await session.arefresh_from_db(fields=SSE_STATUS_FIELDS)
+            while session.status != 'completed':
+                try:
+                    event = await asyncio.wait_for(subscription.get(), SSE_HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    await session.arefresh_from_db(fields=SSE_STATUS_FIELDS)
+                    if session.status != 'completed':
+                        yield ': heartbeat\n\n'
+                    continue
+                yield format_sse(event)
+                if event['type'] == 'session_completed':
+                    return
+            yield format_sse(session_event(session.id, 'session_completed', serialize_completion(session)))
+
+    response = StreamingHttpResponse(stream(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # Stop nginx buffering the stream
+    return response